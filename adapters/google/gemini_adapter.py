@@ -1,47 +1,216 @@
-import logging
-import google.generativeai as genai
 import asyncio
-from typing import Optional
+import logging
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable
 from config import ProjectConfig
+from adapters.response_cache import LLMResponseCache
+from adapters.http_provider import HTTPProvider, ProviderError, parse_sse_data
+from adapters.ollama.ollama_adapter import OllamaProvider
+from adapters.openai.openai_adapter import OpenAIProvider
 
 logger = logging.getLogger("UniversalBrain")
 
+
+class GeminiProvider(HTTPProvider):
+    """Gemini przez REST (generateContent / streamGenerateContent) zamiast synchronicznego SDK w executorze."""
+
+    name = "google"
+
+    def __init__(self, api_key: str = None, base_url: str = None, **kwargs):
+        self.api_key = api_key or ProjectConfig.GOOGLE_API_KEY
+        super().__init__(base_url or ProjectConfig.GOOGLE_API_URL,
+                         headers={'x-goog-api-key': self.api_key} if self.api_key else None, **kwargs)
+
+    @staticmethod
+    def _payload(user_prompt: str, system_prompt: str) -> Dict[str, Any]:
+        # Gemini doesn't support system prompt in same way, prepending it
+        return {'contents': [{'role': 'user', 'parts': [{'text': f"{system_prompt}\n\n{user_prompt}"}]}]}
+
+    @staticmethod
+    def _text(data: Dict[str, Any]) -> str:
+        candidates = data.get('candidates') or []
+        if not candidates:
+            reason = data.get('promptFeedback', {}).get('blockReason', 'no candidates')
+            raise ProviderError(f"Gemini returned no text ({reason})")
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return "".join(part.get('text', '') for part in parts)
+
+    def _check_key(self):
+        if not self.api_key:
+            raise ProviderError("GOOGLE_API_KEY not set")
+
+    async def generate(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> str:
+        self._check_key()
+        data = await self.post_json(f"/models/{model}:generateContent", self._payload(user_prompt, system_prompt))
+        return self._text(data)
+
+    async def stream(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> AsyncIterator[str]:
+        self._check_key()
+        async for line in self.stream_lines(f"/models/{model}:streamGenerateContent",
+                                            self._payload(user_prompt, system_prompt), params={'alt': 'sse'}):
+            data = parse_sse_data(line)
+            if data:
+                text = self._text(data)
+                if text:
+                    yield text
+
+
+class _Flight:
+    """Jedno zapytanie do dostawcy i liczba czekających na nie wywołań."""
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+PROVIDERS = {
+    "google": GeminiProvider,
+    "ollama": OllamaProvider,
+    "openai": OpenAIProvider,
+}
+
+
 class UniversalBrain:
-    def __init__(self, provider: str = "google"):
+    GOOGLE_MODEL = 'gemini-pro'
+
+    def __init__(self, provider: str = "google", response_cache: Optional[LLMResponseCache] = None,
+                 backend: Optional[HTTPProvider] = None):
         self.provider = provider
         self.api_key = ProjectConfig.GOOGLE_API_KEY
-        
-        if self.provider == "google":
-            if not self.api_key:
-                logger.warning("GOOGLE_API_KEY not found. AI features might fail.")
-            else:
-                genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel('gemini-pro')
+        self.response_cache = response_cache
+        if self.response_cache is None and ProjectConfig.LLM_CACHE_ENABLED:
+            self.response_cache = LLMResponseCache()
+
+        if self.provider == "google" and not self.api_key and backend is None:
+            logger.warning("GOOGLE_API_KEY not found. AI features might fail.")
+        self.backend = backend
+        if self.backend is None and self.provider in PROVIDERS:
+            self.backend = PROVIDERS[self.provider]()
+        # Identyczne zapytania w locie (podwójny upload, watcher i CLI na tym samym pliku) -> jedno wywołanie
+        self._inflight: Dict[str, _Flight] = {}
+        self.flights = {'requests': 0, 'upstream': 0, 'coalesced': 0, 'cancelled': 0}
 
     async def generate_content_async(self, user_prompt: str, system_prompt: str, format_type: str = "json", model_name: str = None) -> str:
-        if self.provider == "google":
-            return await self._generate_google(user_prompt, system_prompt)
-        elif self.provider == "ollama":
-            return await self._generate_ollama(user_prompt, system_prompt, model_name or ProjectConfig.OLLAMA_RECEIPT_MODEL)
+        cached = self.cached_response(user_prompt, system_prompt, format_type, model_name)
+        if cached is not None:
+            return cached
+        return await self.generate_uncached(user_prompt, system_prompt, format_type, model_name)
+
+    def _key(self, user_prompt: str, system_prompt: str, format_type: str, model_name: str = None) -> str:
+        return LLMResponseCache.make_key(self.provider, self._resolve_model(model_name),
+                                         system_prompt, user_prompt, format_type)
+
+    def cached_response(self, user_prompt: str, system_prompt: str, format_type: str = "json",
+                        model_name: str = None) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self._key(user_prompt, system_prompt, format_type, model_name))
+
+    async def generate_uncached(self, user_prompt: str, system_prompt: str, format_type: str = "json",
+                                model_name: str = None) -> str:
+        """Zapytanie do dostawcy (z łączeniem identycznych zapytań w locie); wynik trafia do cache."""
+        model = self._resolve_model(model_name)
+        key = self._key(user_prompt, system_prompt, format_type, model_name)
+
+        async def fetch() -> str:
+            start = time.perf_counter()
+            response = await self._generate(user_prompt, system_prompt, format_type, model_name)
+            if self.response_cache is not None:
+                self.response_cache.put(key, response, time.perf_counter() - start, self.provider, model,
+                                        format_type)
+            return response
+
+        return await self._single_flight(key, fetch)
+
+    async def _single_flight(self, key: str, fetch: Callable[[], Awaitable[str]]) -> str:
+        """
+        Pierwsze wywołanie z danym kluczem uruchamia zapytanie jako osobne zadanie, kolejne czekają
+        na to samo zadanie. Anulowanie jednego czekającego go nie przerywa (shield);
+        zapytanie jest anulowane dopiero, gdy zrezygnują wszyscy.
+        """
+        loop = asyncio.get_running_loop()
+        self.flights['requests'] += 1
+        flight = self._inflight.get(key)
+        # Zadanie z innej pętli (np. asyncio.run w innym wątku) nie może być tu awaitowane
+        if flight is None or flight.task.done() or flight.task.get_loop() is not loop:
+            flight = _Flight(loop.create_task(fetch()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _, f=flight: self._forget_flight(key, f))
+            self.flights['upstream'] += 1
         else:
+            self.flights['coalesced'] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self.flights['cancelled'] += 1
+
+    def _forget_flight(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Wynik odebrali czekający; odczyt wyjątku anulowanego/porzuconego zadania wycisza ostrzeżenie pętli
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def flight_stats(self) -> Dict[str, Any]:
+        requests = self.flights['requests']
+        return {**self.flights, 'in_flight': len(self._inflight),
+                'dedupe_ratio': self.flights['coalesced'] / requests if requests else 0.0}
+
+    async def stream_content_async(self, user_prompt: str, system_prompt: str, format_type: str = "json",
+                                   model_name: str = None) -> AsyncIterator[str]:
+        """Odpowiedź kawałkami, gdy tylko dostawca je wyśle; pełna odpowiedź trafia potem do cache."""
+        key = None
+        if self.response_cache is not None:
+            key = self._key(user_prompt, system_prompt, format_type, model_name)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        start = time.perf_counter()
+        chunks = []
+        async for chunk in self._require_backend().stream(user_prompt, system_prompt, format_type,
+                                                          self._resolve_model(model_name)):
+            chunks.append(chunk)
+            yield chunk
+        # Do cache tylko kompletna odpowiedź (przerwany strumień nie dochodzi do tego miejsca)
+        if key is not None:
+            self.response_cache.put(key, "".join(chunks), time.perf_counter() - start,
+                                    self.provider, self._resolve_model(model_name), format_type)
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.response_cache.stats() if self.response_cache else None
+
+    def provider_stats(self) -> Optional[Dict[str, Any]]:
+        return dict(self.backend.stats) if self.backend else None
+
+    def _resolve_model(self, model_name: str = None) -> str:
+        if self.provider == "google":
+            return self.GOOGLE_MODEL
+        if self.provider == "openai":
+            return model_name or ProjectConfig.OPENAI_MODEL
+        return model_name or ProjectConfig.OLLAMA_RECEIPT_MODEL
+
+    def _require_backend(self) -> HTTPProvider:
+        if self.backend is None:
             raise ValueError(f"Unknown provider: {self.provider}")
+        return self.backend
 
-    async def _generate_google(self, user_prompt: str, system_prompt: str) -> str:
+    async def _generate(self, user_prompt: str, system_prompt: str, format_type: str, model_name: str = None) -> str:
+        backend = self._require_backend()
         try:
-            # Gemini doesn't support system prompt in same way, prepending it
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            
-            # Run in executor to not block async loop (genai lib is sync mostly)
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, self.model.generate_content, full_prompt)
-            
-            return response.text
-        except Exception as e:
-            logger.error(f"Google AI Error: {e}")
+            return await backend.generate(user_prompt, system_prompt, format_type, self._resolve_model(model_name))
+        except ProviderError as e:
+            logger.error(f"{self.provider} AI Error: {e}")
             raise
 
-    async def _generate_ollama(self, user_prompt: str, system_prompt: str, model: str) -> str:
-        # Placeholder for Ollama implementation if needed
-        # Could use 'ollama' python lib or http request
-        logger.warning("Ollama provider not fully implemented in adapter yet.")
-        return ""
+    async def aclose(self):
+        """Zamyka pulę połączeń dostawcy (wywoływać w pętli, która z niej korzystała)."""
+        if self.backend is not None:
+            await self.backend.aclose()
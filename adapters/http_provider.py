@@ -0,0 +1,238 @@
+import json
+import time
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, Optional
+import httpx
+from config import ProjectConfig
+from utils.loop_thread import submit_to_loop
+
+logger = logging.getLogger("HTTPProvider")
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """Błąd dostawcy LLM; `retryable` mówi, czy ponowienie ma sens (limit, 5xx, zerwane połączenie)."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class HTTPProvider(ABC):
+    """
+    Asynchroniczny klient jednego dostawcy LLM:
+    - jedna pula połączeń keep-alive (httpx.AsyncClient) na pętlę zdarzeń,
+    - semafor ograniczający równoległe zapytania do dostawcy,
+    - ponowienia z wykładniczym opóźnieniem i pełnym jitterem (Retry-After ma pierwszeństwo),
+    - odpowiedzi strumieniowe (NDJSON / SSE) przez stream_lines().
+
+    Podklasy budują zapytanie i wyciągają tekst w generate()/stream().
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str, max_concurrency: int = None, timeout: float = None,
+                 retries: int = None, backoff_base: float = None, backoff_max: float = None,
+                 headers: Optional[Dict[str, str]] = None):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency or ProjectConfig.LLM_MAX_CONCURRENCY
+        self.timeout = timeout or ProjectConfig.LLM_TIMEOUT
+        self.retries = ProjectConfig.LLM_RETRIES if retries is None else retries
+        self.backoff_base = ProjectConfig.LLM_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = ProjectConfig.LLM_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.headers = headers or {}
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'seconds': 0.0}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._closer: Optional[asyncio.Task] = None
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # Pula połączeń i semafor należą do pętli, w której powstały; nowa pętla
+        # (asyncio.run w CLI/testach) dostaje własne, a pula poprzedniej jest zamykana w swojej pętli
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._retire_client()
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0)),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._client = client
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+            # Pula żyje tyle, co pętla: asyncio.run i BackgroundLoop.shutdown anulują na koniec
+            # niedokończone zadania, więc finally zamyka połączenia, póki pętla jeszcze działa
+            self._closer = loop.create_task(self._close_with_loop(client))
+        return self._client
+
+    @staticmethod
+    async def _close_with_loop(client: httpx.AsyncClient):
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.aclose()
+
+    @staticmethod
+    async def _stop_closer(closer: asyncio.Task):
+        closer.cancel()
+        await asyncio.gather(closer, return_exceptions=True)
+
+    def _retire_client(self) -> Optional[Future]:
+        """
+        Zamyka bieżącą pulę w jej własnej pętli (gniazda należą do niej), tak jak BackgroundLoop.submit.
+        Pętla zatrzymana bez anulowania zadań nie wykona już zlecenia - wtedy tylko ostrzeżenie, bez czekania.
+        """
+        closer, loop = self._closer, self._loop
+        self._client = self._semaphore = self._loop = self._closer = None
+        if closer is None or closer.done():
+            return None
+        future = submit_to_loop(loop, self._stop_closer(closer))
+        if future is None:
+            logger.warning(f"{self.name}: event loop stopped before its connection pool was closed")
+        return future
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _error(response: httpx.Response) -> ProviderError:
+        retry_after = response.headers.get('Retry-After')
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        return ProviderError(
+            f"HTTP {response.status_code}: {response.text[:200]}",
+            status=response.status_code,
+            retryable=response.status_code in RETRYABLE_STATUS,
+            retry_after=retry_after,
+        )
+
+    async def _with_retries(self, attempt_fn):
+        attempt = 0
+        while True:
+            try:
+                return await attempt_fn()
+            except httpx.TransportError as e:
+                error = ProviderError(f"{type(e).__name__}: {e}", retryable=True)
+            except ProviderError as e:
+                error = e
+            if not error.retryable or attempt >= self.retries:
+                self.stats['failures'] += 1
+                raise error
+            delay = self.backoff(attempt, error.retry_after)
+            attempt += 1
+            self.stats['retries'] += 1
+            logger.warning(f"{self.name}: {error} - retry {attempt}/{self.retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def post_json(self, path: str, payload: Dict[str, Any], params: Optional[Dict[str, str]] = None) -> Any:
+        client = self._ensure_client()
+
+        async def attempt():
+            async with self._semaphore:
+                start = time.perf_counter()
+                self.stats['requests'] += 1
+                try:
+                    response = await client.post(path, json=payload, params=params)
+                finally:
+                    self.stats['seconds'] += time.perf_counter() - start
+            if response.status_code >= 400:
+                raise self._error(response)
+            try:
+                return response.json()
+            except ValueError as e:
+                # Np. strona HTML z proxy przy 200 - router i fallback łapią tylko ProviderError
+                raise ProviderError(f"Invalid JSON in HTTP {response.status_code} response: {response.text[:200]}",
+                                    status=response.status_code) from e
+
+        return await self._with_retries(attempt)
+
+    async def stream_lines(self, path: str, payload: Dict[str, Any],
+                           params: Optional[Dict[str, str]] = None) -> AsyncIterator[str]:
+        """
+        Niepuste linie odpowiedzi strumieniowej. Ponawiane jest tylko nawiązanie strumienia -
+        po pierwszej linii błąd przechodzi do wywołującego (część odpowiedzi już wyszła).
+        """
+        client = self._ensure_client()
+        semaphore = self._semaphore
+
+        async def open_stream():
+            # Slot semafora trzymamy do końca strumienia, ale nie na czas odczekiwania przed ponowieniem
+            await semaphore.acquire()
+            try:
+                self.stats['requests'] += 1
+                request = client.build_request("POST", path, json=payload, params=params)
+                response = await client.send(request, stream=True)
+                if response.status_code >= 400:
+                    await response.aread()
+                    await response.aclose()
+                    raise self._error(response)
+                return response
+            except BaseException:
+                semaphore.release()
+                raise
+
+        start = time.perf_counter()
+        response = await self._with_retries(open_stream)
+        try:
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield line
+        finally:
+            await response.aclose()
+            semaphore.release()
+            self.stats['seconds'] += time.perf_counter() - start
+
+    @abstractmethod
+    async def generate(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> str:
+        """Pełna odpowiedź modelu (tekst)."""
+        pass
+
+    @abstractmethod
+    def stream(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> AsyncIterator[str]:
+        """Odpowiedź kawałkami (async generator), w kolejności nadejścia."""
+        pass
+
+    async def aclose(self):
+        closer, loop = self._closer, self._loop
+        if closer is None:
+            return
+        if loop is asyncio.get_running_loop():
+            self._client = self._semaphore = self._loop = self._closer = None
+            await self._stop_closer(closer)
+            return
+        future = self._retire_client()
+        if future is None:
+            return
+        try:
+            # Pętla puli może się zatrzymać w trakcie - nie czekamy bez końca
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"{self.name}: closing connection pool in its event loop failed: {e!r}")
+
+
+def parse_sse_data(line: str) -> Optional[Dict[str, Any]]:
+    """Linia Server-Sent Events 'data: {...}' -> dict (inne pola SSE są pomijane)."""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if not data or data == "[DONE]":
+        return None
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise ProviderError(f"Invalid JSON in SSE event: {data[:200]}") from e
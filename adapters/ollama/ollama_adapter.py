@@ -0,0 +1,55 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+from config import ProjectConfig
+from adapters.http_provider import HTTPProvider, ProviderError
+
+logger = logging.getLogger("OllamaProvider")
+
+
+class OllamaProvider(HTTPProvider):
+    """Lokalny model przez Ollama /api/chat - paragony bez wysyłania OCR poza maszynę."""
+
+    name = "ollama"
+
+    def __init__(self, base_url: str = None, **kwargs):
+        kwargs.setdefault('max_concurrency', ProjectConfig.OLLAMA_MAX_CONCURRENCY)
+        super().__init__(base_url or ProjectConfig.OLLAMA_URL, **kwargs)
+
+    @staticmethod
+    def _payload(user_prompt: str, system_prompt: str, format_type: str, model: str, stream: bool) -> Dict[str, Any]:
+        payload = {
+            'model': model,
+            'messages': [
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_prompt},
+            ],
+            'stream': stream,
+            # Ekstrakcja danych, nie twórczość - deterministyczne odpowiedzi lepiej trafiają w cache
+            'options': {'temperature': 0},
+        }
+        if format_type == "json":
+            payload['format'] = "json"
+        return payload
+
+    async def generate(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> str:
+        data = await self.post_json("/api/chat", self._payload(user_prompt, system_prompt, format_type, model, False))
+        if 'error' in data:
+            raise ProviderError(f"Ollama: {data['error']}")
+        return data.get('message', {}).get('content', '')
+
+    async def stream(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> AsyncIterator[str]:
+        payload = self._payload(user_prompt, system_prompt, format_type, model, True)
+        # Odpowiedź strumieniowa to NDJSON: jeden obiekt z kawałkiem treści na linię, ostatni ma done=true
+        async for line in self.stream_lines("/api/chat", payload):
+            try:
+                chunk = json.loads(line)
+            except ValueError as e:
+                raise ProviderError(f"Ollama: invalid JSON line: {line[:200]}") from e
+            if 'error' in chunk:
+                raise ProviderError(f"Ollama: {chunk['error']}")
+            content = chunk.get('message', {}).get('content')
+            if content:
+                yield content
+            if chunk.get('done'):
+                break
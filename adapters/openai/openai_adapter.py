@@ -0,0 +1,56 @@
+import logging
+from typing import Any, AsyncIterator, Dict
+from config import ProjectConfig
+from adapters.http_provider import HTTPProvider, ProviderError, parse_sse_data
+
+logger = logging.getLogger("OpenAIProvider")
+
+
+class OpenAIProvider(HTTPProvider):
+    """OpenAI (lub zgodne API) przez /chat/completions."""
+
+    name = "openai"
+
+    def __init__(self, api_key: str = None, base_url: str = None, **kwargs):
+        self.api_key = api_key or ProjectConfig.OPENAI_API_KEY
+        super().__init__(base_url or ProjectConfig.OPENAI_API_URL,
+                         headers={'Authorization': f"Bearer {self.api_key}"} if self.api_key else None, **kwargs)
+
+    @staticmethod
+    def _payload(user_prompt: str, system_prompt: str, format_type: str, model: str, stream: bool) -> Dict[str, Any]:
+        payload = {
+            'model': model,
+            'messages': [
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_prompt},
+            ],
+            'temperature': 0,
+            'stream': stream,
+        }
+        if format_type == "json":
+            payload['response_format'] = {'type': 'json_object'}
+        return payload
+
+    def _check_key(self):
+        if not self.api_key:
+            raise ProviderError("OPENAI_API_KEY not set")
+
+    async def generate(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> str:
+        self._check_key()
+        data = await self.post_json("/chat/completions",
+                                    self._payload(user_prompt, system_prompt, format_type, model, False))
+        choices = data.get('choices') or []
+        if not choices:
+            raise ProviderError("OpenAI returned no choices")
+        return choices[0].get('message', {}).get('content') or ''
+
+    async def stream(self, user_prompt: str, system_prompt: str, format_type: str, model: str) -> AsyncIterator[str]:
+        self._check_key()
+        payload = self._payload(user_prompt, system_prompt, format_type, model, True)
+        async for line in self.stream_lines("/chat/completions", payload):
+            data = parse_sse_data(line)
+            if not data or not data.get('choices'):
+                continue
+            content = data['choices'][0].get('delta', {}).get('content')
+            if content:
+                yield content
@@ -0,0 +1,93 @@
+import re
+import json
+import hashlib
+import logging
+from typing import Optional, Dict, Any
+from config import ProjectConfig
+from utils.cache_store import SQLiteStore
+
+logger = logging.getLogger("LLMResponseCache")
+
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_FENCE_RE = re.compile(r'```json\s*|\s*```')
+
+
+def clean_json_response(text: str) -> str:
+    """Usuwa bloki <think> modeli rozumujących i ogrodzenia ```json wokół odpowiedzi."""
+    return _FENCE_RE.sub('', _THINK_RE.sub('', text)).strip()
+
+
+def is_valid_json_response(text: str) -> bool:
+    try:
+        json.loads(clean_json_response(text))
+        return True
+    except ValueError:
+        return False
+
+
+class LLMResponseCache:
+    """
+    Trwały cache odpowiedzi LLM adresowany treścią:
+    sha256(provider, model, system prompt, user prompt, format) -> odpowiedź.
+    Ten sam OCR przetworzony ponownie nie wywołuje już Gemini/Ollamy.
+    """
+
+    def __init__(self, path: str = None, ttl: float = None, max_entries: int = None):
+        self.path = path or str(ProjectConfig.LLM_CACHE_FILE)
+        self.store = SQLiteStore(
+            self.path,
+            max_entries=ProjectConfig.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries,
+            ttl=ProjectConfig.LLM_CACHE_TTL if ttl is None else ttl,
+            table='responses'
+        )
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_prompt: str, user_prompt: str, format_type: str) -> str:
+        digest = hashlib.sha256()
+        for part in (provider, model, system_prompt, user_prompt, format_type):
+            # Separator NUL: ("ab", "c") i ("a", "bc") dają różne klucze
+            digest.update((part or "").encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.store.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_seconds += entry.get('latency', 0.0)
+        return entry['text']
+
+    def put(self, key: str, text: str, latency: float, provider: str, model: str, format_type: str = None):
+        if not text:
+            return
+        if format_type == "json" and not is_valid_json_response(text):
+            # Ucięta albo nie-JSON-owa odpowiedź nie może wracać z cache przez 30 dni - następnym razem pytamy znowu
+            self.rejected += 1
+            logger.warning(f"Not caching malformed JSON response from {provider}/{model}")
+            return
+        self.store.put(key, {'text': text, 'latency': latency, 'provider': provider, 'model': model})
+        try:
+            # Odpowiedzi LLM są drogie - zapisujemy od razu, a nie przy zamknięciu procesu
+            self.store.flush()
+        except Exception as e:
+            logger.error(f"Failed to persist LLM response: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rejected': self.rejected,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'entries': len(self.store),
+        }
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,273 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from config import ProjectConfig
+from adapters.response_cache import LLMResponseCache
+from adapters.http_provider import ProviderError
+from adapters.google.gemini_adapter import UniversalBrain
+from utils.metrics import quantiles
+
+logger = logging.getLogger("ProviderRouter")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class NoProviderAvailable(ProviderError):
+    """Wszystkie obwody otwarte albo minął termin - potok zwraca wynik bez AI."""
+
+
+class ProviderHealth:
+    """
+    Okno ostatnich wywołań dostawcy (czasy sukcesów, wyniki) i wyłącznik obwodu:
+    closed -> open po serii błędów lub zbyt wysokim odsetku błędów w oknie,
+    open -> half_open po `cooldown` (jedno próbne zapytanie), half_open -> closed/open wg wyniku próby.
+    """
+
+    def __init__(self, name: str, window: int = None, min_samples: int = None, failures: int = None,
+                 error_rate: float = None, cooldown: float = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        window = window or ProjectConfig.LLM_ROUTER_WINDOW
+        self.min_samples = ProjectConfig.LLM_ROUTER_MIN_SAMPLES if min_samples is None else min_samples
+        self.failure_threshold = failures or ProjectConfig.LLM_BREAKER_FAILURES
+        self.error_rate_threshold = ProjectConfig.LLM_BREAKER_ERROR_RATE if error_rate is None else error_rate
+        self.cooldown = ProjectConfig.LLM_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.clock = clock
+        self.latencies_ns = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.counters = {'requests': 0, 'failures': 0, 'cancelled': 0, 'opened': 0}
+
+    def available(self) -> bool:
+        """Czy można wysłać zapytanie; w half_open przepuszcza tylko jedną próbę naraz."""
+        if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return self.state == CLOSED
+
+    def begin(self) -> bool:
+        """
+        Rezerwuje wywołanie tuż przed startem. W half_open zajmuje jedyny slot próby - kolejne zapytania
+        (również te, które dostały dostawcę w kolejce przed startem próby) dostają False i go pomijają.
+        """
+        if not self.available():
+            return False
+        self.counters['requests'] += 1
+        if self.state == HALF_OPEN:
+            self.probing = True
+        return True
+
+    def record_success(self, seconds: float):
+        self.latencies_ns.append(int(seconds * 1e9))
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.probing = False
+        if self.state != CLOSED:
+            logger.info(f"{self.name}: circuit closed")
+        self.state = CLOSED
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.counters['failures'] += 1
+        self.probing = False
+        # Odsetek błędów liczy się dopiero przy pełniejszym oknie - pojedynczy błąd to nie 100% awarii
+        enough = len(self.outcomes) >= max(self.min_samples, self.failure_threshold)
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold or (
+                enough and self.error_rate() >= self.error_rate_threshold):
+            self._open()
+
+    def record_cancelled(self):
+        # Przegrany hedging to nie błąd dostawcy; próba half-open wraca do puli
+        self.counters['cancelled'] += 1
+        self.probing = False
+
+    def _open(self):
+        if self.state != OPEN:
+            self.counters['opened'] += 1
+            logger.warning(f"{self.name}: circuit opened (error rate {self.error_rate():.0%})")
+        self.state = OPEN
+        self.opened_at = self.clock()
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def has_samples(self) -> bool:
+        return len(self.latencies_ns) >= self.min_samples
+
+    def latency(self) -> Dict[float, float]:
+        return quantiles(self.latencies_ns)
+
+    def expected_latency(self) -> float:
+        """Mediana skorygowana o błędy (nieudane wywołanie to stracony czas + ponowienie gdzie indziej)."""
+        error_rate = self.error_rate()
+        return self.latency()[0.5] / max(1.0 - error_rate, 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = self.latency()
+        return {
+            'state': self.state,
+            **self.counters,
+            'error_rate': round(self.error_rate(), 4),
+            'p50': latency[0.5],
+            'p95': latency[0.95],
+            'samples': len(self.latencies_ns),
+        }
+
+
+class ProviderRouter:
+    """
+    Zamiennik UniversalBrain nad kilkoma dostawcami (google, ollama, openai):
+    - kolejność wg oczekiwanego czasu (mediana / skuteczność), bez statystyk - wg listy z konfiguracji,
+    - dostawcy z otwartym obwodem są pomijani,
+    - hedging: gdy główny nie odpowie w czasie swojego p95, startuje drugi - wygrywa pierwsza odpowiedź,
+    - błąd dostawcy przechodzi od razu do następnego w kolejce,
+    - termin `deadline`: potem NoProviderAvailable i potok zostaje przy wyniku lokalnym.
+
+    Decyzje trafiają do słownika `route` (jak `timings` w potoku) i do router_stats().
+    """
+
+    def __init__(self, providers: List[str] = None, brains: Optional[Dict[str, Any]] = None,
+                 response_cache: Optional[LLMResponseCache] = None, deadline: float = None,
+                 hedge: bool = None, clock: Callable[[], float] = time.monotonic, **health_kwargs):
+        if brains is None:
+            if response_cache is None and ProjectConfig.LLM_CACHE_ENABLED:
+                response_cache = LLMResponseCache()
+            brains = {name: UniversalBrain(provider=name, response_cache=response_cache)
+                      for name in (providers or ProjectConfig.LLM_PROVIDERS)}
+        self.brains = brains
+        self.order = list(brains)
+        self.health = {name: ProviderHealth(name, clock=clock, **health_kwargs) for name in self.order}
+        self.deadline = deadline or ProjectConfig.LLM_ROUTER_DEADLINE
+        self.hedge = ProjectConfig.LLM_HEDGE_ENABLED if hedge is None else hedge
+        self.counters = {'requests': 0, 'cached': 0, 'hedged': 0, 'hedge_wins': 0, 'fallbacks': 0, 'degraded': 0}
+
+    def candidates(self) -> List[str]:
+        available = [name for name in self.order if self.health[name].available()]
+
+        def rank(name):
+            health = self.health[name]
+            # Bez statystyk dostawca idzie na początek w kolejności z listy - tak zbiera pierwsze próbki
+            return (health.expected_latency() if health.has_samples() else 0.0, self.order.index(name))
+
+        return sorted(available, key=rank)
+
+    def hedge_delay(self, name: str) -> float:
+        health = self.health[name]
+        if not health.has_samples():
+            return ProjectConfig.LLM_HEDGE_DELAY
+        return min(max(health.latency()[0.95], ProjectConfig.LLM_HEDGE_MIN_DELAY), ProjectConfig.LLM_HEDGE_MAX_DELAY)
+
+    async def generate_content_async(self, user_prompt: str, system_prompt: str, format_type: str = "json",
+                                     model_name: str = None, route: Optional[Dict[str, Any]] = None) -> str:
+        route = {} if route is None else route
+        self.counters['requests'] += 1
+        candidates = self.candidates()
+        route.update({'provider': None, 'attempted': [], 'hedged': False, 'cached': False, 'errors': {},
+                      'skipped': [name for name in self.order if name not in candidates]})
+
+        # Odpowiedź któregokolwiek dostawcy z cache jest lepsza niż nowe zapytanie
+        for name in candidates:
+            cached = self.brains[name].cached_response(user_prompt, system_prompt, format_type, model_name)
+            if cached is not None:
+                self.counters['cached'] += 1
+                route.update({'provider': name, 'cached': True})
+                return cached
+
+        if not candidates:
+            self.counters['degraded'] += 1
+            raise NoProviderAvailable("All LLM provider circuits are open")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        queue = list(candidates)
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            # Stan obwodu mógł się zmienić od wyliczenia kandydatów (np. inne zapytanie zajęło próbę half-open)
+            while queue:
+                name = queue.pop(0)
+                if not self.health[name].begin():
+                    route['skipped'].append(name)
+                    continue
+                route['attempted'].append(name)
+                task = loop.create_task(self._call(name, user_prompt, system_prompt, format_type, model_name))
+                pending[task] = name
+                return True
+            return False
+
+        if not launch():
+            self.counters['degraded'] += 1
+            raise NoProviderAvailable("All LLM provider circuits are open")
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                can_hedge = self.hedge and queue and not route['hedged'] and len(pending) == 1
+                timeout = min(remaining, self.hedge_delay(next(iter(pending.values())))) if can_hedge else remaining
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if can_hedge and deadline - loop.time() > 0 and launch():
+                        route['hedged'] = True
+                        self.counters['hedged'] += 1
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        route['provider'] = name
+                        if route['hedged'] and name != route['attempted'][0]:
+                            self.counters['hedge_wins'] += 1
+                        return task.result()
+                    last_error = task.exception()
+                    route['errors'][name] = str(last_error)[:200]
+                    if queue and not pending and launch():
+                        self.counters['fallbacks'] += 1
+        finally:
+            for task, name in pending.items():
+                if not task.done():
+                    task.cancel()
+                    self.health[name].record_cancelled()
+
+        self.counters['degraded'] += 1
+        if pending or not last_error:
+            raise NoProviderAvailable(f"No LLM answer within {self.deadline:.0f}s")
+        raise NoProviderAvailable(f"All LLM providers failed: {last_error}") from last_error
+
+    async def _call(self, name: str, user_prompt: str, system_prompt: str, format_type: str,
+                    model_name: Optional[str]) -> str:
+        health = self.health[name]
+        start = time.perf_counter()
+        try:
+            response = await self.brains[name].generate_uncached(user_prompt, system_prompt, format_type, model_name)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.perf_counter() - start)
+        return response
+
+    def router_stats(self) -> Dict[str, Any]:
+        return {**self.counters, 'providers': {name: self.health[name].snapshot() for name in self.order}}
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        caches = {id(b.response_cache): b for b in self.brains.values() if getattr(b, 'response_cache', None)}
+        return next(iter(caches.values())).cache_stats() if len(caches) == 1 else None
+
+    def flight_stats(self) -> Dict[str, Any]:
+        totals = {'requests': 0, 'upstream': 0, 'coalesced': 0, 'cancelled': 0}
+        for brain in self.brains.values():
+            for key in totals:
+                totals[key] += brain.flights[key]
+        return {**totals, 'dedupe_ratio': totals['coalesced'] / totals['requests'] if totals['requests'] else 0.0}
+
+    async def aclose(self):
+        for brain in self.brains.values():
+            await brain.aclose()
@@ -0,0 +1,64 @@
+"""
+Mikro-benchmark detect_shop: skompilowany regex (nagłówek najpierw) vs dawna pętla `alias in text`.
+
+    python -m benchmarks.bench_detect_shop --receipts 2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt_agents import SHOP_MAPPINGS, detect_shop
+from benchmarks.synthetic import make_taxonomy, make_receipts
+
+
+def detect_shop_legacy(text: str) -> str:
+    """Poprzednia implementacja - punkt odniesienia."""
+    text_upper = text.upper()
+    for canonical_name, aliases in SHOP_MAPPINGS.items():
+        for alias in aliases:
+            if alias in text_upper:
+                return canonical_name
+    return "Sklep"
+
+
+def measure(detector, receipts, repeat: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        detected = [detector(r["text"]) for r in receipts]
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for r, shop in zip(receipts, detected) if r["shop"] == shop)
+    return {
+        "us_per_receipt": round(elapsed / (len(receipts) * repeat) * 1e6, 2),
+        "accuracy": round(correct / len(receipts), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    receipts = make_receipts(make_taxonomy(500, args.seed), args.receipts, args.seed)
+    results = {
+        "receipts": args.receipts,
+        "legacy": measure(detect_shop_legacy, receipts, args.repeat),
+        "compiled": measure(detect_shop, receipts, args.repeat),
+    }
+    for name in ("legacy", "compiled"):
+        r = results[name]
+        print(f"{name:>9}: {r['us_per_receipt']:>8.2f} us/receipt | accuracy {r['accuracy']:.4f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
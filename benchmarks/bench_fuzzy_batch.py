@@ -0,0 +1,69 @@
+"""
+Przepustowość dopasowań rozmytych: ścieżka per-linia (ThreadPoolExecutor + extractOne)
+vs jedna macierz rapidfuzz.cdist dla wszystkich linii (pełny skan taksonomii).
+Macierz jest używana poniżej TAXONOMY_INDEX_MIN_PATTERNS - benchmark pokazuje próg opłacalności.
+
+    python -m benchmarks.bench_fuzzy_batch --sizes 50 200 500 --lines 30 1000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ProjectConfig
+from utils.taxonomy import TaxonomyGuard
+from core.pipelines.receipt_pipeline import AsyncReceiptPipeline
+from benchmarks.synthetic import write_taxonomy, make_queries
+
+
+def lines_per_second(pipeline: AsyncReceiptPipeline, lines, mode: str, repeat: int) -> float:
+    ProjectConfig.FUZZY_BATCH_MODE = mode
+    start = time.perf_counter()
+    for _ in range(repeat):
+        asyncio.run(pipeline._fuzzy_match_batch(lines))
+    return len(lines) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--lines", type=int, nargs="+", default=[30, 1000], help="Linii w jednej partii (paragon / wiele paragonów)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    original_mode = ProjectConfig.FUZZY_BATCH_MODE
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"taxonomy_{size}.json")
+            taxonomy = write_taxonomy(path, size, args.seed)
+            # index_min_patterns ponad rozmiar: obie ścieżki skanują całą taksonomię
+            taxonomy_guard = TaxonomyGuard(path, index_min_patterns=size + 1)
+            pipeline = AsyncReceiptPipeline(cache=object(), brain=object(), taxonomy=taxonomy_guard)
+            for count in args.lines:
+                lines = [line for line, _ in make_queries(taxonomy, count, args.seed)]
+                per_line = lines_per_second(pipeline, lines, "per_line", args.repeat)
+                matrix = lines_per_second(pipeline, lines, "cdist", args.repeat)
+                results.append({
+                    "taxonomy_size": size, "lines": count,
+                    "per_line_lines_s": round(per_line, 1), "cdist_lines_s": round(matrix, 1),
+                    "speedup": round(matrix / per_line, 2),
+                })
+                print(f"{size:>7} patterns, {count:>5} lines | per-line {per_line:>10.1f} lines/s | "
+                      f"cdist {matrix:>10.1f} lines/s | x{matrix / per_line:.2f}")
+    ProjectConfig.FUZZY_BATCH_MODE = original_mode
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
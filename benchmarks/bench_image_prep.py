@@ -0,0 +1,145 @@
+"""
+Przygotowanie obrazów przed OCR: bajty, czas przygotowania, szacowany czas uploadu
+i (z --vision) czas oraz zgodność tekstu Google Vision dla oryginału i obrazu po przygotowaniu.
+
+Bez --images generuje syntetyczne "zdjęcia" paragonów (tekst z benchmarks.synthetic na tle z szumem,
+rozmiar zdjęcia z telefonu). Zgodność OCR wymaga prawdziwego Vision (GOOGLE_APPLICATION_CREDENTIALS).
+
+    python -m benchmarks.bench_image_prep --receipts 5
+    python -m benchmarks.bench_image_prep --images inputs/paragony --vision --json prep.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont
+from rapidfuzz import fuzz
+from utils.image_prep import PrepParams, prepare_image
+from benchmarks.synthetic import make_taxonomy, make_receipts
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def _font(size: int):
+    for path in ("/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf", "DejaVuSansMono.ttf"):
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def receipt_photo(text: str, rng: random.Random, size=(3024, 4032)) -> bytes:
+    """Paragon (biały pasek z tekstem) lekko obrócony na szumiącym tle, JPEG q95 jak z aparatu."""
+    font = _font(44)
+    lines = text.splitlines()
+    paper = Image.new("L", (1300, 120 + 58 * len(lines)), 238)
+    draw = ImageDraw.Draw(paper)
+    for i, line in enumerate(lines):
+        draw.text((60, 60 + 58 * i), line, fill=30, font=font)
+    paper = paper.rotate(rng.uniform(-3, 3), expand=True, fillcolor=90)
+
+    photo = Image.effect_noise(size, 18).point(lambda p: p // 2 + 50)
+    photo.paste(paper, ((size[0] - paper.width) // 2, max(0, (size[1] - paper.height) // 2)))
+    buffer = io.BytesIO()
+    photo.convert("RGB").save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def load_samples(args):
+    if args.images:
+        names = sorted(f for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names:
+            with open(os.path.join(args.images, name), "rb") as f:
+                yield name, f.read()
+        return
+    rng = random.Random(args.seed)
+    for i, receipt in enumerate(make_receipts(make_taxonomy(200, args.seed), args.receipts, args.seed)):
+        yield f"synthetic_{i}.jpg", receipt_photo(receipt["text"], rng)
+
+
+def vision_ocr(content: bytes):
+    from google.cloud import vision
+    from utils.clients import vision_client
+    start = time.perf_counter()
+    response = vision_client().text_detection(image=vision.Image(content=content))
+    text = response.text_annotations[0].description if response.text_annotations else ""
+    return text, time.perf_counter() - start
+
+
+def measure(name: str, content: bytes, params: PrepParams, args) -> dict:
+    start = time.perf_counter()
+    prepared = prepare_image(content, params)
+    prep_ms = (time.perf_counter() - start) * 1000
+    result = {
+        "image": name,
+        "bytes_before": len(content),
+        "bytes_after": len(prepared),
+        "prep_ms": round(prep_ms, 1),
+        "upload_ms_before": round(len(content) * 8 / (args.uplink_mbps * 1e6) * 1000, 1),
+        "upload_ms_after": round(len(prepared) * 8 / (args.uplink_mbps * 1e6) * 1000, 1),
+    }
+    if args.vision:
+        text_before, ocr_before = vision_ocr(content)
+        text_after, ocr_after = vision_ocr(prepared)
+        result.update({
+            "ocr_ms_before": round(ocr_before * 1000, 1),
+            "ocr_ms_after": round((ocr_after * 1000) + prep_ms, 1),
+            "text_similarity": round(fuzz.ratio(text_before, text_after) / 100, 4),
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Katalog z prawdziwymi zdjęciami/skanami paragonów")
+    parser.add_argument("--receipts", type=int, default=5, help="Liczba syntetycznych zdjęć (bez --images)")
+    parser.add_argument("--max-side", type=int, default=None, help="Nadpisuje IMAGE_PREP_MAX_SIDE")
+    parser.add_argument("--uplink-mbps", type=float, default=5.0, help="Przepustowość uploadu do szacunku czasu")
+    parser.add_argument("--vision", action="store_true", help="OCR przez Google Vision: czas i zgodność tekstu")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    overrides = {'enabled': True}
+    if args.max_side:
+        overrides['max_side'] = args.max_side
+    params = PrepParams.from_config(**overrides)
+
+    results = [measure(name, content, params, args) for name, content in load_samples(args)]
+    if not results:
+        print("Brak obrazów.")
+        return
+    for r in results:
+        line = (f"{r['image']:>24}: {r['bytes_before'] / 1024:>8.0f} KB -> {r['bytes_after'] / 1024:>6.0f} KB"
+                f" | prep {r['prep_ms']:>6.1f} ms | upload {r['upload_ms_before']:>7.1f} -> {r['upload_ms_after']:>6.1f} ms")
+        if args.vision:
+            line += f" | OCR {r['ocr_ms_before']:>6.0f} -> {r['ocr_ms_after']:>6.0f} ms | text {r['text_similarity']:.3f}"
+        print(line)
+
+    summary = {
+        "params": params.key(),
+        "images": len(results),
+        "bytes_ratio": round(sum(r['bytes_after'] for r in results) / sum(r['bytes_before'] for r in results), 4),
+        "prep_ms_median": round(statistics.median(r['prep_ms'] for r in results), 1),
+    }
+    if args.vision:
+        summary["ocr_ms_median_before"] = round(statistics.median(r['ocr_ms_before'] for r in results), 1)
+        summary["ocr_ms_median_after"] = round(statistics.median(r['ocr_ms_after'] for r in results), 1)
+        summary["text_similarity_min"] = min(r['text_similarity'] for r in results)
+    print(json.dumps(summary, indent=2))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark całego AsyncReceiptPipeline na syntetycznym korpusie (seed):
+paragony/s, linie/s, p95 opóźnienia, szczytowy RSS i trafienia cache
+dla różnych rozmiarów taksonomii oraz zimnego/ciepłego cache.
+LLM zastępuje StubBrain z konfigurowalnym opóźnieniem.
+
+    python -m benchmarks.bench_pipeline --sizes 50 1000 100000 --receipts 200 --json bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt_cache import ReceiptCache
+from utils.taxonomy import TaxonomyGuard, StagingTaxonomy
+from utils.metrics import LatencyRecorder
+from core.pipelines.receipt_pipeline import AsyncReceiptPipeline
+from benchmarks.synthetic import write_taxonomy, make_receipts
+
+_PRICE_RE = re.compile(r'(\d+[.,]\d{2})')
+
+
+class StubBrain:
+    """Atrapa UniversalBrain: po `latency` s zwraca pozycje zbudowane z linii z promptu."""
+
+    def __init__(self, latency: float = 0.5, seed: int = 0):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def generate_content_async(self, user_prompt, system_prompt, format_type="json", model_name=None):
+        self.calls += 1
+        # ±20% rozrzutu, żeby kolejka AI nie była idealnie równa
+        await asyncio.sleep(self.latency * self.rng.uniform(0.8, 1.2))
+        section = user_prompt.split("extract only these):\n", 1)[-1] if "extract only these" in user_prompt \
+            else user_prompt.split("OCR:\n", 1)[-1]
+        items = []
+        for line in section.split("\n"):
+            prices = _PRICE_RE.findall(line)
+            if not prices:
+                continue
+            name = line[:line.find(prices[0])].strip()
+            if name:
+                total = float(prices[-1].replace(",", "."))
+                items.append({'nazwa': name.title(), 'kategoria': 'INNE', 'ilosc': 1.0,
+                              'cena_jedn': total, 'suma': total})
+        return json.dumps({'items': items})
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss: kB na Linuksie, bajty na macOS; szczyt całego procesu (rośnie monotonicznie)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * q + 0.999999) - 1)] if ordered else 0.0
+
+
+async def run_pass(pipeline: AsyncReceiptPipeline, receipts, concurrency: int) -> dict:
+    tiers_before = dict(pipeline.cache.stats)
+    calls_before = pipeline.brain.calls
+    speculation_before = dict(pipeline.speculation)
+    latencies, hit_rates, lines, errors, used_ai = [], [], 0, 0, 0
+
+    start = time.perf_counter()
+    async for _, result in pipeline.process_receipts_async([(r['text'], r['shop']) for r in receipts], concurrency):
+        if isinstance(result, Exception):
+            errors += 1
+            continue
+        stats = result['stats']
+        latencies.append(stats['processing_time'])
+        hit_rates.append(stats['cache_hit_rate'])
+        lines += stats['lines_local'] + stats['lines_ai'] if stats['used_ai'] else stats['lines_local']
+        used_ai += stats['used_ai']
+    elapsed = time.perf_counter() - start
+
+    tiers = {tier: pipeline.cache.stats[tier] - tiers_before.get(tier, 0) for tier in pipeline.cache.stats}
+    lookups = sum(tiers.values())
+    done = len(latencies)
+    return {
+        'receipts': done,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'receipts_s': round(done / elapsed, 2),
+        'lines_s': round(lines / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'cache_hit_rate': round((lookups - tiers['miss']) / lookups, 4) if lookups else 0.0,
+        'cache_tiers': tiers,
+        'mean_receipt_hit_rate': round(sum(hit_rates) / done, 4) if done else 0.0,
+        'ai_rate': round(used_ai / done, 4) if done else 0.0,
+        'llm_calls': pipeline.brain.calls - calls_before,
+        'speculation': {key: pipeline.speculation[key] - speculation_before[key] for key in speculation_before},
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_size(size: int, args) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "taxonomy.json")
+        taxonomy = write_taxonomy(path, size, args.seed)
+        shops = args.shops
+
+        def corpus(seed):
+            per_shop = [make_receipts(taxonomy, args.receipts // len(shops), seed + i, shop=shop,
+                                      items=tuple(args.items), noise=args.noise)
+                        for i, shop in enumerate(shops)]
+            mixed = [r for group in per_shop for r in group]
+            random.Random(seed).shuffle(mixed)
+            return mixed
+
+        metrics = LatencyRecorder(enabled=True)
+        pipeline = AsyncReceiptPipeline(
+            cache=ReceiptCache(os.path.join(tmp, "cache.json")),
+            brain=StubBrain(args.llm_latency, args.seed),
+            taxonomy=TaxonomyGuard(path),
+            staging=StagingTaxonomy(os.path.join(tmp, "staging.json")),
+            metrics=metrics,
+        )
+        # Zimny cache na pierwszym korpusie, ciepły na nowym korpusie z tego samego rozkładu
+        for state, seed in (("cold", args.seed), ("warm", args.seed + 1000)):
+            metrics.reset()
+            result = asyncio.run(run_pass(pipeline, corpus(seed), args.concurrency))
+            result.update({'taxonomy_size': size, 'cache': state})
+            result['stage_p95_ms'] = {
+                s['stage']: round(s['p95'] * 1000, 3) for s in metrics.snapshot() if s['stage'] != "total"
+            }
+            results.append(result)
+            print(f"{size:>7} patterns | {state:<4} | {result['receipts_s']:>8.2f} rec/s | "
+                  f"{result['lines_s']:>9.1f} lines/s | p95 {result['p95_ms']:>8.1f} ms | "
+                  f"hit {result['cache_hit_rate']:.2%} | AI {result['ai_rate']:.2%} | RSS {result['peak_rss_mb']} MB")
+        pipeline.cache.close()
+        pipeline.executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 1000, 10000, 100000])
+    parser.add_argument("--receipts", type=int, default=200, help="Paragonów na przebieg (cold i warm osobno)")
+    parser.add_argument("--items", type=int, nargs=2, default=[5, 40], metavar=("MIN", "MAX"))
+    parser.add_argument("--shops", nargs="+", default=["BIEDRONKA", "LIDL"])
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Opóźnienie StubBrain w sekundach")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    results = [r for size in args.sizes for r in run_size(size, args)]
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'python': platform.python_version(), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
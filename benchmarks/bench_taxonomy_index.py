@@ -0,0 +1,82 @@
+"""
+Trafność vs opóźnienie: indeks trigramów TaxonomyGuard vs pełny skan rapidfuzz.
+
+    python -m benchmarks.bench_taxonomy_index --sizes 50 1000 20000 100000 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from rapidfuzz import process, fuzz
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.taxonomy import TaxonomyGuard
+from benchmarks.synthetic import write_taxonomy, make_queries
+
+
+def run(size: int, queries: int, top_k: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "taxonomy.json")
+        taxonomy = write_taxonomy(path, size, seed)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        guard = TaxonomyGuard(path, index_min_patterns=0, top_k=top_k)
+        build_s = time.perf_counter() - t0
+        index_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    lines = make_queries(taxonomy, queries, seed)
+
+    t0 = time.perf_counter()
+    brute = [process.extractOne(line.upper(), guard.ocr_patterns, scorer=fuzz.partial_ratio) for line, _ in lines]
+    brute_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    indexed = [process.extractOne(line.upper(), guard.candidates(line), scorer=fuzz.partial_ratio) for line, _ in lines]
+    indexed_s = time.perf_counter() - t0
+
+    # Recall: indeks znalazł wynik tak dobry jak pełny skan
+    same = sum(1 for b, i in zip(brute, indexed) if i and b and i[1] >= b[1])
+    return {
+        "taxonomy_size": size,
+        "queries": queries,
+        "top_k": top_k,
+        "build_s": round(build_s, 4),
+        "load_peak_mb": round(index_bytes / 1e6, 2),
+        "brute_ms_per_line": round(brute_s / queries * 1000, 3),
+        "indexed_ms_per_line": round(indexed_s / queries * 1000, 3),
+        "speedup": round(brute_s / indexed_s, 1) if indexed_s else None,
+        "recall": round(same / queries, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 1000, 20000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = run(size, args.queries, args.top_k, args.seed)
+        results.append(result)
+        print(f"{size:>7} patterns | brute {result['brute_ms_per_line']:>8.3f} ms/line | "
+              f"index {result['indexed_ms_per_line']:>7.3f} ms/line | x{result['speedup']} | "
+              f"recall {result['recall']:.3f} | build {result['build_s']}s, {result['load_peak_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Deterministyczny (seed) generator danych testowych dla benchmarków:
+taksonomia produktów o zadanym rozmiarze i linie paragonów z szumem OCR.
+"""
+import re
+import json
+import random
+from typing import List, Dict
+
+BASES = [
+    "MLEKO", "MASLO", "SER", "JOGURT", "KEFIR", "SMIETANA", "TWAROG", "CHLEB", "BULKA", "BAGIETKA",
+    "WODA", "SOK", "NEKTAR", "NAPOJ", "PIWO", "WINO", "KAWA", "HERBATA", "CUKIER", "MAKA",
+    "MAKARON", "RYZ", "KASZA", "PLATKI", "MUSLI", "CZEKOLADA", "BATON", "CIASTKA", "WAFLE", "CHIPSY",
+    "SZYNKA", "KIELBASA", "PAROWKI", "BOCZEK", "FILET", "UDKO", "SCHAB", "KARKOWKA", "MIELONE", "PASZTET",
+    "JABLKA", "BANANY", "POMIDORY", "OGORKI", "ZIEMNIAKI", "CEBULA", "MARCHEW", "PAPRYKA", "CYTRYNY", "POMARANCZE",
+    "PROSZEK", "PLYN", "MYDLO", "SZAMPON", "PASTA", "PAPIER", "RECZNIKI", "WORKI", "GABKI", "KAPSULKI",
+]
+BRANDS = [
+    "LACIATE", "MLEKOVITA", "PIATNICA", "ZOTT", "DANONE", "BAKOMA", "HOCHLAND", "SIERPC", "MLEKPOL", "GOSTYN",
+    "TYMBARK", "HORTEX", "KUBUS", "CISOWIANKA", "ZYWIEC", "NALECZOWIANKA", "TYSKIE", "LECH", "JACOBS", "TCHIBO",
+    "LIPTON", "SAGA", "DIAMANT", "LUBELLA", "MELVIT", "WEDEL", "MILKA", "GOPLANA", "LAJKONIK", "LAYS",
+    "SOKOLOW", "KRAKUS", "MORLINY", "DROSED", "INDYKPOL", "PROFI", "VIZIR", "LUDWIK", "PALMOLIVE", "FOXY",
+]
+VARIANTS = [
+    "UHT", "SWIEZE", "NAT", "TRUSK", "WANIL", "CZEKOL", "JASNE", "CIEMNE", "GAZ", "NIEGAZ",
+    "PELNOZIARN", "ZYTNI", "PSZENNY", "EXTRA", "LIGHT", "BIO", "ZERO", "CLASSIC", "PREMIUM", "MINI",
+    "WEDZONY", "GOTOWANY", "PIECZONY", "KROJONY", "PLASTRY", "KOSTKA", "TARTY", "MIX", "DUZE", "MALE",
+]
+SIZES = ["1L", "0.5L", "1.5L", "500G", "250G", "200G", "1KG", "100G", "330ML", "6SZT"]
+CATEGORIES = ["NABIAŁ", "SPOŻYWCZE", "NAPOJE", "ALKOHOL", "MIĘSO", "OWOCE_WARZYWA", "CHEMIA", "SŁODYCZE"]
+
+# Typowe pomyłki OCR na paragonach termicznych
+OCR_CONFUSIONS = {"O": "0", "0": "O", "I": "1", "L": "1", "S": "5", "B": "8", "Z": "2", "E": "F"}
+
+
+def _abbreviate(word: str, rng: random.Random) -> str:
+    if len(word) > 5 and rng.random() < 0.4:
+        return word[:rng.randint(4, len(word) - 1)]
+    return word
+
+
+def make_taxonomy(size: int, seed: int = 0) -> Dict[str, List[Dict]]:
+    """Taksonomia w formacie config/product_taxonomy.json z `size` unikalnymi wzorcami."""
+    rng = random.Random(seed)
+    seen = set()
+    mappings = []
+    while len(mappings) < size:
+        base, brand = rng.choice(BASES), rng.choice(BRANDS)
+        parts = [base, _abbreviate(brand, rng)]
+        if rng.random() < 0.7:
+            parts.append(rng.choice(VARIANTS))
+        if rng.random() < 0.6:
+            parts.append(rng.choice(SIZES))
+        ocr = " ".join(parts)
+        if ocr in seen:
+            continue
+        seen.add(ocr)
+        mappings.append({
+            "ocr": ocr,
+            "name": " ".join(p.capitalize() for p in (base, brand) + tuple(parts[2:])),
+            "cat": rng.choice(CATEGORIES),
+            "unit": "kg" if base in ("JABLKA", "BANANY", "POMIDORY", "ZIEMNIAKI", "CEBULA") else "szt",
+        })
+    return {"mappings": mappings}
+
+
+def write_taxonomy(path: str, size: int, seed: int = 0) -> Dict[str, List[Dict]]:
+    taxonomy = make_taxonomy(size, seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(taxonomy, f, ensure_ascii=False)
+    return taxonomy
+
+
+def ocr_noise(text: str, rng: random.Random, rate: float = 0.05) -> str:
+    """Losowe pomyłki znaków i zgubione litery, jak na wyblakłym paragonie."""
+    chars = []
+    for c in text:
+        roll = rng.random()
+        if roll < rate and c in OCR_CONFUSIONS:
+            chars.append(OCR_CONFUSIONS[c])
+        elif roll < rate * 1.5 and c.isalpha():
+            continue
+        else:
+            chars.append(c)
+    return "".join(chars)
+
+
+def price(rng: random.Random) -> float:
+    return round(rng.uniform(0.49, 59.99), 2)
+
+
+def format_price(value: float) -> str:
+    return f"{value:.2f}".replace(".", ",")
+
+
+def make_item_line(ocr: str, rng: random.Random, noise: float = 0.05, style: str = "biedronka") -> str:
+    """Linia produktu ze zmienną ceną, czasem z ilością i literą VAT."""
+    unit_price = price(rng)
+    name = ocr_noise(ocr, rng, noise)
+    vat = rng.choice(["A", "B", "C", ""])
+    if rng.random() < 0.2:
+        qty = rng.choice([2, 3, 4])
+        if style == "lidl":
+            # Lidl: suma przy nazwie, ilość i cena jednostkowa w linii pod spodem
+            return f"{name} {format_price(qty * unit_price)} {vat}".rstrip() + f"\n{qty} x {format_price(unit_price)}"
+        qty_part = f"{qty} x {format_price(unit_price)} {format_price(qty * unit_price)} {vat}".rstrip()
+        # Biedronka często drukuje ilość w osobnej linii pod nazwą
+        separator = "\n" if rng.random() < 0.5 else " "
+        return f"{name}{separator}{qty_part}"
+    return f"{name} {format_price(unit_price)} {vat}".rstrip()
+
+
+def make_queries(taxonomy: Dict[str, List[Dict]], count: int, seed: int = 0, noise: float = 0.05) -> List[tuple]:
+    """Lista (linia OCR, oczekiwany wzorzec) do pomiaru trafności dopasowań."""
+    rng = random.Random(seed + 1)
+    mappings = taxonomy["mappings"]
+    queries = []
+    for _ in range(count):
+        item = rng.choice(mappings)
+        queries.append((make_item_line(item["ocr"], rng, noise), item["ocr"]))
+    return queries
+
+
+_PRICE_RE = re.compile(r"\d+,\d{2}")
+
+# Wyrazy zawierające krótkie aliasy sklepów (pułapki dla naiwnego `alias in text`)
+DISTRACTORS = ["DINOZAURY ZELKI", "SHELLAC LAKIER", "NETTOWAGA INFO", "OBPIEKANY", "KFCHIPS", "ALDIKA SER"]
+
+
+def make_receipt(taxonomy: Dict[str, List[Dict]], rng: random.Random, shop: str = None,
+                 items: tuple = (5, 40), noise: float = 0.05) -> Dict:
+    """
+    Paragon w stylu Biedronki/Lidla: nagłówek z aliasem sklepu, pozycje z szumem OCR,
+    stopka z sumą, PTU, płatnością i numerem terminala.
+    Zwraca {'text', 'shop', 'expected'} - expected to wzorce OCR pozycji.
+    """
+    from utils.receipt_agents import SHOP_MAPPINGS
+
+    shop = shop or rng.choice(list(SHOP_MAPPINGS))
+    alias = rng.choice(SHOP_MAPPINGS[shop])
+    mappings = taxonomy["mappings"]
+
+    lines = [
+        alias.title() if rng.random() < 0.5 else alias,
+        f"ul. {rng.choice(['Polna', 'Długa', 'Lipowa', 'Kwiatowa'])} {rng.randint(1, 120)}",
+        f"{rng.randint(10, 99)}-{rng.randint(100, 999)} {rng.choice(['Kostrzyn', 'Poznań', 'Warszawa', 'Kraków'])}",
+        f"NIP {rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+        "PARAGON FISKALNY",
+        f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} nr {rng.randint(1000, 999999)}",
+    ]
+
+    expected = []
+    total = 0.0
+    style = "lidl" if shop == "LIDL" else "biedronka"
+    for _ in range(rng.randint(*items)):
+        item = rng.choice(mappings)
+        line = make_item_line(item["ocr"], rng, noise, style)
+        lines.append(line)
+        expected.append(item["ocr"])
+        # Suma pozycji to największa kwota w linii (ilość >= 1)
+        total += max(float(p.replace(",", ".")) for p in _PRICE_RE.findall(line))
+        if rng.random() < 0.05:
+            lines.append(f"{rng.choice(DISTRACTORS)} {format_price(price(rng))}")
+        if rng.random() < 0.1:
+            lines.append(f"Rabat -{format_price(rng.uniform(0.1, 3.0))}")
+
+    if shop == "LIDL":
+        lines.append("Lidl Plus - zbieraj kupony!")
+    lines += [
+        f"SUMA PLN {format_price(total)}",
+        f"SPRZEDAZ OPODATKOWANA A {format_price(total * 0.6)}",
+        f"PTU A 23% {format_price(total * 0.6 * 0.23)}",
+        f"SUMA PTU {format_price(total * 0.15)}",
+        "Rozliczenie płatności",
+        f"KARTA {format_price(total)}",
+        f"{rng.randint(100000, 999999):06d} #{rng.randint(1, 9)} {rng.randint(1, 40)} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+        f"nr wydruku {rng.randint(1000, 999999)}",
+    ]
+    return {"text": "\n".join(lines), "shop": shop, "expected": expected}
+
+
+def make_receipts(taxonomy: Dict[str, List[Dict]], count: int, seed: int = 0, **kwargs) -> List[Dict]:
+    rng = random.Random(seed + 2)
+    return [make_receipt(taxonomy, rng, **kwargs) for _ in range(count)]
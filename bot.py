@@ -4,11 +4,9 @@ import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from dotenv import load_dotenv
-from openai import OpenAI
-import finanse
-import wiedza
 import finanse
 import wiedza
+from utils.clients import CLIENTS, whisper_client
 # import pantry (Removed)
 
 
@@ -20,8 +18,6 @@ try:
 except ValueError:
     ALLOWED_USER_ID = 0
 
-OPENAI_CLIENT = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
     level=logging.INFO
@@ -51,7 +47,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def transcribe_audio(file_path):
     """Whisper API"""
     with open(file_path, "rb") as audio_file:
-        transcription = OPENAI_CLIENT.audio.transcriptions.create(
+        transcription = whisper_client().audio.transcriptions.create(
             model="whisper-1", 
             file=audio_file,
             language="pl"
@@ -251,4 +247,8 @@ if __name__ == '__main__':
     application.add_handler(CallbackQueryHandler(handle_callback))
     
     print("🤖 Bot (Voice Brain) wystartował!")
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        # Pule połączeń Vision/OpenAI/Whisper współdzielone przez wszystkie handlery
+        CLIENTS.close()
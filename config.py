@@ -15,14 +15,102 @@ class ProjectConfig:
     
     # Config Files
     PRODUCT_TAXONOMY_PATH = BASE_DIR / "config/product_taxonomy.json"
+    TAXONOMY_INDEX_MIN_PATTERNS = int(os.getenv("TAXONOMY_INDEX_MIN_PATTERNS", "500")) # poniżej - pełny skan
+    TAXONOMY_INDEX_TOP_K = int(os.getenv("TAXONOMY_INDEX_TOP_K", "50"))
+    TAXONOMY_WATCH = os.getenv("TAXONOMY_WATCH", "false").lower() == "true" # przeładowanie bez restartu
+    TAXONOMY_WATCH_INTERVAL = float(os.getenv("TAXONOMY_WATCH_INTERVAL", "5")) # sekundy między sprawdzeniami
+    TAXONOMY_STAGING_ENABLED = os.getenv("TAXONOMY_STAGING_ENABLED", "false").lower() == "true" # potok zapisuje mapowania z AI do przeglądu
+    TAXONOMY_STAGING_PATH = Path(os.getenv("TAXONOMY_STAGING_PATH", str(BASE_DIR / "data" / "product_taxonomy.staging.json"))) # poza config/ (plik roboczy, w .gitignore)
+
+    # Fuzzy Matching
+    FUZZY_MIN_SCORE = int(os.getenv("FUZZY_MIN_SCORE", "70"))
+    FUZZY_BATCH_MODE = os.getenv("FUZZY_BATCH_MODE", "cdist") # cdist (macierzowo) or per_line
+    FUZZY_WORKERS = int(os.getenv("FUZZY_WORKERS", "-1")) # wątki rapidfuzz.cdist, -1 = wszystkie rdzenie
     
     # AI Config
     RECEIPT_AI_PROVIDER = os.getenv("RECEIPT_AI_PROVIDER", "google") # google or ollama
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     OLLAMA_RECEIPT_MODEL = os.getenv("OLLAMA_RECEIPT_MODEL", "llama3")
+    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "1")) # lokalny model liczy zapytania po kolei
+    GOOGLE_API_URL = os.getenv("GOOGLE_API_URL", "https://generativelanguage.googleapis.com/v1beta")
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4")) # równoległe zapytania na dostawcę
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60")) # sekundy na zapytanie
+    LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3")) # ponowienia przy 429/5xx i zerwanym połączeniu
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5")) # sekundy, rośnie x2 z pełnym jitterem
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1")
+    WHISPER_TIMEOUT = float(os.getenv("WHISPER_TIMEOUT", "120")) # sekundy; upload nagrania trwa dłużej niż czat
+
+    # LLM Router (kolejność = preferencja, np. "google,ollama,openai")
+    LLM_PROVIDERS = [p.strip() for p in os.getenv("LLM_PROVIDERS", RECEIPT_AI_PROVIDER).split(",") if p.strip()]
+    LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50")) # ostatnie wywołania na dostawcę
+    LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5")) # poniżej: brak statystyk, kolejność z listy
+    LLM_ROUTER_DEADLINE = float(os.getenv("LLM_ROUTER_DEADLINE", "45")) # potem wynik bez AI (fuzzy)
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3")) # kolejne błędy otwierające obwód
+    LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")) # albo taki odsetek błędów w oknie
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30")) # sekundy do próby (half-open)
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+    LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10")) # bez statystyk; potem p95 dostawcy
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+    LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "20"))
+    RECEIPT_AI_PARTIAL = os.getenv("RECEIPT_AI_PARTIAL", "true").lower() == "true" # do LLM tylko nierozpoznane linie
+    RECEIPT_AI_HEADER_LINES = int(os.getenv("RECEIPT_AI_HEADER_LINES", "3"))
+    RECEIPT_AI_SPECULATIVE = os.getenv("RECEIPT_AI_SPECULATIVE", "false").lower() == "true" # LLM równolegle z fuzzy
+    RECEIPT_AI_SPECULATIVE_LINES = int(os.getenv("RECEIPT_AI_SPECULATIVE_LINES", "5")) # pierwsze N linii jako sygnał
+    RECEIPT_AI_SPECULATIVE_MAX_HIT_RATE = float(os.getenv("RECEIPT_AI_SPECULATIVE_MAX_HIT_RATE", "0.2"))
+    AI_LEARNING_ENABLED = os.getenv("AI_LEARNING_ENABLED", "true").lower() == "true" # zapis wyników AI do cache
+    AI_LEARNING_MIN_SIMILARITY = int(os.getenv("AI_LEARNING_MIN_SIMILARITY", "60")) # nazwa AI vs linia OCR
+    AI_LEARNING_CONFIDENCE = float(os.getenv("AI_LEARNING_CONFIDENCE", "0.6")) # pułap pewności wpisów z AI
     
     # Vault
     OBSIDIAN_VAULT = Path(os.getenv("OBSIDIAN_VAULT_PATH", INPUTS_DIR)) # Fallback to inputs if not set
 
     # Cache
     CACHE_FILE = BASE_DIR / "data" / "receipt_cache.json"
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite") # sqlite or json
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000")) # 0 = bez limitu
+    CACHE_EVICTION = os.getenv("CACHE_EVICTION", "lru") # lru or lfu
+    NEGATIVE_CACHE_ENABLED = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() == "true" # pomijanie linii nie-produktów
+    NEGATIVE_CACHE_MIN_MISSES = int(os.getenv("NEGATIVE_CACHE_MIN_MISSES", "2")) # tyle razy AI nie znalazło w linii produktu
+    NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", str(30 * 24 * 3600))) # sekundy od ostatniego odrzucenia, 0 = bez wygasania
+    NEGATIVE_CACHE_RECHECK = float(os.getenv("NEGATIVE_CACHE_RECHECK", "0.05")) # odsetek pominięć sprawdzanych mimo wpisu
+    CACHE_FLUSH_EVERY = int(os.getenv("CACHE_FLUSH_EVERY", "20")) # paragonów między zapisami w trybie wsadowym
+    WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "500")) # wierszy na porcję kursora serwerowego
+    WARMUP_MIN_SIMILARITY = int(os.getenv("WARMUP_MIN_SIMILARITY", "85")) # nazwa z historii vs linia OCR
+    WARMUP_MIN_AGREEMENT = float(os.getenv("WARMUP_MIN_AGREEMENT", "0.8")) # udział głosów na zwycięską nazwę
+    WARMUP_CONFIDENCE = float(os.getenv("WARMUP_CONFIDENCE", "0.8")) # pułap pewności wpisów z historii
+    WARMUP_HOLDOUT_EVERY = int(os.getenv("WARMUP_HOLDOUT_EVERY", "10")) # co N-ty paragon do pomiaru trafień
+
+    # LLM Response Cache
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_FILE = BASE_DIR / "data" / "llm_cache.db"
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600))) # sekundy
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+    # OCR
+    PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200")) # rozdzielczość renderowania stron PDF
+    PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", "4")) # strony renderowane i rozpoznawane równolegle
+    PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "true").lower() == "true" # najpierw tekst z pypdf, OCR tylko gdy brak
+    PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "40")) # znaków słownych na stronę
+    PDF_TEXT_MIN_PRICES = int(os.getenv("PDF_TEXT_MIN_PRICES", "1")) # cen na krótkiej stronie
+    PDF_OCR_PAGE_SECONDS = float(os.getenv("PDF_OCR_PAGE_SECONDS", "2.0")) # szacunek strony OCR przed pomiarami
+    IMAGE_PREP_ENABLED = os.getenv("IMAGE_PREP_ENABLED", "true").lower() == "true" # zmniejszenie i re-enkodowanie przed wysłaniem
+    IMAGE_PREP_MAX_SIDE = int(os.getenv("IMAGE_PREP_MAX_SIDE", "2048")) # px dłuższego boku; Vision nie zyskuje na większych
+    IMAGE_PREP_GRAYSCALE = os.getenv("IMAGE_PREP_GRAYSCALE", "true").lower() == "true"
+    IMAGE_PREP_CROP = os.getenv("IMAGE_PREP_CROP", "true").lower() == "true" # kadr do obszaru z tekstem
+    IMAGE_PREP_FORMAT = os.getenv("IMAGE_PREP_FORMAT", "auto") # auto (PNG dla zrzutów, JPEG dla zdjęć), JPEG or PNG
+    IMAGE_PREP_QUALITY = int(os.getenv("IMAGE_PREP_QUALITY", "85")) # jakość JPEG
+    OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true" # tekst OCR po sha256 pliku
+    OCR_CACHE_FILE = BASE_DIR / "data" / "ocr_cache.db"
+    OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "64")) # limit rozmiaru, najdawniej używane wypadają
+
+    # Metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true" # czasy etapów potoku
+    METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048")) # próbek na histogram (kwantyle z okna)
+    METRICS_DIR = BASE_DIR / "data" / "metrics" # metrics.prom + metrics.json
+
+    # Batch
+    RECEIPT_BATCH_CONCURRENCY = int(os.getenv("RECEIPT_BATCH_CONCURRENCY", "4"))
@@ -1,22 +1,59 @@
 import asyncio
+import contextlib
+import itertools
 import logging
 import re
 import json
+import math
+import queue
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Optional, Any, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Tuple, Iterable, Iterator, AsyncIterator, Union
+from concurrent.futures import ThreadPoolExecutor, Future
 from rapidfuzz import process, fuzz
 import time
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # Lokalne importy
 from config import ProjectConfig
-from utils.receipt_cache import ReceiptCache, ProductMatch
-from utils.taxonomy import TaxonomyGuard
+from utils.receipt_cache import ReceiptCache, ProductMatch, canonicalize_line, align_items, item_prices, line_prices
+from utils.taxonomy import TaxonomyGuard, StagingTaxonomy
 from adapters.google.gemini_adapter import UniversalBrain
-from utils.receipt_agents import detect_shop, get_agent
+from adapters.router import ProviderRouter
+from adapters.response_cache import clean_json_response
+from utils.receipt_agents import detect_shop, get_agent, ReceiptLine, UNKNOWN_SHOP
+from utils.metrics import LatencyRecorder, METRICS
+from utils.loop_thread import BackgroundLoop, get_background_loop
 
 logger = logging.getLogger("AsyncReceiptPipeline")
 
+_DONE = object() # koniec strumienia w process_receipts_sync
+
+
+@dataclass
+class ReceiptJob:
+    """Stan pojedynczego paragonu pomiędzy etapami potoku."""
+    ocr_text: str
+    shop: Optional[str]
+    start_time: float
+    lines: List[str] = field(default_factory=list) # linie-kandydaci na produkty (mianownik pokrycia)
+    skipped: List[str] = field(default_factory=list) # linie nie-produktów (wzorce agenta + negatywny cache)
+    records: Dict[str, ReceiptLine] = field(default_factory=dict) # linia -> pozycja z gramatyki sklepu
+    cached_items: List[Tuple[str, ProductMatch]] = field(default_factory=list)
+    cache_misses: List[str] = field(default_factory=list)
+    fuzzy_items: List[Tuple[str, ProductMatch]] = field(default_factory=list)
+    cache_hit_rate: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict) # etap -> ms (gdy metryki włączone)
+    speculative: Optional[asyncio.Task] = None # zapytanie AI wysłane przed fuzzy matchingiem
+    speculative_tokens: int = 0 # szacunek tokenów promptu spekulacji
+    route: Dict[str, Any] = field(default_factory=dict) # decyzje ProviderRouter (dostawca, hedging, błędy)
+
+
 class AsyncReceiptPipeline:
     """
     Asynchroniczny potok przetwarzania paragonów z inteligentnym cache'owaniem.
@@ -27,89 +64,269 @@ class AsyncReceiptPipeline:
     3. AI (LLM) tylko gdy powyższe zawiodą (pokrycie < 30%)
     """
 
-    def __init__(self):
-        self.cache = ReceiptCache()
-        self.brain = UniversalBrain(provider=ProjectConfig.RECEIPT_AI_PROVIDER)
-        
-        self.taxonomy = TaxonomyGuard(str(ProjectConfig.PRODUCT_TAXONOMY_PATH))
+    def __init__(self, cache: ReceiptCache = None, brain: UniversalBrain = None, taxonomy: TaxonomyGuard = None,
+                 staging: StagingTaxonomy = None, metrics: LatencyRecorder = None,
+                 loop_thread: BackgroundLoop = None):
+        # Pusty ReceiptCache ma len() == 0, więc sprawdzamy jawnie None zamiast `or`
+        self.cache = cache if cache is not None else ReceiptCache()
+        # Router nad LLM_PROVIDERS (domyślnie tylko RECEIPT_AI_PROVIDER): wyłącznik obwodu, hedging, termin
+        self.brain = brain if brain is not None else ProviderRouter(ProjectConfig.LLM_PROVIDERS)
+
+        self.taxonomy = taxonomy if taxonomy is not None else TaxonomyGuard(str(ProjectConfig.PRODUCT_TAXONOMY_PATH))
+        # Poczekalnia taksonomii tylko na życzenie (TAXONOMY_STAGING_ENABLED) - plik w data/, nie w config/
+        if staging is None and ProjectConfig.AI_LEARNING_ENABLED and ProjectConfig.TAXONOMY_STAGING_ENABLED:
+            staging = StagingTaxonomy()
+        self.staging = staging
+        self.metrics = metrics if metrics is not None else METRICS
+        # Wywołania synchroniczne idą przez jedną pętlę w tle (wspólną dla procesu)
+        self.loop_thread = loop_thread if loop_thread is not None else get_background_loop()
         self.executor = ThreadPoolExecutor(max_workers=4)
+        self.speculation = {'started': 0, 'used': 0, 'cancelled': 0, 'wasted_tokens': 0}
+        self._cache_lock: Optional[asyncio.Lock] = None
+        self._cache_lock_loop = None
 
     async def process_receipt_async(self, ocr_text: str, shop: Optional[str] = None) -> Dict[str, Any]:
-        start_time = time.time()
-
+        job = self._prepare_job(ocr_text, shop)
+        self._lookup_cache(job)
+        self._maybe_speculate(job)
+        await self._resolve_fuzzy([job])
+        result = await self._finalize_job(job)
+        if job.lines:
+            await self._flush_cache()
+        return result
+
+    async def process_receipts_async(
+        self,
+        receipts: Iterable[Union[str, Tuple[str, Optional[str]]]],
+        concurrency: int = None
+    ) -> AsyncIterator[Tuple[int, Union[Dict[str, Any], Exception]]]:
+        """
+        Przetwarza wiele paragonów (tekst OCR albo krotka (tekst, sklep)).
+        Zwraca (indeks, wynik) w kolejności ukończenia; błąd paragonu to wyjątek w miejscu wyniku.
+
+        Paragony są pobierane paczkami: cache i fuzzy matching liczone są raz dla całej paczki
+        (każda unikalna linia tylko raz), a etap AI biegnie równolegle z limitem `concurrency`.
+        """
+        concurrency = concurrency or ProjectConfig.RECEIPT_BATCH_CONCURRENCY
+        semaphore = asyncio.Semaphore(concurrency)
+        done: asyncio.Queue = asyncio.Queue()
+        tasks = set()
+        expected = finished = since_flush = 0
+
+        async def finalize(index: int, job: ReceiptJob):
+            async with semaphore:
+                try:
+                    result = await self._finalize_job(job)
+                except Exception as e:
+                    result = e
+            await done.put((index, result))
+
+        receipts_iter = enumerate(receipts)
+        chunk_size = concurrency * 4
+        try:
+            while True:
+                # Backpressure: nie przygotowujemy kolejnej paczki, gdy poprzednia wciąż czeka na AI.
+                # Liczymy nieodebrane wyniki, nie len(tasks) - zadanie znika ze zbioru dopiero w callbacku,
+                # już po włożeniu wyniku do kolejki.
+                while expected - finished >= chunk_size:
+                    finished += 1
+                    since_flush += 1
+                    yield await done.get()
+
+                chunk = list(itertools.islice(receipts_iter, chunk_size))
+                if not chunk:
+                    break
+                expected += len(chunk)
+
+                jobs = []
+                for index, receipt in chunk:
+                    ocr_text, shop = (receipt, None) if isinstance(receipt, str) else receipt
+                    try:
+                        job = self._prepare_job(ocr_text, shop)
+                    except Exception as e:
+                        await done.put((index, e))
+                        continue
+                    self._lookup_cache(job)
+                    if self._maybe_speculate(job):
+                        # Anulowane w finally razem z resztą, jeśli strumień zostanie przerwany
+                        tasks.add(job.speculative)
+                        job.speculative.add_done_callback(tasks.discard)
+                    jobs.append((index, job))
+
+                await self._resolve_fuzzy([job for _, job in jobs])
+                for index, job in jobs:
+                    task = asyncio.create_task(finalize(index, job))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                while not done.empty():
+                    finished += 1
+                    since_flush += 1
+                    yield done.get_nowait()
+
+                # Write-behind: cache trafia na dysk co kilka paragonów, a nie po każdym
+                if since_flush >= ProjectConfig.CACHE_FLUSH_EVERY:
+                    await self._flush_cache()
+                    since_flush = 0
+
+            while finished < expected:
+                finished += 1
+                yield await done.get()
+        finally:
+            # Przerwany strumień (aclose, anulowanie konsumenta): zadania kończą się tutaj, a nie w tle
+            pending = list(tasks)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await self._flush_cache()
+
+    def _prepare_job(self, ocr_text: str, shop: Optional[str]) -> "ReceiptJob":
         if not ocr_text or not ocr_text.strip():
             raise ValueError("OCR text is empty")
 
-        # Krok 0: Wykrycie sklepu i wstępne czyszczenie
-        if shop is None:
-            shop = detect_shop(ocr_text)
-
-        agent = get_agent(shop)
-        cleaned_ocr = agent.preprocess(ocr_text)
-        lines = [l.strip() for l in cleaned_ocr.split('\n') if l.strip()]
+        job = ReceiptJob(ocr_text=ocr_text, shop=shop, start_time=time.perf_counter())
 
+        # Krok 0: Wykrycie sklepu i wstępne czyszczenie
+        if job.shop is None:
+            with self.metrics.span("detect_shop", sink=job.timings):
+                job.shop = detect_shop(ocr_text)
+
+        agent = get_agent(job.shop)
+        with self.metrics.span("preprocess", job.shop, sink=job.timings):
+            cleaned_ocr = agent.preprocess(ocr_text)
+        # Gramatyka sklepu skleja nazwę z linią ilości i rozdziela nazwę od cen w jednym przebiegu
+        with self.metrics.span("parse_lines", job.shop, sink=job.timings):
+            records = agent.parse_lines(cleaned_ocr)
+            if ProjectConfig.NEGATIVE_CACHE_ENABLED:
+                # Jeden przebieg: każda linia sprawdzana regułami sklepu raz
+                products = []
+                for record in records:
+                    if agent.is_non_product(record.raw):
+                        job.skipped.append(record.raw)
+                    else:
+                        products.append(record)
+                records = products
+        job.lines = [record.raw for record in records]
+        job.records = {record.raw: record for record in records}
+        return job
+
+    def _lookup_cache(self, job: "ReceiptJob"):
         # Krok 1: Sprawdzenie Cache
-        cached_items = []
-        cache_misses = []
-
-        for line in lines:
-            cached = self.cache.lookup(line, shop)
-            if cached:
-                cached_items.append((line, cached))
-            else:
-                cache_misses.append(line)
-
-        cache_hit_rate = len(cached_items) / len(lines) if lines else 0
-
-        # Krok 2: Równoległe dopasowywanie rozmyte (Fuzzy Matching)
-        fuzzy_matches = []
-        if cache_misses:
-            fuzzy_matches = await self._fuzzy_match_batch(cache_misses)
+        with self.metrics.span("cache_lookup", job.shop, sink=job.timings):
+            learned_skips = []
+            for line in job.lines:
+                cached = self.cache.lookup(line, job.shop)
+                if cached:
+                    job.cached_items.append((line, cached))
+                elif ProjectConfig.NEGATIVE_CACHE_ENABLED and self.cache.is_non_product(line, job.shop):
+                    learned_skips.append(line)
+                else:
+                    job.cache_misses.append(line)
+            if learned_skips:
+                # Wyuczone nie-produkty nie trafiają do fuzzy ani do mianownika pokrycia
+                job.skipped += learned_skips
+                skipped = set(learned_skips)
+                job.lines = [line for line in job.lines if line not in skipped]
+
+        job.cache_hit_rate = len(job.cached_items) / len(job.lines) if job.lines else 0
+
+    async def _resolve_fuzzy(self, jobs: List["ReceiptJob"]):
+        # Krok 2: Równoległe dopasowywanie rozmyte - każda unikalna nazwa z całej paczki raz.
+        # Oceniamy samą nazwę z gramatyki: ceny i ilości tylko zaniżają partial_ratio.
+        unique_misses = list(dict.fromkeys(
+            self._match_text(job, line) for job in jobs for line in job.cache_misses
+        ))
+        if not unique_misses:
+            return
+        # W trybie wsadowym jedna macierz obsługuje wiele sklepów - czas trafia do etykiety "batch"
+        single = jobs[0] if len(jobs) == 1 else None
+        # Przy spekulacji fuzzy idzie do executora, żeby pętla mogła w tym czasie wysłać zapytanie AI
+        offload = any(job.speculative is not None for job in jobs)
+        with self.metrics.span("fuzzy", single.shop if single else "batch", sink=single.timings if single else None):
+            scored = dict(zip(unique_misses, await self._fuzzy_match_batch(unique_misses, offload)))
+
+        async with self._get_cache_lock():
+            for job in jobs:
+                for line in job.cache_misses:
+                    match_tuple = scored.get(self._match_text(job, line))
+                    # Dodaj z fuzzy match (jeśli pewność >= FUZZY_MIN_SCORE)
+                    if not match_tuple or match_tuple[1] < ProjectConfig.FUZZY_MIN_SCORE:
+                        continue
+                    meta = self.taxonomy.get_metadata(match_tuple[0])
+                    if meta:
+                        category = meta['cat'].upper() if meta['cat'] else 'INNE'
+                        product_match = ProductMatch(
+                            name=meta['name'],
+                            category=category,
+                            unit=meta['unit'],
+                            confidence=match_tuple[1] / 100.0,
+                            source="fuzzy"
+                        )
+                        job.fuzzy_items.append((line, product_match))
+                        self.cache.update(line, product_match, job.shop)
+
+    @staticmethod
+    def _match_text(job: "ReceiptJob", line: str) -> str:
+        record = job.records.get(line)
+        return (record.name if record else line).upper()
+
+    async def _finalize_job(self, job: "ReceiptJob") -> Dict[str, Any]:
+        shop = job.shop
 
         # Krok 3: Łączenie wyników
-        all_items = []
-        
-        # Dodaj z cache
-        for line, match in cached_items:
-            all_items.append(self._match_to_item(line, match))
-
-        # Dodaj z fuzzy match (jeśli pewność > 70%)
-        for line, match_tuple in zip(cache_misses, fuzzy_matches):
-            if match_tuple and match_tuple[1] >= 70:
-                meta = self.taxonomy.get_metadata(match_tuple[0])
-                if meta:
-                    category = meta['cat'].upper() if meta['cat'] else 'INNE'
-                    product_match = ProductMatch(
-                        name=meta['name'],
-                        category=category,
-                        unit=meta['unit'],
-                        confidence=match_tuple[1] / 100.0,
-                        source="fuzzy"
-                    )
-                    all_items.append(self._match_to_item(line, product_match))
-                    self.cache.update(line, product_match, shop)
+        all_items = [self._match_to_item(line, match, job.records.get(line)) for line, match in job.cached_items]
+        all_items += [self._match_to_item(line, match, job.records.get(line)) for line, match in job.fuzzy_items]
 
         # Krok 4: Decyzja czy użyć AI (jeśli mało produktów rozpoznano)
-        needs_ai = self._needs_ai_processing(all_items, len(lines), cache_hit_rate)
-
+        needs_ai = self._needs_ai_processing(all_items, len(job.lines), job.cache_hit_rate)
+        resolved = {line for line, _ in job.cached_items} | {line for line, _ in job.fuzzy_items}
+        unresolved = [line for line in job.lines if line not in resolved]
+        partial = ProjectConfig.RECEIPT_AI_PARTIAL and bool(all_items)
+        lines_ai = lines_learned = 0
+        degraded = False
+
+        if needs_ai and partial and not unresolved:
+            # Wszystko rozpoznane lokalnie (np. fuzzy przy pustym cache) - LLM nic nie wniesie
+            needs_ai = False
+        if needs_ai and not job.lines and job.skipped:
+            # Same linie nie-produktów (np. wydruk niefiskalny)
+            needs_ai = False
+
+        speculative = self._settle_speculation(job, needs_ai)
         if needs_ai:
+            # Tryb częściowy: tylko nierozpoznane linie + nagłówek, wyniki AI dokładamy do lokalnych dopasowań
+            ai_lines = unresolved if partial else None
+            lines_ai = len(unresolved) if partial else len(job.lines)
             try:
-                ai_result = await self._ai_process_async(ocr_text, shop, timeout=120.0)
+                if job.speculative is not None:
+                    with self.metrics.span("ai_wait", shop, sink=job.timings):
+                        ai_result = await job.speculative
+                    if ai_result and 'items' in ai_result and partial:
+                        # Spekulacja objęła też linie, które fuzzy rozpoznał w międzyczasie - te pozycje odrzucamy
+                        ai_result['items'] = self._drop_locally_resolved(ai_result['items'], resolved)
+                else:
+                    ai_result = await self._ai_process_async(job.ocr_text, shop, timeout=120.0, lines=ai_lines,
+                                                             timings=job.timings, route=job.route)
+                # Brak odpowiedzi AI (obwody otwarte, termin, błąd) - zostaje wynik lokalny zamiast czekania
+                degraded = not ai_result or 'items' not in ai_result
                 if ai_result and 'items' in ai_result:
-                    all_items = ai_result['items']
-                    self._update_cache_from_ai(ai_result['items'], shop)
+                    all_items = all_items + ai_result['items'] if partial else ai_result['items']
+                    async with self._get_cache_lock():
+                        with self.metrics.span("learn", shop, sink=job.timings):
+                            lines_learned = self._update_cache_from_ai(ai_result['items'], shop, unresolved)
             except Exception as e:
+                degraded = True
                 logger.error(f"AI processing failed: {e}")
 
         # Krok 5: Ekstrakcja metadanych
-        receipt_date = self._extract_date(ocr_text, shop)
+        receipt_date = self._extract_date(job.ocr_text, shop)
         total_amount = sum(item.get('suma', 0) for item in all_items)
 
-        if len(cached_items) + len(cache_misses) > 0:
-            self.cache.save()
+        elapsed = time.perf_counter() - job.start_time
+        # Tier rozwiązania paragonu: najdroższy etap, który był potrzebny
+        tier = "degraded" if degraded else "ai" if needs_ai else "fuzzy" if job.fuzzy_items else "cache"
+        self.metrics.observe("total", elapsed, shop, tier)
 
-        elapsed = time.time() - start_time
-        
         return {
             'items': all_items,
             'date': receipt_date,
@@ -117,14 +334,113 @@ class AsyncReceiptPipeline:
             'shop': shop,
             'stats': {
                 'processing_time': elapsed,
-                'cache_hit_rate': cache_hit_rate,
-                'used_ai': needs_ai
+                'stages_ms': dict(job.timings),
+                'tier': tier,
+                'cache_hit_rate': job.cache_hit_rate,
+                'cache_tiers': dict(self.cache.stats),
+                'used_ai': needs_ai,
+                'lines_local': len(job.lines) - len(unresolved),
+                'lines_skipped': len(job.skipped),
+                'lines_ai': lines_ai,
+                'lines_learned': lines_learned,
+                'speculative': speculative,
+                'speculation': self.speculation_stats(),
+                'llm_cache': self._brain_stats('cache_stats'),
+                'llm_coalescing': self._brain_stats('flight_stats'),
+                'degraded': degraded,
+                'routing': dict(job.route) if job.route else None,
+                'router': self._brain_stats('router_stats')
             }
         }
 
-    async def _fuzzy_match_batch(self, lines: List[str]) -> List[Optional[Tuple]]:
+    def _maybe_speculate(self, job: "ReceiptJob") -> bool:
+        """
+        Wysyła zapytanie AI przed fuzzy matchingiem, gdy tanie sygnały zapowiadają fallback:
+        nieznany sklep albo niski odsetek trafień cache w pierwszych liniach.
+        """
+        if not ProjectConfig.RECEIPT_AI_SPECULATIVE or not job.cache_misses:
+            return False
+        head = job.lines[:ProjectConfig.RECEIPT_AI_SPECULATIVE_LINES]
+        cached = {line for line, _ in job.cached_items}
+        head_hit_rate = sum(1 for line in head if line in cached) / len(head)
+        if job.shop != UNKNOWN_SHOP and head_hit_rate >= ProjectConfig.RECEIPT_AI_SPECULATIVE_MAX_HIT_RATE:
+            return False
+
+        lines = job.cache_misses if ProjectConfig.RECEIPT_AI_PARTIAL else None
+        user_prompt = (self._build_user_prompt(job.ocr_text, job.shop) if lines is None
+                       else self._build_partial_user_prompt(job.ocr_text, job.shop, lines))
+        job.speculative_tokens = self._estimate_tokens(self._build_system_prompt(job.shop) + user_prompt)
+        job.speculative = asyncio.create_task(
+            self._ai_process_async(job.ocr_text, job.shop, timeout=120.0, lines=lines, timings=job.timings,
+                                   route=job.route)
+        )
+        self.speculation['started'] += 1
+        return True
+
+    def _settle_speculation(self, job: "ReceiptJob", needs_ai: bool) -> Optional[str]:
+        """Rozlicza spekulację: 'used' gdy AI i tak było potrzebne, inaczej anuluje i liczy zmarnowane tokeny."""
+        task = job.speculative
+        if task is None:
+            return None
+        if needs_ai:
+            self.speculation['used'] += 1
+            return "used"
+
+        # Prompt mógł już trafić do dostawcy; odpowiedź liczymy tylko, jeśli zdążyła przyjść
+        wasted = job.speculative_tokens
+        if task.done() and not task.cancelled() and task.result():
+            wasted += self._estimate_tokens(json.dumps(task.result(), ensure_ascii=False))
+        task.cancel()
+        job.speculative = None
+        self.speculation['cancelled'] += 1
+        self.speculation['wasted_tokens'] += wasted
+        return "cancelled"
+
+    def _drop_locally_resolved(self, items: List[Dict], resolved_lines) -> List[Dict]:
+        duplicates = {id(item) for _, item, _ in self._align_ai_items(items, list(resolved_lines))}
+        return [item for item in items if id(item) not in duplicates]
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Przybliżenie ~4 znaki na token (bez zależności od tokenizera dostawcy)
+        return math.ceil(len(text) / 4)
+
+    def speculation_stats(self) -> Dict[str, Any]:
+        started = self.speculation['started']
+        return {**self.speculation, 'hit_rate': self.speculation['used'] / started if started else 0.0}
+
+    def _brain_stats(self, name: str) -> Optional[Dict[str, Any]]:
+        stats = getattr(self.brain, name, None)
+        return stats() if callable(stats) else None
+
+    def _get_cache_lock(self) -> asyncio.Lock:
+        # asyncio.Lock jest związany z pętlą zdarzeń - tworzymy go dla bieżącej pętli
+        loop = asyncio.get_running_loop()
+        if self._cache_lock_loop is not loop:
+            self._cache_lock = asyncio.Lock()
+            self._cache_lock_loop = loop
+        return self._cache_lock
+
+    async def _flush_cache(self):
+        async with self._get_cache_lock():
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.cache.save)
+            if self.staging is not None:
+                await loop.run_in_executor(self.executor, self.staging.save)
+
+    async def _fuzzy_match_batch(self, lines: List[str], offload: bool = False) -> List[Optional[Tuple]]:
         if not lines: return []
-        if len(lines) < 15: # Dla małych paragonów synchronicznie
+        if self._use_matrix_scoring():
+            try:
+                if len(lines) < 15 and not offload:
+                    return self._fuzzy_match_matrix(lines)
+                # cdist zwalnia GIL i liczy na wielu wątkach - pętla zdarzeń pozostaje wolna
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, self._fuzzy_match_matrix, lines)
+            except Exception as e:
+                logger.warning(f"Batch fuzzy matching failed, falling back to per-line: {e}")
+
+        if len(lines) < 15 and not offload: # Dla małych paragonów synchronicznie
             return [self._fuzzy_match_single(line) for line in lines]
 
         loop = asyncio.get_event_loop()
@@ -135,51 +451,95 @@ class AsyncReceiptPipeline:
         results = await asyncio.gather(*tasks, return_exceptions=True)
         return [r if not isinstance(r, Exception) else None for r in results]
 
+    def _use_matrix_scoring(self) -> bool:
+        # Macierz opłaca się tylko przy pełnym skanie; dużą taksonomię zawęża indeks trigramów per linia
+        return (
+            ProjectConfig.FUZZY_BATCH_MODE == "cdist"
+            and NUMPY_AVAILABLE
+            and len(self.taxonomy.ocr_patterns) < self.taxonomy.index_min_patterns
+        )
+
+    def _fuzzy_match_matrix(self, lines: List[str]) -> List[Optional[Tuple]]:
+        """Wszystkie linie naraz: jedna macierz wyników (linie x wzorce) z rapidfuzz.cdist."""
+        choices = self.taxonomy.ocr_patterns
+        if not choices:
+            return [None] * len(lines)
+
+        scores = process.cdist(
+            [line.upper() for line in lines],
+            choices,
+            scorer=fuzz.partial_ratio,
+            # float32 zamiast uint8: zaokrąglenie (95.65 -> 96) psuło pewność i remisy w argmax względem ścieżki per-linia
+            dtype=np.float32,
+            score_cutoff=ProjectConfig.FUZZY_MIN_SCORE,
+            workers=ProjectConfig.FUZZY_WORKERS
+        )
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(lines)), best]
+        # Poniżej score_cutoff cdist zwraca 0 - takie wiersze to brak dopasowania
+        accepted = best_scores >= ProjectConfig.FUZZY_MIN_SCORE
+        return [
+            (choices[idx], float(score), idx) if ok else None
+            for idx, score, ok in zip(best.tolist(), best_scores.tolist(), accepted.tolist())
+        ]
+
     def _fuzzy_match_single(self, line: str) -> Optional[Tuple]:
         try:
             match = process.extractOne(
                 line.upper(),
-                self.taxonomy.ocr_patterns,
+                self.taxonomy.candidates(line),
                 scorer=fuzz.partial_ratio
             )
             return match
         except Exception:
             return None
 
-    async def _ai_process_async(self, ocr_text: str, shop: str, timeout: float = 120.0) -> Optional[Dict]:
+    async def _ai_process_async(self, ocr_text: str, shop: str, timeout: float = 120.0,
+                                lines: Optional[List[str]] = None,
+                                timings: Optional[Dict[str, float]] = None,
+                                route: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
         system_prompt = self._build_system_prompt(shop)
-        user_prompt = self._build_user_prompt(ocr_text, shop)
+        if lines is None:
+            user_prompt = self._build_user_prompt(ocr_text, shop)
+        else:
+            user_prompt = self._build_partial_user_prompt(ocr_text, shop, lines)
 
         try:
-            response = await asyncio.wait_for(
-                self.brain.generate_content_async(
-                    user_prompt, system_prompt, "json"
-                ),
-                timeout=timeout
-            )
+            with self.metrics.span("ai", shop, sink=timings):
+                # Router wypełnia `route`; zwykły UniversalBrain (i atrapy w testach) go nie przyjmują
+                extra = {'route': route} if isinstance(self.brain, ProviderRouter) and route is not None else {}
+                response = await asyncio.wait_for(
+                    self.brain.generate_content_async(
+                        user_prompt, system_prompt, "json", **extra
+                    ),
+                    timeout=timeout
+                )
             if response:
-                cleaned = self._clean_json_response(response)
-                return json.loads(cleaned)
+                with self.metrics.span("json_parse", shop, sink=timings):
+                    cleaned = self._clean_json_response(response)
+                    return json.loads(cleaned)
         except Exception as e:
             logger.error(f"AI Error: {e}")
         return None
 
-    def _match_to_item(self, line: str, match: ProductMatch) -> Dict:
-        # Prosta logika regex do wyciągania cen z linii, która została dopasowana
-        # To wymagałoby poprawy, bo cena może być w innym miejscu linii w zależności od OCR
-        price_pattern = r'(\d+[.,]\d{2})'
-        prices = re.findall(price_pattern, line)
-        price = 0.0
-        if prices:
-            price = float(prices[-1].replace(',', '.'))
-            
+    def _match_to_item(self, line: str, match: ProductMatch, record: Optional[ReceiptLine] = None) -> Dict:
+        if record is not None and record.total is not None:
+            qty = record.qty
+            total = record.total
+            unit_price = record.unit_price if record.unit_price is not None else round(total / qty, 2)
+        else:
+            # Linia spoza gramatyki sklepu - ostatnia cena w linii jako suma
+            prices = re.findall(r'(\d+[.,]\d{2})', line)
+            qty = 1.0
+            total = unit_price = float(prices[-1].replace(',', '.')) if prices else 0.0
+
         return {
             'nazwa': match.name,
             'kategoria': match.category,
             'jednostka': match.unit,
-            'ilosc': 1.0, # Uproszczenie, parser ilosci to osobny temat
-            'cena_jedn': price,
-            'suma': price
+            'ilosc': qty,
+            'cena_jedn': unit_price,
+            'suma': total
         }
 
     def _needs_ai_processing(self, items, total_lines, cache_hit_rate):
@@ -199,9 +559,7 @@ class AsyncReceiptPipeline:
         return dates[0] if dates else None
 
     def _clean_json_response(self, text):
-        text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-        text = re.sub(r'```json\s*|\s*```', '', text)
-        return text.strip()
+        return clean_json_response(text)
 
     def _build_system_prompt(self, shop):
         return f"Extract items from {shop} receipt into JSON structure {{'items': [{{'nazwa':..., 'kategoria':..., 'ilosc':..., 'cena_jedn':..., 'suma':...}}]}}. Categories: SPOŻYWCZE, CHEMIA, ALKOHOL, INNE, NABIAŁ, OWOCE_WARZYWA, MIĘSO."
@@ -209,14 +567,121 @@ class AsyncReceiptPipeline:
     def _build_user_prompt(self, ocr_text, shop):
         return f"Shop: {shop}\nOCR:\n{ocr_text}"
 
-    def _update_cache_from_ai(self, items: List[Dict], shop: str):
-        # Tutaj moglibyśmy dodawać do cache wyniki z AI
-        # Ale to ryzykowne, bo AI może halucynować.
-        # Na razie zostawiam puste albo tylko logowanie.
-        pass
-
-    def process_receipt_sync(self, ocr_text, shop=None):
-        """Wrapper dla kodu synchronicznego"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(self.process_receipt_async(ocr_text, shop))
+    def _build_partial_user_prompt(self, ocr_text, shop, lines):
+        header = [l.strip() for l in ocr_text.split('\n') if l.strip()][:ProjectConfig.RECEIPT_AI_HEADER_LINES]
+        header_text = "\n".join(header)
+        lines_text = "\n".join(lines)
+        return f"Shop: {shop}\nHeader:\n{header_text}\nUnrecognized lines (extract only these):\n{lines_text}"
+
+    def _update_cache_from_ai(self, items: List[Dict], shop: str, lines: List[str]) -> int:
+        """
+        Uczy cache na wynikach AI. AI może halucynować, więc zapisujemy tylko pozycje,
+        które da się przypisać do konkretnej linii OCR: zgodna cena + podobna nazwa.
+        Linie, w których AI nie znalazło produktu, liczą się do negatywnego cache - ale tylko wtedy,
+        gdy odpowiedź faktycznie objęła paragon: niepusta, a każdą pozycję udało się przypisać do linii.
+        Pusta lub ucięta odpowiedź, błąd AI albo pozycja z rozwiniętą nazwą ("PAP.TOAL.VELV" ->
+        "Papier toaletowy") nie mówią nic o liniach; linia z ceną którejś pozycji nigdy nie jest chybieniem.
+        Zwraca liczbę wyuczonych linii.
+        """
+        aligned = self._align_ai_items(items, lines)
+        if ProjectConfig.NEGATIVE_CACHE_ENABLED and items and len(aligned) == len(items):
+            matched = {line for line, _, _ in aligned}
+            returned_prices = set().union(*(item_prices(item) for item in items))
+            for line in lines:
+                if line not in matched and not line_prices(line) & returned_prices:
+                    self.cache.record_non_product(line, shop)
+
+        if not ProjectConfig.AI_LEARNING_ENABLED:
+            return 0
+
+        learned = 0
+        for line, item, similarity in aligned:
+            confidence = ProjectConfig.AI_LEARNING_CONFIDENCE * similarity / 100.0
+            product_match = ProductMatch(
+                name=item['nazwa'],
+                category=(item.get('kategoria') or 'INNE').upper(),
+                unit=item.get('jednostka') or 'szt',
+                confidence=confidence,
+                source="ai"
+            )
+            self.cache.update(line, product_match, shop)
+            if self.staging is not None:
+                self.staging.add(canonicalize_line(line), product_match.name, product_match.category,
+                                 product_match.unit, confidence)
+            learned += 1
+        if learned:
+            logger.info(f"Learned {learned} lines from AI ({shop})")
+        return learned
+
+    def _align_ai_items(self, items: List[Dict], lines: List[str]) -> List[Tuple[str, Dict, float]]:
+        return align_items(items, lines, ProjectConfig.AI_LEARNING_MIN_SIMILARITY)
+
+    def process_receipt_sync(self, ocr_text, shop=None, timeout: float = None):
+        """Wrapper dla kodu synchronicznego - blokuje do wyniku, pętla żyje w wątku w tle."""
+        return self.loop_thread.run(self.process_receipt_async(ocr_text, shop), timeout)
+
+    def submit_receipt(self, ocr_text: str, shop: Optional[str] = None) -> Future:
+        """Zleca paragon bez czekania; wiele zleceń dzieli pętlę, więc wywołania AI się nakładają."""
+        return self.loop_thread.submit(self.process_receipt_async(ocr_text, shop))
+
+    def process_receipts_sync(
+        self,
+        receipts: Iterable[Union[str, Tuple[str, Optional[str]]]],
+        concurrency: int = None
+    ) -> Iterator[Tuple[int, Union[Dict[str, Any], Exception]]]:
+        """
+        Synchroniczny odpowiednik process_receipts_async: (indeks, wynik) w kolejności ukończenia.
+        Przerwanie iteracji anuluje resztę paczki (z zapisem cache).
+        Gotowe wyniki czekają w kolejce najwyżej `concurrency` naraz - wolny konsument wstrzymuje paczkę.
+        """
+        concurrency = concurrency or ProjectConfig.RECEIPT_BATCH_CONCURRENCY
+        # +1 miejsce na _DONE; put() w pętli nie może blokować, więc miejsce rezerwuje semafor po stronie pętli
+        results: queue.Queue = queue.Queue(maxsize=concurrency + 1)
+        slots = asyncio.Semaphore(concurrency)
+        loop: Optional[asyncio.AbstractEventLoop] = None
+
+        async def drive():
+            nonlocal loop
+            loop = asyncio.get_running_loop()
+            try:
+                # aclosing: anulowanie w slots.acquire() (poza generatorem) też zamyka paczkę i jej zadania
+                async with contextlib.aclosing(self.process_receipts_async(receipts, concurrency)) as stream:
+                    async for item in stream:
+                        await slots.acquire()
+                        results.put_nowait(item)
+            finally:
+                results.put_nowait(_DONE)
+
+        future = self.loop_thread.submit(drive())
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                loop.call_soon_threadsafe(slots.release)
+                yield item
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+                # Czekamy na zamknięcie paczki (anulowane zadania, zapis cache) - _DONE wkłada finally drive()
+                while loop is not None:
+                    try:
+                        if results.get(timeout=5.0) is _DONE:
+                            break
+                    except queue.Empty:
+                        logger.warning("Cancelled receipt batch did not close within 5s")
+                        break
+
+    def close(self):
+        """Zapisuje cache i zwalnia wątki robocze. Pętlę w tle zamyka shutdown_background_loop()."""
+        self.cache.save()
+        if self.staging is not None:
+            self.staging.save()
+        self.executor.shutdown(wait=True)
+        # Pula połączeń LLM żyje w pętli w tle - tam też musi zostać zamknięta
+        if isinstance(self.brain, (UniversalBrain, ProviderRouter)) and self.loop_thread.running:
+            try:
+                self.loop_thread.run(self.brain.aclose(), timeout=5)
+            except Exception as e:
+                logger.warning(f"Failed to close LLM client: {e}")
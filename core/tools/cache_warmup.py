@@ -0,0 +1,248 @@
+"""
+Rozgrzewanie ReceiptCache (i poczekalni taksonomii) historią paragonów z Postgresa.
+
+Wiersze `receipts` (raw_text + items_json) są czytane kursorem serwerowym porcjami,
+przechodzą przez ten sam preprocessing agentów co potok, a pozycje z items_json są
+parowane z liniami OCR (zgodna cena + podobna nazwa). Do cache trafiają tylko klucze
+kanoniczne, dla których historia jest zgodna. Co N-ty paragon jest odkładany do pomiaru:
+raport pokazuje trafienia cache na tych paragonach przed i po rozgrzaniu.
+
+    python -m core.tools.cache_warmup --limit 20000 --dry-run
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import ProjectConfig
+from utils.receipt_cache import ReceiptCache, ProductMatch, canonicalize_line, align_items
+from utils.taxonomy import StagingTaxonomy
+from utils.receipt_agents import detect_shop, get_agent, UNKNOWN_SHOP
+
+logger = logging.getLogger("CacheWarmup")
+
+# (shop_name, raw_text, items_json) - tak jak zwraca iter_receipt_rows()
+ReceiptRow = Tuple[Optional[str], str, Any]
+
+# Stare i nowe formaty items_json: {"name", "price"} (stats.py) albo pozycje potoku {"nazwa", "suma", ...}
+_ITEM_FIELDS = {
+    'nazwa': ('nazwa', 'name'),
+    'suma': ('suma', 'price', 'total'),
+    'cena_jedn': ('cena_jedn', 'unit_price'),
+    'kategoria': ('kategoria', 'category', 'cat'),
+    'jednostka': ('jednostka', 'unit'),
+}
+
+
+def iter_receipt_rows(batch_size: int = None, limit: int = None) -> Iterator[ReceiptRow]:
+    """
+    Strumieniuje historię z tabeli receipts kursorem serwerowym (stream_results + yield_per),
+    więc pamięć nie rośnie z rozmiarem tabeli.
+    """
+    from sqlalchemy import select
+    from core.database import engine, Receipt
+
+    query = (
+        select(Receipt.shop_name, Receipt.raw_text, Receipt.items_json)
+        .where(Receipt.raw_text.isnot(None), Receipt.items_json.isnot(None))
+        .order_by(Receipt.id)
+    )
+    if limit:
+        query = query.limit(limit)
+    batch_size = batch_size or ProjectConfig.WARMUP_BATCH_SIZE
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for shop_name, raw_text, items_json in result:
+            yield shop_name, raw_text, items_json
+
+
+def normalize_items(items_json: Any) -> List[Dict]:
+    """Pozycje z items_json w formacie potoku; wpisy-napisy (najstarszy format) nie mają cen i są pomijane."""
+    if isinstance(items_json, str):
+        try:
+            items_json = json.loads(items_json)
+        except ValueError:
+            return []
+    if isinstance(items_json, dict):
+        items_json = items_json.get('items', [])
+    if not isinstance(items_json, list):
+        return []
+
+    items = []
+    for raw in items_json:
+        if not isinstance(raw, dict):
+            continue
+        item = {}
+        for field_name, aliases in _ITEM_FIELDS.items():
+            item[field_name] = next((raw[a] for a in aliases if raw.get(a) not in (None, '')), None)
+        if item['nazwa']:
+            items.append(item)
+    return items
+
+
+@dataclass
+class WarmupReport:
+    receipts: int = 0
+    holdout_receipts: int = 0
+    lines: int = 0
+    aligned_lines: int = 0
+    candidates: int = 0 # unikalne (sklep, linia kanoniczna)
+    ambiguous: int = 0 # odrzucone: historia niezgodna co do produktu
+    entries: int = 0 # wpisy przyjęte do załadowania
+    keys_written: int = 0
+    hit_rate_before: float = 0.0
+    hit_rate_after: float = 0.0
+
+    @property
+    def hit_rate_gain(self) -> float:
+        return self.hit_rate_after - self.hit_rate_before
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'hit_rate_gain': round(self.hit_rate_gain, 4)}
+
+
+class CacheWarmer:
+    """
+    Zbiera głosy linia kanoniczna -> produkt z historycznych paragonów i ładuje do cache
+    tylko jednoznaczne wpisy (udział zwycięskiej nazwy >= min_agreement).
+    """
+
+    def __init__(self, cache: ReceiptCache, staging: Optional[StagingTaxonomy] = None,
+                 min_similarity: int = None, min_agreement: float = None,
+                 confidence: float = None, holdout_every: int = None):
+        self.cache = cache
+        self.staging = staging
+        self.min_similarity = min_similarity or ProjectConfig.WARMUP_MIN_SIMILARITY
+        self.min_agreement = ProjectConfig.WARMUP_MIN_AGREEMENT if min_agreement is None else min_agreement
+        self.confidence = ProjectConfig.WARMUP_CONFIDENCE if confidence is None else confidence
+        self.holdout_every = ProjectConfig.WARMUP_HOLDOUT_EVERY if holdout_every is None else holdout_every
+        self.report = WarmupReport()
+        # (sklep, linia kanoniczna) -> Counter[(nazwa, kategoria, jednostka)] i suma podobieństw
+        self._votes: Dict[Tuple[str, str], Counter] = {}
+        self._similarity: Dict[Tuple[str, str], float] = {}
+        self._holdout: List[Tuple[str, List[str]]] = []
+
+    @staticmethod
+    def receipt_lines(raw_text: str, shop_name: Optional[str] = None) -> Tuple[str, List[str]]:
+        """Sklep i linie produktowe dokładnie tak, jak widzi je potok przed zapytaniem do cache."""
+        shop = detect_shop(raw_text)
+        if shop == UNKNOWN_SHOP and shop_name:
+            shop = detect_shop(shop_name)
+        agent = get_agent(shop)
+        records = agent.parse_lines(agent.preprocess(raw_text))
+        return shop, [record.raw for record in records if not agent.is_non_product(record.raw)]
+
+    def add_receipt(self, shop_name: Optional[str], raw_text: str, items_json: Any):
+        if not raw_text or not raw_text.strip():
+            return
+        shop, lines = self.receipt_lines(raw_text, shop_name)
+        self.report.receipts += 1
+        self.report.lines += len(lines)
+
+        # Paragony odłożone do pomiaru nie uczą cache - inaczej zysk byłby zawyżony
+        if self.holdout_every and self.report.receipts % self.holdout_every == 0:
+            self.report.holdout_receipts += 1
+            self._holdout.append((shop, lines))
+            return
+
+        for line, item, similarity in align_items(normalize_items(items_json), lines, self.min_similarity):
+            canonical = canonicalize_line(line)
+            if not canonical:
+                continue
+            key = (shop, canonical)
+            product = (item['nazwa'], (item.get('kategoria') or 'INNE').upper(), item.get('jednostka') or 'szt')
+            self._votes.setdefault(key, Counter())[product] += 1
+            self._similarity[key] = self._similarity.get(key, 0.0) + similarity
+            self.report.aligned_lines += 1
+
+    def entries(self) -> Iterator[Tuple[str, ProductMatch, str, int]]:
+        """Jednoznaczne wpisy: (linia kanoniczna, dopasowanie, sklep, liczba głosów)."""
+        for (shop, canonical), votes in self._votes.items():
+            (name, category, unit), count = votes.most_common(1)[0]
+            total = sum(votes.values())
+            agreement = count / total
+            if agreement < self.min_agreement:
+                self.report.ambiguous += 1
+                continue
+            mean_similarity = self._similarity[(shop, canonical)] / total
+            confidence = self.confidence * agreement * mean_similarity / 100.0
+            match = ProductMatch(name=name, category=category, unit=unit,
+                                 confidence=round(confidence, 3), source="history")
+            yield canonical, match, shop, count
+
+    def hit_rate(self) -> float:
+        """Udział linii z odłożonych paragonów, które cache rozpoznaje."""
+        lookups = hits = 0
+        for shop, lines in self._holdout:
+            for line in lines:
+                lookups += 1
+                hits += self.cache.lookup(line, shop) is not None
+        return hits / lookups if lookups else 0.0
+
+    def run(self, rows: Iterable[ReceiptRow], dry_run: bool = False) -> WarmupReport:
+        for shop_name, raw_text, items_json in rows:
+            self.add_receipt(shop_name, raw_text, items_json)
+            if self.report.receipts % 1000 == 0:
+                logger.info(f"Scanned {self.report.receipts} receipts, {len(self._votes)} candidates")
+
+        self.report.candidates = len(self._votes)
+        self.report.hit_rate_before = self.hit_rate()
+        entries = list(self.entries())
+        self.report.entries = len(entries)
+        if dry_run:
+            return self.report
+
+        self.report.keys_written = self.cache.bulk_load((c, m, shop) for c, m, shop, _ in entries)
+        self.cache.save()
+        if self.staging is not None:
+            for canonical, match, _, count in entries:
+                self.staging.add(canonical, match.name, match.category, match.unit, match.confidence,
+                                 source="history", seen=count)
+            self.staging.save()
+        self.report.hit_rate_after = self.hit_rate()
+        logger.info(f"Warm-up loaded {self.report.entries} entries ({self.report.keys_written} keys), "
+                    f"holdout hit rate {self.report.hit_rate_before:.2%} -> {self.report.hit_rate_after:.2%}")
+        return self.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, help="Najwyżej tyle paragonów z bazy")
+    parser.add_argument("--batch-size", type=int, default=ProjectConfig.WARMUP_BATCH_SIZE)
+    parser.add_argument("--min-similarity", type=int, default=ProjectConfig.WARMUP_MIN_SIMILARITY)
+    parser.add_argument("--min-agreement", type=float, default=ProjectConfig.WARMUP_MIN_AGREEMENT)
+    parser.add_argument("--holdout-every", type=int, default=ProjectConfig.WARMUP_HOLDOUT_EVERY,
+                        help="Co N-ty paragon tylko do pomiaru trafień (0 = bez pomiaru)")
+    parser.add_argument("--no-staging", action="store_true", help="Nie zapisuj wpisów do poczekalni taksonomii")
+    parser.add_argument("--dry-run", action="store_true", help="Tylko policz kandydatów, bez zapisu")
+    parser.add_argument("--json", help="Zapisz raport do pliku JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    cache = ReceiptCache()
+    warmer = CacheWarmer(
+        cache,
+        staging=None if args.no_staging else StagingTaxonomy(),
+        min_similarity=args.min_similarity,
+        min_agreement=args.min_agreement,
+        holdout_every=args.holdout_every,
+    )
+    try:
+        report = warmer.run(iter_receipt_rows(args.batch_size, args.limit), dry_run=args.dry_run)
+    finally:
+        cache.close()
+
+    print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from pathlib import Path
 from datetime import datetime
 from config import ProjectConfig
 from utils.receipt_agents import detect_shop
+from utils.metrics import METRICS
 
 # Import Pipeline (jeśli dostępny)
 try:
@@ -22,55 +23,88 @@ class ReceiptSanitizer:
     def run_batch(self):
         """Skanuje folder wejsciowy i przetwarza paragony"""
         print(f"Scanning {self.vault_path}...")
-        count = 0
+        if not self.pipeline:
+            print("Pipeline unavailable.")
+            return
+
+        notes = []
         for file_path in self.vault_path.glob("**/*.md"):
-            if self.sanitize_file(file_path):
-                print(f"Processed: {file_path.name}")
-                count += 1
+            note = self._read_note(file_path)
+            if note:
+                notes.append(note)
+
+        count = self._process_notes(notes)
         print(f"Total processed: {count}")
+        if METRICS.enabled and count:
+            METRICS.export()
+
+    def _process_notes(self, notes) -> int:
+        count = 0
+        receipts = [(ocr_text, shop) for _, _, ocr_text, shop in notes]
+        for index, result in self.pipeline.process_receipts_sync(receipts):
+            file_path, content, _, shop = notes[index]
+            if isinstance(result, Exception):
+                print(f"Pipeline error ({file_path.name}): {result}")
+                continue
+            self._write_note(file_path, content, shop, result)
+            print(f"Processed: {file_path.name}")
+            count += 1
+        return count
 
     def sanitize_file(self, file_path: Path) -> bool:
+        note = self._read_note(file_path)
+        if not note:
+            return False
+        _, content, ocr_text, shop = note
+
+        # Wywołanie Pipeline
+        if self.pipeline:
+            print(f"Processing receipt from {shop} via Pipeline...")
+            try:
+                result = self.pipeline.process_receipt_sync(ocr_text, shop)
+            except Exception as e:
+                print(f"Pipeline error: {e}")
+                return False
+        else:
+            print("Pipeline unavailable.")
+            return False
+
+        self._write_note(file_path, content, shop, result)
+        return True
+
+    def _read_note(self, file_path: Path):
+        """Zwraca (ścieżka, treść, OCR, sklep) dla notatek do weryfikacji, inaczej None."""
         # Odczyt pliku
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
 
         if "to-verify" not in content:
             print(f"Skipping {file_path.name}: 'to-verify' tag not found")
-            return False
-            
+            return None
+
         if "## 📜 Oryginalny OCR" not in content:
             print(f"Skipping {file_path.name}: OCR section not found")
-            return False
+            return None
 
         # Wyciągnij OCR
         ocr_match = re.search(r'## 📜 Oryginalny OCR\s*\n(.*?)(?=\n#|\Z)', content, re.DOTALL)
-        if not ocr_match: return False
+        if not ocr_match: return None
         ocr_text = ocr_match.group(1).strip()
         shop = detect_shop(ocr_text)
+        return file_path, content, ocr_text, shop
 
-        # Wywołanie Pipeline
-        data = {}
-        if self.pipeline:
-            print(f"Processing receipt from {shop} via Pipeline...")
-            try:
-                result = self.pipeline.process_receipt_sync(ocr_text, shop)
-                data = {
-                    'items': result.get('items', []),
-                    'date': result.get('date'),
-                    'total': result.get('total_amount', 0),
-                    'shop': shop
-                }
-            except Exception as e:
-                print(f"Pipeline error: {e}")
-                return False
-        else:
-            print("Pipeline unavailable.")
-            return False
+    def _write_note(self, file_path: Path, content: str, shop: str, result: dict):
+        data = {
+            'items': result.get('items', []),
+            'date': result.get('date'),
+            'total': result.get('total_amount', 0),
+            'shop': shop
+        }
 
         # Aktualizacja treści notatki (Tabela Markdown + JSON)
         items = data.get('items', [])
         new_table = self._markdown_table_from_items(items)
-        
+
         # Wstawienie tabeli (jeśli już jest sekcja Produkty, podmienia, jeśli nie - dodaje)
         if "## 🛒 Produkty" in content:
              # Prosta podmiana sekcji nie jest trywialna regexem bez usuwania reszty, 
@@ -81,24 +115,22 @@ class ReceiptSanitizer:
             insert_point = content.find("## 📜 Oryginalny OCR")
             if insert_point != -1:
                 content = content[:insert_point] + f"## 🛒 Produkty\n{new_table}\n\n" + content[insert_point:]
-        
+
         # Wstawienie JSONa z danymi strukturalnymi na koniec (lub aktualizacja)
         json_str = json.dumps(data, indent=2, ensure_ascii=False)
         json_block = f"\n## 🛠️ Dane Strukturalne (JSON)\n```json\n{json_str}\n```\n"
-        
+
         # Dodajemy na koniec pliku
         content += json_block
-        
+
         # Zmiana tagów i statusu
         content = content.replace("#to-verify", "#manual-verify")
         # Jeśli był status
         content = re.sub(r'status:.*', 'status: waiting-for-user', content)
-        
+
         # Zapis
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(content)
-            
-        return True
 
     def _markdown_table_from_items(self, items):
         md = "| Produkt | Ilość | Cena jedn. | Suma | Kategoria |\n|---|---|---|---|---|\n"
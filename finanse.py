@@ -6,7 +6,10 @@ import io
 # import psycopg2 (Removed)
 from core.database import SessionLocal, Receipt
 from google.cloud import vision
-from pdf2image import convert_from_path
+from utils.pdf_ocr import ocr_pdf, vision_page_ocr, PDF_STATS
+from utils.clients import vision_client, openai_client
+from utils.image_prep import prepare_image
+from utils.ocr_cache import cached_ocr, image_key, pdf_key, get_ocr_cache
 # import ollama
 from dotenv import load_dotenv
 from datetime import datetime
@@ -17,38 +20,33 @@ load_dotenv()
 INPUT_DIR = "./inputs/paragony"
 ARCHIVE_DIR = "./archive"
 
+def _vision_text(content):
+    # Mniejszy obraz w skali szarości - mniej bajtów do wysłania i krótszy OCR
+    image = vision.Image(content=prepare_image(content))
+    response = vision_client().text_detection(image=image)
+    if response.error.message:
+        raise RuntimeError(f"Vision OCR error: {response.error.message}")
+    texts = response.text_annotations
+    if texts:
+        return texts[0].description
+    return ""
+
 def get_text_from_file(file_path):
-    """Google Vision API - OCR (Images & PDFs)"""
+    """Google Vision API - OCR (Images & PDFs); ten sam plik drugi raz - tekst z cache OCR"""
     ext = os.path.splitext(file_path)[1].lower()
     
     if ext == '.pdf':
         try:
-            images = convert_from_path(file_path)
-            client = vision.ImageAnnotatorClient()
-            full_text = ""
-            for image in images:
-                img_byte_arr = io.BytesIO()
-                image.save(img_byte_arr, format='JPEG')
-                content = img_byte_arr.getvalue()
-                vision_image = vision.Image(content=content)
-                response = client.text_detection(image=vision_image)
-                if response.text_annotations:
-                    full_text += response.text_annotations[0].description + "\n"
-            return full_text
+            # Strony renderowane pojedynczo i rozpoznawane równolegle, tekst w kolejności stron
+            return cached_ocr(pdf_key(file_path), lambda: ocr_pdf(file_path, vision_page_ocr(vision_client())))
         except Exception as e:
             print(f"⚠️ Błąd OCR PDF: {e}")
             return ""
     else:
         try:
-            client = vision.ImageAnnotatorClient()
             with open(file_path, "rb") as image_file:
                 content = image_file.read()
-            image = vision.Image(content=content)
-            response = client.text_detection(image=image)
-            texts = response.text_annotations
-            if texts:
-                return texts[0].description
-            return ""
+            return cached_ocr(image_key(content), lambda: _vision_text(content))
         except Exception as e:
             print(f"⚠️ Błąd OCR obrazu: {e}")
             return ""
@@ -58,8 +56,7 @@ get_text_from_image = get_text_from_file
 
 def parse_receipt_with_openai(ocr_text):
     """OpenAI (GPT-4o-mini) - Text to JSON Summary"""
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = openai_client()
     
     response = client.chat.completions.create(
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
@@ -99,8 +96,7 @@ def save_to_postgres(data, raw_text):
 
 def process_expense_text(text):
     """Przetwarza tekstowy opis wydatku (np. z Voice)"""
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = openai_client()
     
     prompt = f"""
     Przeanalizuj tekst i wyciągnij informację o wydatku.
@@ -161,6 +157,15 @@ def process_batch(verbose=False):
                 os.makedirs(ARCHIVE_DIR)
             shutil.move(full_path, os.path.join(ARCHIVE_DIR, f"{timestamp}_{file}"))
             processed_count += 1
+
+    if verbose and files:
+        pdf = PDF_STATS.snapshot()
+        if pdf['pages_text_layer'] or pdf['pages_ocr']:
+            print(f"📄 PDF: {pdf['pages_text_layer']} stron z warstwy tekstowej, {pdf['pages_ocr']} przez OCR "
+                  f"(~{pdf['estimated_seconds_saved']:.1f}s OCR mniej)")
+        cache = get_ocr_cache()
+        if cache and cache.hits:
+            print(f"♻️ OCR z cache: {cache.hits} plików (~{cache.saved_seconds:.1f}s)")
             
     return processed_count
 
@@ -1,35 +1,23 @@
 import os
 import json
-from pdf2image import convert_from_path
-from google.cloud import vision
+from utils.pdf_ocr import iter_pdf_text, vision_page_ocr
+from utils.clients import vision_client, openai_client
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
 
 def get_text_from_pdf(pdf_path):
-    print(f"Converting PDF to images: {pdf_path}")
-    images = convert_from_path(pdf_path)
-    client = vision.ImageAnnotatorClient()
+    print(f"OCR PDF page by page: {pdf_path}")
+    client = vision_client()
     full_text = ""
-    
-    for i, image in enumerate(images):
-        print(f"Processing page {i+1}...")
-        # Save image to bytes
-        import io
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        content = img_byte_arr.getvalue()
-        
-        vision_image = vision.Image(content=content)
-        response = client.text_detection(image=vision_image)
-        if response.text_annotations:
-            full_text += response.text_annotations[0].description + "\n"
-            
+    for page_no, text in iter_pdf_text(pdf_path, vision_page_ocr(client)):
+        print(f"Processing page {page_no}...")
+        if text:
+            full_text += text + "\n"
     return full_text
 
 def parse_with_ai(text):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = openai_client()
     from prompts import RECEIPT_SUMMARY_SYSTEM
     
     response = client.chat.completions.create(
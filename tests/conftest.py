@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ProjectConfig
+from utils.clients import CLIENTS
+from utils.ocr_cache import reset_ocr_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    """Każdy test tworzy klientów od nowa (łatki na vision/openai i atrapy nie przechodzą między testami)."""
+    CLIENTS.reset()
+    yield
+    CLIENTS.reset()
+
+
+@pytest.fixture(autouse=True)
+def isolated_ocr_cache(tmp_path, monkeypatch):
+    """Cache OCR w katalogu testu - wyniki atrap nie trafiają do data/ ani do kolejnych testów."""
+    monkeypatch.setattr(ProjectConfig, "OCR_CACHE_FILE", tmp_path / "ocr_cache.db")
+    reset_ocr_cache()
+    yield
+    reset_ocr_cache()
@@ -0,0 +1,71 @@
+import pytest
+import os
+import sys
+import json
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt_cache import ReceiptCache, ProductMatch
+from utils.taxonomy import StagingTaxonomy
+from core.tools.cache_warmup import CacheWarmer, normalize_items
+
+RECEIPT = """Biedronka
+Jeronimo Martins Polska S.A.
+PARAGON FISKALNY
+PIZZA HAWAJ {pizza} A
+KEFIR NAT 2,19 B
+SUMA PLN 33,48
+"""
+
+def history_row(pizza="29,99", kefir_name="Kefir Naturalny"):
+    items = [
+        {'nazwa': 'Pizza Hawajska', 'kategoria': 'gotowe', 'suma': float(pizza.replace(',', '.'))},
+        {'name': kefir_name, 'price': 2.19},
+        "stary format bez ceny",
+    ]
+    return ("Biedronka", RECEIPT.format(pizza=pizza), json.dumps(items))
+
+@pytest.fixture
+def cache(tmp_path):
+    return ReceiptCache(str(tmp_path / "cache.json"))
+
+def test_normalize_items_accepts_old_and_pipeline_formats():
+    items = normalize_items([{'name': 'Chleb', 'price': 3.5}, {'nazwa': 'Mleko', 'suma': 2.99, 'cena_jedn': 2.99}, "x"])
+    assert [(i['nazwa'], i['suma']) for i in items] == [('Chleb', 3.5), ('Mleko', 2.99)]
+    assert normalize_items('{"items": [{"name": "Ser", "price": 9.99}]}')[0]['nazwa'] == 'Ser'
+    assert normalize_items("not json") == []
+
+def test_warmup_loads_history_and_improves_holdout(cache, tmp_path):
+    staging = StagingTaxonomy(str(tmp_path / "staging.json"))
+    # Co 4. paragon (inna cena pizzy) tylko do pomiaru
+    rows = [history_row(pizza=f"{29 + i % 3},99") for i in range(8)]
+    report = CacheWarmer(cache, staging, holdout_every=4).run(rows)
+
+    assert report.receipts == 8 and report.holdout_receipts == 2
+    assert report.entries == 2 and report.ambiguous == 0
+    assert report.hit_rate_before == 0.0
+    assert report.hit_rate_after == 1.0
+
+    # Nowa cena, ten sam produkt - trafienie z klucza kanonicznego sklepu
+    match = cache.lookup("PIZZA HAWAJ 34,99 A", "BIEDRONKA")
+    assert match.name == "Pizza Hawajska" and match.category == "GOTOWE" and match.source == "history"
+    assert 0 < match.confidence <= 0.8
+    assert staging.mappings["PIZZA HAWAJ"]['source'] == "history"
+    assert staging.mappings["PIZZA HAWAJ"]['seen'] == 6
+
+def test_warmup_skips_ambiguous_lines_and_keeps_existing_entries(cache):
+    rows = [history_row(kefir_name="Kefir Naturalny"), history_row(kefir_name="Kefir Naturalny Bio")] * 2
+    known = ProductMatch(name="Pizza z cache", category="GOTOWE", unit="szt", confidence=1.0, source="fuzzy")
+    cache.update("PIZZA HAWAJ 10,00", known, "BIEDRONKA")
+
+    report = CacheWarmer(cache, min_agreement=0.8, holdout_every=0).run(rows)
+
+    assert report.ambiguous == 1 # kefir: 2 głosy na 2 różne nazwy
+    assert cache.lookup("KEFIR NAT 2,19 B", "BIEDRONKA") is None
+    assert cache.lookup("PIZZA HAWAJ 31,99", "BIEDRONKA").name == known.name
+
+def test_dry_run_does_not_write(cache):
+    report = CacheWarmer(cache, holdout_every=0).run([history_row()], dry_run=True)
+    assert report.entries == 2 and report.keys_written == 0
+    assert len(cache) == 0
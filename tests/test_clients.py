@@ -0,0 +1,89 @@
+import pytest
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import finanse
+from utils.clients import CLIENTS, ClientRegistry
+
+
+class FakeVision:
+    """Lokalna atrapa ImageAnnotatorClient."""
+
+    def __init__(self, text="PARAGON"):
+        self.text = text
+        self.closed = False
+
+    def text_detection(self, image):
+        annotation = MagicMock(description=self.text)
+        return MagicMock(text_annotations=[annotation], error=MagicMock(message=""))
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_is_created_once_across_threads():
+    created = []
+
+    def factory():
+        created.append(1)
+        return FakeVision()
+
+    registry = ClientRegistry({"vision": factory})
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get("vision"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert all(c is clients[0] for c in clients)
+
+def test_calls_on_nested_resources_are_counted():
+    openai = MagicMock()
+    openai.chat.completions.create.return_value = "ok"
+    openai.audio.transcriptions.create.side_effect = RuntimeError("429")
+    registry = ClientRegistry({"openai": lambda: openai})
+
+    client = registry.get("openai")
+    assert client.chat.completions.create(model="gpt-4o-mini") == "ok"
+    assert client.chat.completions.create(model="gpt-4o-mini") == "ok"
+    with pytest.raises(RuntimeError):
+        client.audio.transcriptions.create(file=b"")
+
+    stats = registry.stats()["openai"]
+    assert stats['calls'] == 3 and stats['errors'] == 1
+    assert stats['p50'] >= 0
+
+def test_client_calls_are_exported_per_client_stage(monkeypatch):
+    from utils.metrics import METRICS
+    monkeypatch.setattr(METRICS, "enabled", True)
+    METRICS.reset()
+    registry = ClientRegistry({"vision": FakeVision})
+    registry.get("vision").text_detection(image=None)
+
+    rows = [row for row in METRICS.snapshot() if row['stage'].startswith("client_call")]
+    METRICS.reset()
+    assert [(row['stage'], row['tier'], row['count']) for row in rows] == [("client_call.vision", "", 1)]
+
+def test_override_swaps_in_fake_for_receipt_ocr():
+    CLIENTS.override("vision", FakeVision("BIEDRONKA 12,99"))
+    with patch('builtins.open', new_callable=MagicMock) as mock_open:
+        mock_open.return_value.__enter__.return_value.read.side_effect = [b"jpeg 1", b"jpeg 2"]
+        assert finanse.get_text_from_file("a.jpg") == "BIEDRONKA 12,99"
+        assert finanse.get_text_from_file("b.jpg") == "BIEDRONKA 12,99"
+    assert CLIENTS.stats()["vision"]['calls'] == 2
+
+def test_close_releases_connections_and_unknown_client_fails():
+    fake = FakeVision()
+    registry = ClientRegistry({"vision": lambda: fake})
+    registry.get("vision")
+    registry.close()
+    assert fake.closed
+    with pytest.raises(KeyError):
+        registry.get("whisper")
@@ -36,6 +36,7 @@ def test_get_text_from_image_success(mock_env):
         mock_annotation = MagicMock()
         mock_annotation.description = "PARAGON 123"
         mock_client.text_detection.return_value.text_annotations = [mock_annotation]
+        mock_client.text_detection.return_value.error.message = ""
         
         with patch('builtins.open', new_callable=MagicMock) as mock_open:
             # Mock file read to return bytes
@@ -70,3 +71,25 @@ def test_process_batch_success(mock_env):
         assert count == 1
         mock_save.assert_called_once()
         mock_move.assert_called_once()
+
+def test_get_text_from_pdf_ocr_pages_in_order(mock_env):
+    from PIL import Image
+    from utils import pdf_ocr
+
+    def fake_convert(path, dpi=200, first_page=None, last_page=None):
+        return [Image.new("RGB", (10 * first_page, 10), "white")]
+
+    with patch('finanse.vision.ImageAnnotatorClient') as MockClient, \
+         patch.object(pdf_ocr, 'convert_from_path', side_effect=fake_convert), \
+         patch.object(pdf_ocr, 'page_count', return_value=3):
+        def detect(image):
+            import io
+            annotation = MagicMock()
+            annotation.description = f"STRONA {Image.open(io.BytesIO(image.content)).width // 10}"
+            return MagicMock(text_annotations=[annotation], error=MagicMock(message=""))
+
+        MockClient.return_value.text_detection.side_effect = detect
+        text = finanse.get_text_from_file("faktura.pdf")
+
+    assert text == "STRONA 1\nSTRONA 2\nSTRONA 3\n"
+    MockClient.assert_called_once()
@@ -0,0 +1,59 @@
+import pytest
+import os
+import sys
+import io
+from PIL import Image, ImageDraw
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_prep import PrepParams, prepare_image, prepare_page, content_bbox
+
+
+def receipt_photo(size=(3000, 4000), box=(900, 600, 2100, 3400), noise=True):
+    """Zdjęcie paragonu: szare tło, biały paragon z liniami "tekstu", szum jak z aparatu."""
+    image = Image.effect_noise(size, 12).convert("RGB") if noise else Image.new("RGB", size, (120, 110, 100))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(box, fill=(245, 245, 240))
+    for y in range(box[1] + 60, box[3] - 60, 90):
+        draw.rectangle((box[0] + 60, y, box[2] - 200, y + 30), fill=(20, 20, 20))
+    return image
+
+def to_bytes(image, image_format="JPEG", **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **kwargs)
+    return buffer.getvalue()
+
+def test_large_photo_is_downscaled_to_grayscale_and_smaller():
+    original = to_bytes(receipt_photo(), quality=95)
+    prepared = prepare_image(original, PrepParams(max_side=1600))
+
+    image = Image.open(io.BytesIO(prepared))
+    assert image.mode == "L" and max(image.size) <= 1600
+    assert len(prepared) < len(original) / 2
+
+def test_crop_to_text_on_white_page():
+    page = Image.new("RGB", (1200, 1600), "white")
+    ImageDraw.Draw(page).rectangle((300, 200, 700, 900), fill="black")
+    left, top, right, bottom = content_bbox(page)
+    assert left <= 300 and top <= 200 and right >= 700 and bottom >= 900
+    assert (right - left) * (bottom - top) < 0.4 * 1200 * 1600
+
+def test_blank_page_is_not_cropped():
+    assert content_bbox(Image.new("L", (800, 800), 255)) is None
+
+def test_rendered_pdf_page_uses_png_and_photo_uses_jpeg():
+    page = Image.new("RGB", (1000, 1400), "white")
+    ImageDraw.Draw(page).text((100, 100), "RAZEM 148,99", fill="black")
+    assert prepare_page(page, PrepParams()).startswith(b"\x89PNG")
+    assert prepare_page(receipt_photo((800, 1000), (200, 100, 600, 900)), PrepParams()).startswith(b"\xff\xd8")
+
+def test_unreadable_or_already_small_input_is_sent_unchanged():
+    assert prepare_image(b"not an image") == b"not an image"
+    tiny = to_bytes(Image.new("L", (40, 40), 255), "PNG")
+    assert prepare_image(tiny, PrepParams()) == tiny
+    assert prepare_image(b"x", PrepParams(enabled=False)) == b"x"
+
+def test_params_key_tracks_settings():
+    assert PrepParams().key() != PrepParams(max_side=1024).key()
+    assert PrepParams(enabled=False).key() == "raw"
@@ -0,0 +1,260 @@
+import pytest
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapters.http_provider import ProviderError
+from adapters.ollama.ollama_adapter import OllamaProvider
+from adapters.google.gemini_adapter import GeminiProvider, UniversalBrain
+from adapters.response_cache import LLMResponseCache
+from utils.loop_thread import BackgroundLoop
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Lokalny serwer udający Ollamę i Gemini; `failures` to kolejka kodów błędów do zwrócenia najpierw."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.requests = []
+        self.failures = []
+        self.ports = set()
+        self.delay = 0.0
+        self.html = None # treść strony HTML zwracanej z kodem 200 (np. proxy)
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests.append((self.path, body, dict(self.headers)))
+            server.ports.add(self.client_address[1])
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            failure = server.failures.pop(0) if server.failures else None
+        try:
+            time.sleep(server.delay)
+            if failure:
+                return self._send(failure, '{"error": "busy"}')
+            if server.html is not None:
+                return self._send(200, server.html, "text/html")
+            if self.path == "/api/chat":
+                return self._ollama(body)
+            if ":streamGenerateContent" in self.path:
+                events = "".join(
+                    f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': t}]}}]})}\n\n"
+                    for t in ('{"items": ', '[]}')
+                )
+                return self._send(200, events, "text/event-stream")
+            if ":generateContent" in self.path:
+                text = body['contents'][0]['parts'][0]['text']
+                return self._send(200, json.dumps({'candidates': [{'content': {'parts': [{'text': text.upper()}]}}]}))
+            self._send(404, '{"error": "not found"}')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _ollama(self, body):
+        user = body['messages'][-1]['content']
+        if not body['stream']:
+            return self._send(200, json.dumps({'message': {'role': 'assistant', 'content': f"echo:{user}"}, 'done': True}))
+        chunks = [{'message': {'content': part}, 'done': False} for part in ("echo", ":", user)]
+        chunks.append({'message': {'content': ''}, 'done': True})
+        self._send(200, "".join(json.dumps(c) + "\n" for c in chunks), "application/x-ndjson")
+
+
+@pytest.fixture
+def server():
+    server = FakeLLMServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_ollama(server, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    return OllamaProvider(server.url, **kwargs)
+
+def test_ollama_chat_payload_and_keepalive(server):
+    provider = make_ollama(server)
+
+    async def run():
+        results = [await provider.generate(f"OCR {i}", "SYSTEM", "json", "bielik") for i in range(5)]
+        await provider.aclose()
+        return results
+
+    assert asyncio.run(run()) == [f"echo:OCR {i}" for i in range(5)]
+    path, body, _ = server.requests[0]
+    assert path == "/api/chat"
+    assert body['model'] == "bielik" and body['format'] == "json" and body['stream'] is False
+    assert body['messages'] == [{'role': 'system', 'content': 'SYSTEM'}, {'role': 'user', 'content': 'OCR 0'}]
+    # Pięć zapytań po kolei = jedno połączenie keep-alive
+    assert len(server.ports) == 1
+
+def test_connection_pool_is_closed_with_its_event_loop(server):
+    provider = make_ollama(server)
+    clients = []
+
+    async def call():
+        await provider.generate("OCR", "SYSTEM", "json", "bielik")
+        clients.append(provider._client)
+
+    # Koniec asyncio.run zamyka pulę tej pętli
+    asyncio.run(call())
+    assert clients[0].is_closed
+
+    # Zmiana pętli przy wciąż działającej poprzedniej - stara pula zamykana w swojej pętli
+    background = BackgroundLoop("test-provider-loop")
+    background.run(call())
+    asyncio.run(call())
+    deadline = time.time() + 2
+    while not clients[1].is_closed and time.time() < deadline:
+        time.sleep(0.01)
+    assert clients[1].is_closed and clients[2].is_closed
+    background.shutdown()
+
+def test_pool_of_a_stopped_loop_does_not_block_aclose(server, caplog):
+    provider = make_ollama(server)
+    stopped = asyncio.new_event_loop()
+    try:
+        # Pętla zatrzymana bez anulowania zadań - zlecenie zamknięcia nigdy by się w niej nie wykonało
+        stopped.run_until_complete(provider.generate("OCR", "SYSTEM", "json", "bielik"))
+        start = time.perf_counter()
+        asyncio.run(provider.aclose())
+        assert time.perf_counter() - start < 1
+        assert provider._client is None
+        assert "event loop stopped before its connection pool was closed" in caplog.text
+    finally:
+        tasks = asyncio.all_tasks(stopped)
+        for task in tasks:
+            task.cancel()
+        stopped.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        stopped.close()
+
+def test_aclose_from_another_loop_waits_for_the_pool_to_close(server):
+    provider = make_ollama(server)
+    background = BackgroundLoop("test-provider-loop")
+    try:
+        background.run(provider.generate("OCR", "SYSTEM", "json", "bielik"))
+        client = provider._client
+        asyncio.run(provider.aclose())
+        assert client.is_closed
+    finally:
+        background.shutdown()
+
+def test_non_json_200_body_raises_provider_error(server):
+    server.html = "<html><body>502 Bad Gateway (proxy)</body></html>"
+    provider = make_ollama(server, retries=3)
+    with pytest.raises(ProviderError) as error:
+        asyncio.run(provider.generate("OCR", "S", "json", "m"))
+    assert error.value.status == 200 and "Invalid JSON" in str(error.value)
+    assert provider.stats['requests'] == 1 and provider.stats['failures'] == 1
+
+def test_ollama_stream_yields_chunks_in_order(server):
+    provider = make_ollama(server)
+
+    async def run():
+        return [chunk async for chunk in provider.stream("OCR", "SYSTEM", "text", "llama3")]
+
+    assert asyncio.run(run()) == ["echo", ":", "OCR"]
+    assert 'format' not in server.requests[0][1]
+
+def test_retries_transient_errors_then_succeeds(server):
+    server.failures = [503, 429]
+    provider = make_ollama(server, retries=3)
+    assert asyncio.run(provider.generate("OCR", "S", "json", "m")) == "echo:OCR"
+    assert provider.stats['retries'] == 2 and provider.stats['requests'] == 3
+
+def test_client_errors_and_exhausted_retries_raise(server):
+    server.failures = [400]
+    provider = make_ollama(server, retries=3)
+    with pytest.raises(ProviderError) as error:
+        asyncio.run(provider.generate("OCR", "S", "json", "m"))
+    assert error.value.status == 400 and not error.value.retryable
+    assert provider.stats['requests'] == 1
+
+    server.failures = [503] * 3
+    with pytest.raises(ProviderError):
+        asyncio.run(make_ollama(server, retries=2).generate("OCR", "S", "json", "m"))
+
+def test_connection_refused_is_retried(server):
+    server.shutdown()
+    server.server_close()
+    provider = make_ollama(server, retries=1)
+    with pytest.raises(ProviderError) as error:
+        asyncio.run(provider.generate("OCR", "S", "json", "m"))
+    assert error.value.retryable and provider.stats['retries'] == 1
+
+def test_backoff_is_jittered_and_capped():
+    provider = OllamaProvider("http://localhost", backoff_base=1.0, backoff_max=4.0)
+    delays = [provider.backoff(5) for _ in range(200)]
+    assert all(0 <= d <= 4.0 for d in delays) and len(set(delays)) > 100
+    assert provider.backoff(0, retry_after=2.5) == 2.5
+
+def test_semaphore_limits_parallel_requests(server):
+    server.delay = 0.05
+    provider = make_ollama(server, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(provider.generate(f"OCR {i}", "S", "json", "m") for i in range(6)))
+
+    assert len(asyncio.run(run())) == 6
+    assert server.peak == 2
+
+def test_gemini_rest_generate_and_stream(server):
+    provider = GeminiProvider(api_key="KEY", base_url=server.url)
+
+    async def run():
+        text = await provider.generate("ocr", "system", "json", "gemini-pro")
+        streamed = [chunk async for chunk in provider.stream("ocr", "system", "json", "gemini-pro")]
+        return text, streamed
+
+    text, streamed = asyncio.run(run())
+    assert text == "SYSTEM\n\nOCR"
+    assert "".join(streamed) == '{"items": []}'
+    path, _, headers = server.requests[0]
+    assert path == "/models/gemini-pro:generateContent"
+    assert {k.lower(): v for k, v in headers.items()}['x-goog-api-key'] == "KEY"
+    assert server.requests[1][0] == "/models/gemini-pro:streamGenerateContent?alt=sse"
+
+def test_brain_streams_through_response_cache(server, tmp_path):
+    brain = UniversalBrain(provider="ollama", response_cache=LLMResponseCache(str(tmp_path / "llm.db")),
+                           backend=make_ollama(server))
+
+    async def collect():
+        return "".join([chunk async for chunk in brain.stream_content_async("OCR", "S", "text", model_name="m")])
+
+    # Odpowiedź atrapy to nie JSON - format "text", bo JSON trafia do cache dopiero po walidacji
+    assert asyncio.run(collect()) == "echo:OCR"
+    assert asyncio.run(collect()) == "echo:OCR"
+    assert asyncio.run(brain.generate_content_async("OCR", "S", "text", model_name="m")) == "echo:OCR"
+    assert len(server.requests) == 1
+    assert brain.cache_stats()['hits'] == 2
@@ -0,0 +1,50 @@
+import pytest
+import os
+import sys
+import asyncio
+import threading
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.loop_thread import BackgroundLoop
+
+@pytest.fixture
+def background():
+    loop = BackgroundLoop("test-loop")
+    yield loop
+    loop.shutdown()
+
+def test_coroutines_share_one_loop_thread(background):
+    async def whoami():
+        await asyncio.sleep(0)
+        return threading.current_thread().name, asyncio.get_running_loop()
+
+    first = background.run(whoami())
+    futures = [background.submit(whoami()) for _ in range(5)]
+
+    assert first[0] == "test-loop"
+    assert all(f.result(5) == first for f in futures)
+
+def test_run_from_loop_thread_is_rejected(background):
+    async def nested():
+        background.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        background.run(nested())
+
+def test_shutdown_cancels_pending_work_and_restarts(background):
+    started = threading.Event()
+
+    async def forever():
+        started.set()
+        await asyncio.sleep(3600)
+
+    future = background.submit(forever())
+    started.wait(5)
+    thread = background._thread
+    background.shutdown()
+
+    assert future.cancelled()
+    assert not thread.is_alive()
+    assert background.run(asyncio.sleep(0, result="again")) == "again"
@@ -0,0 +1,44 @@
+import pytest
+import os
+import sys
+import json
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import LatencyRecorder, quantiles
+
+def test_quantiles_nearest_rank():
+    values = quantiles([i * 1_000_000 for i in range(1, 101)])
+    assert values[0.5] == pytest.approx(0.050)
+    assert values[0.95] == pytest.approx(0.095)
+    assert values[0.99] == pytest.approx(0.099)
+
+def test_spans_feed_histograms_and_sink():
+    metrics = LatencyRecorder(enabled=True)
+    timings = {}
+    for _ in range(3):
+        with metrics.span("fuzzy", "BIEDRONKA", sink=timings):
+            pass
+    metrics.observe("total", 0.25, "BIEDRONKA", "ai")
+
+    snapshot = {(s['stage'], s['tier']): s for s in metrics.snapshot()}
+    assert snapshot[("fuzzy", "")]['count'] == 3
+    assert snapshot[("total", "ai")]['p99'] == pytest.approx(0.25)
+    assert set(timings) == {"fuzzy"}
+
+    text = metrics.to_prometheus()
+    assert '# TYPE receipt_stage_seconds summary' in text
+    assert 'receipt_stage_seconds{stage="total",shop="BIEDRONKA",tier="ai",quantile="0.95"} 0.250000000' in text
+    assert 'receipt_stage_seconds_count{stage="fuzzy",shop="BIEDRONKA",tier=""} 3' in text
+
+def test_disabled_recorder_is_a_no_op(tmp_path):
+    metrics = LatencyRecorder(enabled=False)
+    timings = {}
+    with metrics.span("ai", sink=timings):
+        pass
+    metrics.observe("total", 1.0)
+
+    assert metrics.snapshot() == [] and timings == {}
+    metrics.export(str(tmp_path))
+    assert json.loads((tmp_path / "metrics.json").read_text())['stages'] == []
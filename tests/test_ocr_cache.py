@@ -0,0 +1,144 @@
+import pytest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import finanse
+from config import ProjectConfig
+from utils.clients import CLIENTS
+from utils import pdf_ocr
+from utils.ocr_cache import OCRCache, PartialText, get_ocr_cache, image_key, pdf_key
+
+
+class CountingVision:
+    def __init__(self, text="LIDL\nRAZEM 12,99"):
+        self.text = text
+        self.error = ""
+        self.calls = 0
+
+    def text_detection(self, image):
+        self.calls += 1
+        return MagicMock(text_annotations=[MagicMock(description=self.text)] if self.text else [],
+                         error=MagicMock(message=self.error))
+
+
+@pytest.fixture
+def vision():
+    fake = CountingVision()
+    CLIENTS.override("vision", fake)
+    return fake
+
+def write(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+def test_same_photo_twice_calls_vision_once(tmp_path, vision):
+    first = write(tmp_path / "photo.jpg", b"jpeg bytes")
+    again = write(tmp_path / "photo_resent.jpg", b"jpeg bytes")
+
+    assert finanse.get_text_from_file(first) == "LIDL\nRAZEM 12,99"
+    assert finanse.get_text_from_image(again) == "LIDL\nRAZEM 12,99"
+    assert vision.calls == 1
+    assert get_ocr_cache().stats()['hits'] == 1
+
+def test_cache_survives_restart_and_prep_params_change_the_key(tmp_path, vision, monkeypatch):
+    path = write(tmp_path / "photo.jpg", b"jpeg bytes")
+    finanse.get_text_from_file(path)
+    get_ocr_cache().close()
+
+    reopened = OCRCache()
+    assert reopened.get(image_key(b"jpeg bytes")) == "LIDL\nRAZEM 12,99"
+    monkeypatch.setattr(ProjectConfig, "IMAGE_PREP_MAX_SIDE", 1024)
+    assert reopened.get(image_key(b"jpeg bytes")) is None
+    reopened.close()
+
+def test_empty_ocr_result_is_not_cached(tmp_path, vision):
+    vision.text = ""
+    path = write(tmp_path / "blank.jpg", b"blank")
+    assert finanse.get_text_from_file(path) == ""
+    assert finanse.get_text_from_file(path) == ""
+    assert vision.calls == 2
+
+def test_vision_error_is_not_cached(tmp_path, vision):
+    vision.error = "Resource has been exhausted"
+    path = write(tmp_path / "photo.jpg", b"jpeg bytes")
+    assert finanse.get_text_from_file(path) == ""
+
+    vision.error = ""
+    assert finanse.get_text_from_file(path) == "LIDL\nRAZEM 12,99"
+    assert vision.calls == 2
+
+class SecondPageVision(CountingVision):
+    """Strona 2 (obraz szerokości 40 px) pusta albo z błędem Vision, reszta z tekstem."""
+
+    def __init__(self, second_page_error=""):
+        super().__init__()
+        self.second_page_error = second_page_error
+
+    def text_detection(self, image):
+        import io
+        from PIL import Image
+        second = Image.open(io.BytesIO(image.content)).width == 40
+        self.text = "" if second else "LIDL\nRAZEM 12,99"
+        self.error = self.second_page_error if second else ""
+        return super().text_detection(image)
+
+
+@pytest.fixture
+def two_page_scan(tmp_path, monkeypatch):
+    from PIL import Image
+    monkeypatch.setattr(ProjectConfig, "PDF_TEXT_LAYER", False)
+    monkeypatch.setattr(pdf_ocr, "page_count", lambda path: 2)
+    monkeypatch.setattr(pdf_ocr, "convert_from_path", lambda path, dpi=200, first_page=None, last_page=None:
+                        [Image.new("RGB", (20 * first_page, 20), "white")])
+    return write(tmp_path / "faktura.pdf", b"%PDF-1.4 scan")
+
+def test_pdf_with_failed_page_is_not_cached(two_page_scan, vision):
+    # Błąd Vision na każdej stronie - brak wyniku, nic w cache
+    vision.error = "Bad image data"
+    assert finanse.get_text_from_file(two_page_scan) == ""
+    assert get_ocr_cache().get(pdf_key(two_page_scan)) is None
+
+    # Błąd na jednej stronie - tekst pozostałych wraca, ale nie zostaje w cache na stałe
+    CLIENTS.override("vision", SecondPageVision("Resource has been exhausted"))
+    text = finanse.get_text_from_file(two_page_scan)
+    assert text == "LIDL\nRAZEM 12,99\n" and isinstance(text, PartialText)
+    assert get_ocr_cache().get(pdf_key(two_page_scan)) is None
+
+def test_pdf_with_blank_page_is_cached(two_page_scan):
+    vision = SecondPageVision()
+    CLIENTS.override("vision", vision)
+
+    assert finanse.get_text_from_file(two_page_scan) == "LIDL\nRAZEM 12,99\n"
+    assert finanse.get_text_from_file(two_page_scan) == "LIDL\nRAZEM 12,99\n"
+    assert vision.calls == 2 # obie strony raz, drugi odczyt z cache
+
+def test_disabled_cache_always_calls_vision(tmp_path, vision, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "OCR_CACHE_ENABLED", False)
+    path = write(tmp_path / "photo.jpg", b"jpeg bytes")
+    finanse.get_text_from_file(path)
+    finanse.get_text_from_file(path)
+    assert vision.calls == 2
+
+def test_pdf_key_depends_on_content_and_missing_file_is_not_cached(tmp_path):
+    a = write(tmp_path / "a.pdf", b"%PDF-1.4 a")
+    b = write(tmp_path / "b.pdf", b"%PDF-1.4 a")
+    c = write(tmp_path / "c.pdf", b"%PDF-1.4 c")
+    assert pdf_key(a) == pdf_key(b) != pdf_key(c)
+    assert pdf_key(str(tmp_path / "missing.pdf")) is None
+
+def test_size_limit_evicts_least_recently_used(tmp_path):
+    cache = OCRCache(str(tmp_path / "ocr.db"), max_bytes=2500)
+    for name in ("a", "b"):
+        cache.put(name, name * 1000, 1.0)
+    cache.get("a")
+    cache.store.flush()
+    cache.put("c", "c" * 1000, 1.0)
+
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.get("b") is None
+    assert cache.stats()['bytes'] <= 2500
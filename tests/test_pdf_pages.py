@@ -0,0 +1,143 @@
+import pytest
+import os
+import sys
+import time
+import threading
+from PIL import Image
+from pypdf import PdfWriter
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import pdf_ocr
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "invoice.pdf"
+    writer = PdfWriter()
+    for _ in range(6):
+        writer.add_blank_page(width=200, height=300)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Atrapa pdf2image: zapisuje wywołania, strona N to obraz o szerokości N px."""
+    calls = []
+
+    def fake_convert(path, dpi=200, first_page=None, last_page=None):
+        calls.append((first_page, last_page, dpi))
+        return [Image.new("RGB", (first_page, 10), "white")]
+
+    monkeypatch.setattr(pdf_ocr, "convert_from_path", fake_convert)
+    monkeypatch.setattr(pdf_ocr, "PDF2IMAGE_AVAILABLE", True)
+    return calls
+
+def page_ocr(delay_for=lambda page: 0.0, active=None):
+    lock = threading.Lock()
+
+    def ocr(content):
+        import io
+        page = Image.open(io.BytesIO(content)).width
+        if active is not None:
+            with lock:
+                active['now'] += 1
+                active['peak'] = max(active['peak'], active['now'])
+        time.sleep(delay_for(page))
+        if active is not None:
+            with lock:
+                active['now'] -= 1
+        return f"strona {page}"
+
+    return ocr
+
+def test_pages_are_rendered_one_by_one_at_configured_dpi(pdf, renders):
+    assert pdf_ocr.page_count(pdf) == 6
+    text = pdf_ocr.ocr_pdf(pdf, page_ocr(), dpi=150, workers=2)
+
+    assert text == "".join(f"strona {n}\n" for n in range(1, 7))
+    assert sorted(renders) == [(n, n, 150) for n in range(1, 7)]
+
+def test_output_keeps_page_order_and_concurrency_is_bounded(pdf, renders):
+    active = {'now': 0, 'peak': 0}
+    # Pierwsze strony najwolniejsze - kończą się po późniejszych
+    pages = list(pdf_ocr.iter_pdf_text(pdf, page_ocr(lambda page: 0.06 - page * 0.01, active), workers=3))
+
+    assert [page for page, _ in pages] == [1, 2, 3, 4, 5, 6]
+    assert [text for _, text in pages] == [f"strona {n}" for n in range(1, 7)]
+    assert active['peak'] <= 3
+
+def test_stopping_early_does_not_render_remaining_pages(pdf, renders):
+    stream = pdf_ocr.iter_pdf_text(pdf, page_ocr(), workers=2)
+    assert next(stream) == (1, "strona 1")
+    stream.close()
+    assert len(renders) <= 3
+
+def test_page_error_propagates(pdf, renders):
+    def failing(content):
+        raise RuntimeError("vision quota")
+
+    with pytest.raises(RuntimeError, match="vision quota"):
+        pdf_ocr.ocr_pdf(pdf, failing, workers=2)
+
+def write_text_pdf(path, pages):
+    """PDF z warstwą tekstową (Helvetica); pusta lista linii = strona bez tekstu (skan)."""
+    from pypdf.generic import DecodedStreamObject, NameObject, DictionaryObject
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"), NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for lines in pages:
+        page = writer.add_blank_page(width=300, height=400)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        content = DecodedStreamObject()
+        content.set_data(("BT /F1 10 Tf 12 TL 20 380 Td " + " ".join(f"({l}) Tj T*" for l in lines) + " ET").encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+INVOICE = ["SKLEP INTERNETOWY", "Faktura VAT 1/2024", "Kabel USB-C 2m 29,99", "Ladowarka 65W 119,00", "RAZEM 148,99"]
+
+def test_text_layer_pages_skip_ocr(tmp_path, renders):
+    path = write_text_pdf(tmp_path / "mixed.pdf", [INVOICE, [], INVOICE])
+    pdf_ocr.PDF_STATS.reset()
+
+    pages = list(pdf_ocr.iter_pdf_text(path, page_ocr(), workers=2))
+
+    assert [page for page, _ in pages] == [1, 2, 3]
+    assert pages[0][1].startswith("SKLEP INTERNETOWY") and "RAZEM 148,99" in pages[2][1]
+    assert pages[1][1] == "strona 2"
+    assert [first for first, _, _ in renders] == [2]
+    stats = pdf_ocr.PDF_STATS.snapshot()
+    assert stats['pages_text_layer'] == 2 and stats['pages_ocr'] == 1
+    assert stats['estimated_seconds_saved'] >= 0
+
+def test_page_source_is_exported_as_stage(tmp_path, renders, monkeypatch):
+    from utils.metrics import METRICS
+    monkeypatch.setattr(METRICS, "enabled", True)
+    METRICS.reset()
+    path = write_text_pdf(tmp_path / "mixed.pdf", [INVOICE, []])
+    list(pdf_ocr.iter_pdf_text(path, page_ocr(), workers=2))
+
+    rows = {row['stage']: row for row in METRICS.snapshot() if row['stage'].startswith("pdf_page")}
+    METRICS.reset()
+    assert sorted(rows) == ["pdf_page.ocr", "pdf_page.text_layer"]
+    assert all(row['tier'] == "" and row['count'] == 1 for row in rows.values())
+
+def test_text_layer_can_be_disabled(tmp_path, renders):
+    path = write_text_pdf(tmp_path / "invoice.pdf", [INVOICE])
+    assert pdf_ocr.ocr_pdf(path, page_ocr(), text_layer=False) == "strona 1\n"
+
+@pytest.mark.parametrize("text,usable", [
+    ("\n".join(INVOICE), True),
+    ("Strona 1 z 2", False), # stopka
+    ("(cid:3)(cid:17)(cid:42) " * 20, False), # font bez mapowania Unicode
+    ("Regulamin sklepu i warunki zwrotu towaru w ciagu czternastu dni od daty odbioru przesylki " * 3, True),
+    ("Dziekujemy za zakupy w naszym sklepie internetowym", False), # krótko i bez cen
+])
+def test_usable_text_heuristics(text, usable):
+    assert pdf_ocr.usable_text(text) is usable
@@ -0,0 +1,48 @@
+import pytest
+import os
+import sys
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt_agents import detect_shop, BiedronkaAgent, LidlAgent
+
+@pytest.mark.parametrize("text,expected", [
+    ("Biedronka\nJeronimo Martins Polska S.A.\nPARAGON FISKALNY", "BIEDRONKA"),
+    ("Jeronimo Martins Drogerie Polska\nHebe\nSZAMPON 12,99", "HEBE"),
+    ("Żabka\nSKLEP 1234\nHOT DOG 5,99", "ZABKA"),
+    ("Stacja Paliw BP\nPB95 250,00", "BP"),
+    # Krótkie aliasy nie dopasowują się wewnątrz innych słów
+    ("Kaufland Polska\nDINOZAURY ZELKI 3,99\nOBPIEKANY 2,00", "KAUFLAND"),
+    ("SKLEP U ZDZISKA\nDINOZAURY ZELKI 3,99", "Sklep"),
+])
+def test_detect_shop(text, expected):
+    assert detect_shop(text) == expected
+
+def test_detect_shop_prefers_header_over_body():
+    text = "Lidl sp. z o.o.\n" + "\n".join(f"POZYCJA {i} 1,00" for i in range(10)) + "\nKARTA SHELL CLUB 0,00"
+    assert detect_shop(text) == "LIDL"
+
+def test_biedronka_grammar_merges_quantity_lines_and_discounts():
+    records = BiedronkaAgent().parse_lines(
+        "MLEKO UHT 3,2% 1L C 2 x3,19 6,38C\n"
+        "CHLEB ZYTNI\n"
+        "2 x 3,49 6,98 A\n"
+        "Rabat -1,00\n"
+        "BANANY LUZ 1,2 kg * 4,00 4,80 A"
+    )
+
+    assert [(r.name, r.qty, r.unit_price, r.total, r.vat) for r in records] == [
+        ("MLEKO UHT 3,2% 1L", 2.0, 3.19, 6.38, "C"),
+        ("CHLEB ZYTNI", 2.0, 3.49, 5.98, "A"),
+        ("BANANY LUZ", 1.2, 4.0, 4.8, "A"),
+    ]
+    assert records[1].raw == "CHLEB ZYTNI 2 x 3,49 6,98 A"
+
+def test_lidl_grammar_attaches_quantity_below_item():
+    records = LidlAgent().parse_lines("Mleko 6,98 A\n2 x 3,49\nKupon Lidl -0,50\nJajka 12,99 A")
+
+    assert [(r.name, r.qty, r.unit_price, r.total) for r in records] == [
+        ("Mleko", 2.0, 3.49, 6.48),
+        ("Jajka", 1.0, None, 12.99),
+    ]
@@ -0,0 +1,132 @@
+import pytest
+import os
+import sys
+import json
+import time
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt_cache import ReceiptCache, ProductMatch, canonicalize_line
+from utils.cache_store import SQLiteStore
+from config import ProjectConfig
+
+real_time = time.time
+
+MLEKO = ProductMatch(name="Mleko UHT 3.2%", category="NABIAŁ", unit="szt", confidence=1.0, source="fuzzy")
+
+@pytest.mark.parametrize("line,expected", [
+    ("MLEKO UHT 3.2 12,99", "MLEKO UHT 3.2"),
+    ("BANANY LUZ 1,2 kg * 4,00 4,80", "BANANY LUZ"),
+    ("Mleko łaciate 3,2% 1L 2 x 3,49 6,98 A", "MLEKO LACIATE 3.2% 1L"),
+    ("*SER GOUDA* 12,99C", "SER GOUDA"),
+])
+def test_canonicalize_line(line, expected):
+    assert canonicalize_line(line) == expected
+
+def test_lookup_survives_price_change(tmp_path):
+    cache = ReceiptCache(str(tmp_path / "cache.json"))
+    cache.update("MLEKO UHT 3.2 12,99", MLEKO, "BIEDRONKA")
+
+    assert cache.lookup("MLEKO UHT 3.2 12,99", "BIEDRONKA").name == MLEKO.name
+    assert cache.lookup("MLEKO UHT 3.2 13,49", "BIEDRONKA").name == MLEKO.name
+    assert cache.lookup("MLEKO UHT 3.2 13,49", "LIDL").name == MLEKO.name
+    assert cache.lookup("MASLO EX 3,50", "BIEDRONKA") is None
+    assert cache.stats == {'exact': 1, 'shop': 1, 'canonical': 1, 'miss': 1}
+
+def test_shop_scope_wins_over_global(tmp_path):
+    cache = ReceiptCache(str(tmp_path / "cache.json"))
+    other = ProductMatch(name="Mleko Pilos", category="NABIAŁ", unit="szt", confidence=0.9, source="fuzzy")
+    cache.update("MLEKO 2,99", MLEKO, "BIEDRONKA")
+    cache.update("MLEKO 3,19", other, "LIDL")
+
+    assert cache.lookup("MLEKO 3,29", "LIDL").name == "Mleko Pilos"
+    assert cache.lookup("MLEKO 3,29", "AUCHAN").name == MLEKO.name
+
+LEGACY = {"MASLO EX 3,50": {
+    "name": "Masło Ekstra", "category": "NABIAŁ", "unit": "szt", "confidence": 1.0, "source": "fuzzy"
+}}
+
+def test_legacy_file_migration(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps(LEGACY), encoding="utf-8")
+
+    cache = ReceiptCache(str(path), backend="json")
+    assert cache.lookup("MASLO EX 3,99").name == "Masło Ekstra"
+
+    cache.save()
+    assert "~MASLO EX" in json.loads(path.read_text(encoding="utf-8"))
+
+def test_sqlite_imports_legacy_json_once(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps(LEGACY), encoding="utf-8")
+
+    cache = ReceiptCache(str(path), backend="sqlite")
+    assert (tmp_path / "cache.db").exists()
+    assert cache.lookup("MASLO EX 4,19").name == "Masło Ekstra"
+    cache.close()
+
+    # Kolejny start nie importuje ponownie (plik JSON jest już nieaktualny)
+    path.write_text("{}", encoding="utf-8")
+    assert ReceiptCache(str(path), backend="sqlite").lookup("MASLO EX 3,50") is not None
+
+def test_sqlite_writes_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.json")
+    bot_cache = ReceiptCache(path, backend="sqlite")
+    cli_cache = ReceiptCache(path, backend="sqlite")
+
+    bot_cache.update("MLEKO UHT 3.2 12,99", MLEKO, "BIEDRONKA")
+    cli_cache.update("MASLO EX 3,50", ProductMatch(**LEGACY["MASLO EX 3,50"]), "BIEDRONKA")
+    bot_cache.save()
+    cli_cache.save()
+
+    assert cli_cache.lookup("MLEKO UHT 3.2 12,99") is not None
+    assert bot_cache.lookup("MASLO EX 3,50") is not None
+
+@pytest.mark.parametrize("eviction,survivor", [("lru", "B"), ("lfu", "A")])
+def test_sqlite_store_eviction(tmp_path, eviction, survivor):
+    store = SQLiteStore(str(tmp_path / "store.db"), max_entries=1, eviction=eviction)
+    store.put("A", {"v": 1})
+    store.flush()
+    for _ in range(3):
+        store.get("A")
+    store.flush()
+    store.put("B", {"v": 2})
+    store.flush()
+
+    assert len(store) == 1
+    assert store.get(survivor) is not None
+
+def test_negative_entries_mask_numbers_and_reset_on_match(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    cache = ReceiptCache(str(tmp_path / "cache.json"))
+    for number in ("1234", "5678"):
+        cache.record_non_product(f"nr wydruku {number}", "LIDL")
+
+    assert cache.is_non_product("NR WYDRUKU 9999", "LIDL")
+    assert not cache.is_non_product("NR WYDRUKU 9999", "BIEDRONKA")
+    # Negatywne wpisy nie są trafieniami produktów
+    assert cache.lookup("NR WYDRUKU 9999", "LIDL") is None
+
+    cache.update("NR WYDRUKU 1", ProductMatch("Bon", "INNE", "szt", 0.9, "manual"), "LIDL")
+    assert not cache.is_non_product("NR WYDRUKU 9999", "LIDL")
+
+def test_negative_entries_expire_and_are_sampled_for_recheck(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    cache = ReceiptCache(str(tmp_path / "cache.json"))
+    for _ in range(2):
+        cache.record_non_product("DZIEKUJEMY 0042", "LIDL")
+    assert cache.is_non_product("DZIEKUJEMY 0043", "LIDL")
+
+    # Część pominięć i tak idzie do fuzzy/AI, żeby błędny wpis dało się oduczyć
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 1.0)
+    assert not cache.is_non_product("DZIEKUJEMY 0043", "LIDL")
+    assert cache.negative_rechecks == 1
+
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_TTL", 60)
+    monkeypatch.setattr(time, "time", lambda: real_time() + 3600)
+    assert not cache.is_non_product("DZIEKUJEMY 0043", "LIDL")
+    # Po wygaśnięciu licznik startuje od zera
+    cache.record_non_product("DZIEKUJEMY 0044", "LIDL")
+    assert not cache.is_non_product("DZIEKUJEMY 0045", "LIDL")
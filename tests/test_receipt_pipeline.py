@@ -0,0 +1,337 @@
+import pytest
+import os
+import sys
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ProjectConfig
+from utils.receipt_cache import ReceiptCache
+from utils.taxonomy import TaxonomyGuard, StagingTaxonomy
+from core.pipelines.receipt_pipeline import AsyncReceiptPipeline
+from utils.metrics import LatencyRecorder
+
+BIEDRONKA_OCR = """Biedronka
+Jeronimo Martins Polska S.A.
+PARAGON FISKALNY
+2023-10-27 nr 123456
+MLEKO UHT 3.2 12,99
+MASLO EX 3,50
+BANANY LUZ 1,2 kg * 4,00 4,80
+REKLAMOWKA 0,50
+CHL. ZWYKLY 2,50
+SUMA PLN 24,29
+"""
+
+def make_pipeline(tmp_path, brain):
+    return AsyncReceiptPipeline(
+        cache=ReceiptCache(str(tmp_path / "cache.json")),
+        brain=brain,
+        taxonomy=TaxonomyGuard(str(ProjectConfig.PRODUCT_TAXONOMY_PATH)),
+        staging=StagingTaxonomy(str(tmp_path / "staging.json")),
+    )
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return make_pipeline(tmp_path, MagicMock())
+
+def test_matrix_and_per_line_scoring_agree(pipeline, monkeypatch):
+    lines = ["MLEKO UHT 3.2 12,99", "MASLO EX 3,50", "CHL. ZWYKLY 2,50", "XQZW 1,00"] * 5
+
+    monkeypatch.setattr(ProjectConfig, "FUZZY_BATCH_MODE", "cdist")
+    matrix = asyncio.run(pipeline._fuzzy_match_batch(lines))
+    monkeypatch.setattr(ProjectConfig, "FUZZY_BATCH_MODE", "per_line")
+    per_line = asyncio.run(pipeline._fuzzy_match_batch(lines))
+
+    accepted = lambda m: m[0] if m and m[1] >= ProjectConfig.FUZZY_MIN_SCORE else None
+    assert [accepted(m) for m in matrix] == [accepted(m) for m in per_line]
+    assert accepted(matrix[0]) == "MLEKO UHT 3.2"
+    assert matrix[3] is None
+
+def test_matrix_scores_match_per_line_near_threshold(pipeline, monkeypatch):
+    # partial_ratio("KHWA KNUIEONA", "KAWA MIELONA") = 69.57 (tuż pod progiem), "KAWA MIELON" = 95.65
+    lines = ["KHWA KNUIEONA", "KAWA MIELON 19,99"]
+
+    monkeypatch.setattr(ProjectConfig, "FUZZY_BATCH_MODE", "cdist")
+    matrix = asyncio.run(pipeline._fuzzy_match_batch(lines))
+    monkeypatch.setattr(ProjectConfig, "FUZZY_BATCH_MODE", "per_line")
+    per_line = asyncio.run(pipeline._fuzzy_match_batch(lines))
+
+    assert per_line[0][0] == "KAWA MIELONA" and per_line[0][1] < ProjectConfig.FUZZY_MIN_SCORE
+    assert matrix[0] is None
+    # Pewność bez kwantyzacji do liczb całkowitych
+    assert matrix[1][0] == per_line[1][0] == "KAWA MIELONA"
+    assert matrix[1][1] == pytest.approx(per_line[1][1], abs=1e-3) and per_line[1][1] % 1
+
+def test_process_receipt_resolves_known_products(pipeline):
+    result = asyncio.run(pipeline.process_receipt_async(BIEDRONKA_OCR))
+
+    assert result['shop'] == "BIEDRONKA"
+    assert result['date'] == "2023-10-27"
+    names = [item['nazwa'] for item in result['items']]
+    assert "Mleko UHT 3.2%" in names
+    assert "Masło Ekstra" in names
+
+def test_items_use_quantities_from_shop_grammar(pipeline):
+    ocr = BIEDRONKA_OCR.replace("MASLO EX 3,50", "MASLO EX\n2 x 3,50 7,00 A")
+    result = asyncio.run(pipeline.process_receipt_async(ocr))
+
+    butter = next(item for item in result['items'] if item['nazwa'] == "Masło Ekstra")
+    assert (butter['ilosc'], butter['cena_jedn'], butter['suma']) == (2.0, 3.5, 7.0)
+    bananas = next(item for item in result['items'] if item['suma'] == 4.8)
+    assert (bananas['ilosc'], bananas['cena_jedn']) == (1.2, 4.0)
+
+def test_stage_timings_are_recorded(tmp_path):
+    pipeline = make_pipeline(tmp_path, SlowBrain())
+    pipeline.metrics = LatencyRecorder(enabled=True)
+    result = asyncio.run(pipeline.process_receipt_async(BIEDRONKA_OCR.replace("REKLAMOWKA", "PIZZA HAWAJ")))
+
+    assert result['stats']['tier'] == "ai"
+    assert {"detect_shop", "preprocess", "parse_lines", "cache_lookup", "fuzzy", "ai", "json_parse"} <= set(result['stats']['stages_ms'])
+    stages = {(s['stage'], s['shop'], s['tier']) for s in pipeline.metrics.snapshot()}
+    assert ("total", "BIEDRONKA", "ai") in stages
+    assert ("fuzzy", "BIEDRONKA", "") in stages
+
+class SlowBrain:
+    """Atrapa UniversalBrain: mierzy liczbę równoległych wywołań."""
+    def __init__(self, response='{"items": []}', delay=0.01):
+        self.response = response
+        self.delay = delay
+        self.calls = 0
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+
+    async def generate_content_async(self, user_prompt, system_prompt, format_type="json", model_name=None):
+        self.calls += 1
+        self.prompts.append(user_prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return self.response
+
+def test_process_receipts_async_streams_all_results(tmp_path, monkeypatch):
+    brain = SlowBrain()
+    pipeline = make_pipeline(tmp_path, brain)
+    unknown = "SKLEP U ZDZISKA\nPRODUKT NIEZNANY 1,00\nINNY TOWAR 2,00"
+    receipts = [BIEDRONKA_OCR, unknown, "   ", (unknown, "Sklep")] * 5
+
+    async def collect():
+        return [item async for item in pipeline.process_receipts_async(receipts, concurrency=2)]
+
+    results = dict(asyncio.run(collect()))
+
+    assert sorted(results) == list(range(len(receipts)))
+    assert isinstance(results[2], ValueError)
+    assert results[0]['shop'] == "BIEDRONKA"
+    assert brain.calls >= 10
+    assert brain.max_active <= 2
+    # Linie z fuzzy matchingu trafiły do wspólnego cache
+    assert pipeline.cache.lookup("MASLO EX 3,50", "BIEDRONKA") is not None
+
+def test_process_receipts_async_backpressure_with_local_only_receipts(tmp_path):
+    # Paragony rozwiązane bez AI kończą się bez await - backpressure nie może na nie czekać w nieskończoność
+    brain = SlowBrain()
+    pipeline = make_pipeline(tmp_path, brain)
+    known = "MLEKO UHT 3.2 12,99\nMASLO EX 3,50\nCHL. ZWYKLY 2,50"
+    receipts = [(known, "BIEDRONKA")] * 30
+
+    async def collect():
+        return [item async for item in pipeline.process_receipts_async(receipts, concurrency=1)]
+
+    results = dict(asyncio.run(asyncio.wait_for(collect(), timeout=10)))
+
+    assert sorted(results) == list(range(len(receipts)))
+    assert brain.calls == 0
+
+def test_sync_facade_from_a_thread_with_a_running_loop(tmp_path):
+    brain = SlowBrain(delay=0.05)
+    pipeline = make_pipeline(tmp_path, brain)
+    unknown = "SKLEP U ZDZISKA\nPRODUKT NIEZNANY 1,00"
+
+    async def caller():
+        # Np. handler bota: wywołanie synchroniczne z wnętrza działającej pętli
+        return pipeline.process_receipt_sync(BIEDRONKA_OCR)
+
+    assert asyncio.run(caller())['shop'] == "BIEDRONKA"
+
+    results = dict(pipeline.process_receipts_sync([unknown] * 6, concurrency=3))
+    assert sorted(results) == list(range(6))
+    assert brain.max_active > 1
+
+def test_sync_facade_holds_back_batch_for_slow_consumer(tmp_path):
+    pipeline = make_pipeline(tmp_path, SlowBrain())
+    known = "MLEKO UHT 3.2 12,99\nMASLO EX 3,50"
+    pulled = []
+
+    def receipts():
+        for i in range(200):
+            pulled.append(i)
+            yield known, "BIEDRONKA"
+
+    stream = pipeline.process_receipts_sync(receipts(), concurrency=2)
+    next(stream)
+    time.sleep(0.3)
+    # Kolejka wyników jest ograniczona - bez odbioru paczka nie czyta kolejnych paragonów
+    assert len(pulled) < 50
+    assert len(list(stream)) == 199
+
+def test_sync_facade_break_closes_the_batch_and_cancels_pending_receipts(tmp_path):
+    brain = SlowBrain(delay=5.0)
+    pipeline = make_pipeline(tmp_path, brain)
+    known = ("MLEKO UHT 3.2 12,99\nMASLO EX 3,50", "BIEDRONKA")
+    unknown = ("SKLEP U ZDZISKA\nPRODUKT NIEZNANY 1,00", "Sklep")
+
+    async def pending_tasks():
+        return len(asyncio.all_tasks()) - 1
+
+    stream = pipeline.process_receipts_sync([known] * 4 + [unknown] * 4, concurrency=2)
+    next(stream)
+    time.sleep(0.1)
+    start = time.perf_counter()
+    stream.close()
+    assert time.perf_counter() - start < 1
+
+    # Po close() paczka jest już zamknięta: zapytania AI anulowane, a nie czekają 5 s w tle
+    assert pipeline.loop_thread.run(pending_tasks()) == 0
+    assert brain.calls >= 1
+
+def test_speculative_ai_is_used_or_cancelled(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "RECEIPT_AI_SPECULATIVE", True)
+    response = '{"items": [{"nazwa": "Mleko UHT", "suma": 12.99}, {"nazwa": "Pizza Hawajska", "suma": 29.99}]}'
+    brain = SlowBrain(response=response)
+    pipeline = make_pipeline(tmp_path, brain)
+
+    # Nieznany sklep: AI startuje przed fuzzy; pozycja mleka z AI dubluje dopasowanie fuzzy i jest odrzucana
+    result = asyncio.run(pipeline.process_receipt_async("MLEKO UHT 3.2 12,99\nPIZZA HAWAJ 29,99", "Sklep"))
+    assert result['stats']['speculative'] == "used"
+    assert sorted(item['nazwa'] for item in result['items']) == ["Mleko UHT 3.2%", "Pizza Hawajska"]
+
+    # Wszystko rozpoznane lokalnie - spekulacja anulowana, tokeny policzone jako zmarnowane
+    result = asyncio.run(pipeline.process_receipt_async("MASLO EX 3,50\nCHL. ZWYKLY 2,50", "Sklep"))
+    assert result['stats']['speculative'] == "cancelled"
+    assert result['stats']['used_ai'] is False
+    stats = pipeline.speculation_stats()
+    assert (stats['started'], stats['used'], stats['cancelled']) == (2, 1, 1)
+    assert stats['hit_rate'] == 0.5 and stats['wasted_tokens'] > 0
+
+def test_non_product_lines_are_learned_and_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_MIN_MISSES", 1)
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    brain = SlowBrain('{"items": [{"nazwa": "Pizza Hawajska", "suma": 29.99}]}')
+    pipeline = make_pipeline(tmp_path, brain)
+
+    first = asyncio.run(pipeline.process_receipt_async("PIZZA HAWAJ 29,99\nDZIEKUJEMY ZAPRASZAMY 0042", "Sklep"))
+    # AI nie znalazło produktu w podziękowaniu - przy kolejnym paragonie (inny numer) linia jest pomijana
+    second = asyncio.run(pipeline.process_receipt_async("DZIEKUJEMY ZAPRASZAMY 0043\nPIZZA HAWAJ 29,99", "Sklep"))
+
+    assert first['stats']['lines_skipped'] == 0
+    assert second['stats']['lines_skipped'] == 1
+    assert second['stats']['cache_hit_rate'] == 1.0
+    assert brain.calls == 1
+    assert pipeline.cache.negative_hits == 1
+
+def test_empty_ai_answer_does_not_poison_negative_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    brain = SlowBrain('{"items": []}')
+    pipeline = make_pipeline(tmp_path, brain)
+    ocr = "PIZZA HAWAJ 29,99\nKEBAB DUZY 19,99"
+
+    for _ in range(3):
+        asyncio.run(pipeline.process_receipt_async(ocr, "Sklep"))
+    # AI wraca do formy - linie nadal do niego trafiają
+    brain.response = ('{"items": [{"nazwa": "Pizza Hawajska", "suma": 29.99}, '
+                      '{"nazwa": "Kebab Duży", "suma": 19.99}]}')
+    result = asyncio.run(pipeline.process_receipt_async(ocr, "Sklep"))
+
+    assert result['stats']['lines_skipped'] == 0
+    assert sorted(item['nazwa'] for item in result['items']) == ["Kebab Duży", "Pizza Hawajska"]
+    assert pipeline.cache.negative_hits == 0
+
+def test_expanded_ai_name_matching_by_price_only_is_not_a_non_product(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_MIN_MISSES", 1)
+    monkeypatch.setattr(ProjectConfig, "NEGATIVE_CACHE_RECHECK", 0.0)
+    # AI rozwija skrót - nazwa nie przypisuje się do linii (WRatio 50), zgadza się tylko cena
+    brain = SlowBrain('{"items": [{"nazwa": "Kebab Duży", "kategoria": "SPOŻYWCZE", "suma": 19.99},'
+                      ' {"nazwa": "Papier toaletowy", "kategoria": "CHEMIA", "suma": 12.99}]}')
+    pipeline = make_pipeline(tmp_path, brain)
+    ocr = "KEBAB DUZY 19,99\nPAP.TOAL.VELV 8R 12,99"
+
+    first = asyncio.run(pipeline.process_receipt_async(ocr, "Sklep"))
+    assert first['stats']['lines_learned'] == 1
+
+    # Kolejny paragon z tym samym papierem: linia nadal trafia do AI zamiast zniknąć z paragonu
+    brain.response = ('{"items": [{"nazwa": "Papier toaletowy", "kategoria": "CHEMIA", "suma": 12.99},'
+                      ' {"nazwa": "Zupa pomidorowa", "kategoria": "SPOŻYWCZE", "suma": 7.49}]}')
+    second = asyncio.run(pipeline.process_receipt_async("PAP.TOAL.VELV 8R 12,99\nZUPA POMID 7,49", "Sklep"))
+    assert second['stats']['lines_skipped'] == 0
+    assert sorted(item['nazwa'] for item in second['items']) == ["Papier toaletowy", "Zupa pomidorowa"]
+    assert second['total_amount'] == 20.48
+    assert pipeline.cache.negative_hits == 0
+
+def test_partial_escalation_sends_only_unresolved_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "RECEIPT_AI_PARTIAL", True)
+    brain = SlowBrain('{"items": [{"nazwa": "Pizza Hawajska", "kategoria": "SPOŻYWCZE", "ilosc": 1, "cena_jedn": 29.99, "suma": 29.99}]}')
+    pipeline = make_pipeline(tmp_path, brain)
+    ocr = BIEDRONKA_OCR.replace("CHL. ZWYKLY 2,50", "PIZZA HAWAJ 29,99")
+
+    result = asyncio.run(pipeline.process_receipt_async(ocr))
+
+    assert brain.calls == 1
+    assert "PIZZA HAWAJ 29,99" in brain.prompts[0]
+    assert "MASLO EX" not in brain.prompts[0]
+    names = [item['nazwa'] for item in result['items']]
+    assert "Masło Ekstra" in names and "Pizza Hawajska" in names
+    # Nierozpoznana tylko pizza - linia z datą/numerem paragonu jest pomijana jako nie-produkt
+    assert "2023-10-27" not in brain.prompts[0].split("extract only these")[1]
+    assert result['stats']['lines_ai'] == 1
+    assert result['stats']['lines_local'] == 4
+    assert result['stats']['lines_skipped'] == 1
+
+def test_validated_ai_items_are_learned(tmp_path):
+    brain = SlowBrain('{"items": [{"nazwa": "Pizza Hawajska", "kategoria": "SPOŻYWCZE", "ilosc": 1, "cena_jedn": 29.99, "suma": 29.99},'
+                      ' {"nazwa": "Halucynacja", "kategoria": "INNE", "ilosc": 1, "cena_jedn": 5.0, "suma": 5.0}]}')
+    pipeline = make_pipeline(tmp_path, brain)
+    ocr = BIEDRONKA_OCR.replace("CHL. ZWYKLY 2,50", "PIZZA HAWAJ 29,99")
+
+    first = asyncio.run(pipeline.process_receipt_async(ocr))
+    assert first['stats']['used_ai'] and first['stats']['lines_learned'] == 1
+
+    # Ta sama pozycja w innej cenie - rozpoznana z cache, bez LLM
+    second = asyncio.run(pipeline.process_receipt_async(ocr.replace("29,99", "31,49")))
+    assert not second['stats']['used_ai']
+    assert brain.calls == 1
+    learned = pipeline.cache.lookup("PIZZA HAWAJ 31,49", "BIEDRONKA")
+    assert learned.source == "ai" and learned.confidence < 1.0
+    assert pipeline.cache.lookup("HALUCYNACJA 5,00") is None
+
+    staged = StagingTaxonomy(str(tmp_path / "staging.json")).mappings
+    assert staged["PIZZA HAWAJ"]["name"] == "Pizza Hawajska"
+
+def test_staging_taxonomy_is_opt_in(tmp_path, monkeypatch):
+    cache = ReceiptCache(str(tmp_path / "cache.json"))
+    taxonomy = TaxonomyGuard(str(ProjectConfig.PRODUCT_TAXONOMY_PATH))
+    monkeypatch.setattr(ProjectConfig, "AI_LEARNING_ENABLED", True)
+    monkeypatch.setattr(ProjectConfig, "TAXONOMY_STAGING_ENABLED", False)
+    assert AsyncReceiptPipeline(cache=cache, brain=MagicMock(), taxonomy=taxonomy).staging is None
+
+    monkeypatch.setattr(ProjectConfig, "TAXONOMY_STAGING_ENABLED", True)
+    monkeypatch.setattr(ProjectConfig, "TAXONOMY_STAGING_PATH", tmp_path / "data" / "staging.json")
+    staging = AsyncReceiptPipeline(cache=cache, brain=MagicMock(), taxonomy=taxonomy).staging
+    assert staging.staging_path == str(tmp_path / "data" / "staging.json")
+
+def test_non_product_lines_are_split_from_products(pipeline):
+    job = pipeline._prepare_job(BIEDRONKA_OCR, None)
+    assert job.skipped == ["2023-10-27 nr 123456"]
+    assert job.lines == ["MLEKO UHT 3.2 12,99", "MASLO EX 3,50", "BANANY LUZ 1,2 kg * 4,00 4,80",
+                         "REKLAMOWKA 0,50", "CHL. ZWYKLY 2,50"]
+
+    result = asyncio.run(pipeline.process_receipt_async(BIEDRONKA_OCR))
+    assert result['stats']['lines_skipped'] == 1
+    assert [item['nazwa'] for item in result['items']] == \
+        ["Mleko UHT 3.2%", "Masło Ekstra", "Banany", "Reklamówka", "Chleb Zwykły"]
+    assert result['total_amount'] == pytest.approx(24.29)
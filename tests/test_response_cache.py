@@ -0,0 +1,133 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapters.response_cache import LLMResponseCache
+from adapters.google.gemini_adapter import UniversalBrain
+
+@pytest.fixture
+def brain(tmp_path, monkeypatch):
+    brain = UniversalBrain(provider="ollama", response_cache=LLMResponseCache(str(tmp_path / "llm.db")))
+    brain.upstream_calls = 0
+
+    async def fake_generate(user_prompt, system_prompt, format_type, model_name=None):
+        brain.upstream_calls += 1
+        await asyncio.sleep(0.01)
+        return f'{{"echo": "{user_prompt}"}}'
+
+    monkeypatch.setattr(brain, "_generate", fake_generate)
+    return brain
+
+def test_identical_prompt_is_served_from_cache(brain):
+    first = asyncio.run(brain.generate_content_async("OCR A", "SYSTEM"))
+    second = asyncio.run(brain.generate_content_async("OCR A", "SYSTEM"))
+
+    assert first == second
+    assert brain.upstream_calls == 1
+    stats = brain.cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['saved_seconds'] > 0
+
+def test_key_covers_prompt_model_and_format(brain):
+    asyncio.run(brain.generate_content_async("OCR A", "SYSTEM"))
+    asyncio.run(brain.generate_content_async("OCR A", "SYSTEM", "text"))
+    asyncio.run(brain.generate_content_async("OCR A", "SYSTEM", model_name="bielik"))
+    asyncio.run(brain.generate_content_async("OCR B", "SYSTEM"))
+    assert brain.upstream_calls == 4
+
+def test_malformed_json_is_not_cached_and_next_good_answer_is(brain, monkeypatch):
+    answers = ['{"items": [{"nazwa": "Mle', '```json\n{"items": []}\n```']
+
+    async def flaky(user_prompt, system_prompt, format_type, model_name=None):
+        brain.upstream_calls += 1
+        return answers.pop(0)
+
+    monkeypatch.setattr(brain, "_generate", flaky)
+    assert asyncio.run(brain.generate_content_async("OCR A", "SYSTEM")) == '{"items": [{"nazwa": "Mle'
+    # Ucięta odpowiedź nie wraca z cache - dostawca jest pytany ponownie
+    good = asyncio.run(brain.generate_content_async("OCR A", "SYSTEM"))
+    assert good == '```json\n{"items": []}\n```'
+    assert asyncio.run(brain.generate_content_async("OCR A", "SYSTEM")) == good
+    assert brain.upstream_calls == 2
+    assert brain.cache_stats()['rejected'] == 1
+
+def test_cache_survives_restart_and_expires(tmp_path):
+    path = str(tmp_path / "llm.db")
+    key = LLMResponseCache.make_key("google", "gemini-pro", "S", "U", "json")
+    LLMResponseCache(path).put(key, "odpowiedź", 1.5, "google", "gemini-pro")
+
+    assert LLMResponseCache(path).get(key) == "odpowiedź"
+    expired = LLMResponseCache(path, ttl=1)
+    expired.store.conn.execute("UPDATE responses SET created_at = ?", (time.time() - 10,))
+    assert expired.get(key) is None
+
+def test_concurrent_identical_requests_share_one_upstream_call(brain):
+    async def burst():
+        return await asyncio.gather(*(brain.generate_content_async("OCR A", "SYSTEM") for _ in range(5)),
+                                    brain.generate_content_async("OCR B", "SYSTEM"))
+
+    results = asyncio.run(burst())
+    assert results[:5] == [results[0]] * 5
+    assert brain.upstream_calls == 2
+    stats = brain.flight_stats()
+    assert stats['coalesced'] == 4 and stats['upstream'] == 2 and stats['in_flight'] == 0
+    assert stats['dedupe_ratio'] == pytest.approx(4 / 6)
+
+def test_coalescing_works_without_response_cache_and_shares_errors(monkeypatch):
+    brain = UniversalBrain(provider="ollama", response_cache=None)
+    calls = []
+
+    async def failing(user_prompt, system_prompt, format_type, model_name=None):
+        calls.append(user_prompt)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(brain, "_generate", failing)
+
+    async def burst():
+        return await asyncio.gather(*(brain.generate_content_async("OCR", "S") for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(burst()))
+    assert len(calls) == 1
+
+def test_cancelled_waiter_does_not_cancel_shared_call(brain):
+    async def scenario():
+        first = asyncio.create_task(brain.generate_content_async("OCR A", "SYSTEM"))
+        second = asyncio.create_task(brain.generate_content_async("OCR A", "SYSTEM"))
+        await asyncio.sleep(0)
+        first.cancel()
+        result = await second
+        return first.cancelled(), result
+
+    cancelled, result = asyncio.run(scenario())
+    assert cancelled and result == '{"echo": "OCR A"}'
+    assert brain.upstream_calls == 1 and brain.flights['cancelled'] == 0
+
+def test_upstream_call_is_cancelled_when_all_waiters_leave(brain, monkeypatch):
+    finished = []
+
+    async def slow(user_prompt, system_prompt, format_type, model_name=None):
+        await asyncio.sleep(1)
+        finished.append(user_prompt)
+        return "late"
+
+    monkeypatch.setattr(brain, "_generate", slow)
+
+    async def scenario():
+        waiters = [asyncio.create_task(brain.generate_content_async("OCR A", "SYSTEM")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return brain.flight_stats()
+
+    stats = asyncio.run(scenario())
+    assert finished == []
+    assert stats['cancelled'] == 1 and stats['in_flight'] == 0
@@ -0,0 +1,161 @@
+import pytest
+import os
+import sys
+import asyncio
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ProjectConfig
+from adapters.router import ProviderRouter, NoProviderAvailable, CLOSED, OPEN, HALF_OPEN
+from utils.receipt_cache import ReceiptCache
+from utils.taxonomy import TaxonomyGuard, StagingTaxonomy
+from core.pipelines.receipt_pipeline import AsyncReceiptPipeline
+
+
+class FakeBrain:
+    """Atrapa UniversalBrain dla routera: opóźnienie, błąd albo odpowiedź z cache."""
+
+    def __init__(self, name, latency=0.0, fail=False, cached=None):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.cached = cached
+        self.calls = 0
+        self.flights = {'requests': 0, 'upstream': 0, 'coalesced': 0, 'cancelled': 0}
+
+    def cached_response(self, user_prompt, system_prompt, format_type="json", model_name=None):
+        return self.cached
+
+    async def generate_uncached(self, user_prompt, system_prompt, format_type="json", model_name=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        return f'{{"items": [], "provider": "{self.name}"}}'
+
+    async def aclose(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(*brains, **kwargs):
+    kwargs.setdefault('min_samples', 1)
+    return ProviderRouter(brains={b.name: b for b in brains}, **kwargs)
+
+def generate(router, route=None):
+    return asyncio.run(router.generate_content_async("OCR", "SYSTEM", route=route))
+
+def test_failed_provider_falls_back_to_next():
+    router = make_router(FakeBrain("google", fail=True), FakeBrain("ollama"))
+    route = {}
+    assert "ollama" in generate(router, route)
+    assert route['provider'] == "ollama" and route['attempted'] == ["google", "ollama"]
+    assert "google down" in route['errors']['google']
+    assert router.router_stats()['fallbacks'] == 1
+
+def test_circuit_opens_then_half_open_probe_closes_it():
+    clock = Clock()
+    google = FakeBrain("google", fail=True)
+    router = make_router(google, FakeBrain("ollama"), failures=2, cooldown=30, clock=clock)
+
+    generate(router)
+    generate(router)
+    assert router.health['google'].state == OPEN
+    route = {}
+    generate(router, route)
+    assert route['skipped'] == ["google"] and route['attempted'] == ["ollama"]
+    assert google.calls == 2
+
+    clock.now = 31
+    google.fail = False
+    assert router.health['google'].available() and router.health['google'].state == HALF_OPEN
+    route = {}
+    generate(router, route)
+    assert route['provider'] == "google"
+    assert router.health['google'].state == CLOSED
+
+def test_half_open_lets_a_single_probe_through_concurrent_requests():
+    clock = Clock()
+    ollama, google = FakeBrain("ollama", latency=0.01, fail=True), FakeBrain("google", latency=0.05)
+    router = make_router(ollama, google, failures=100, cooldown=30, clock=clock)
+    router.health['google']._open()
+    clock.now = 31
+
+    async def burst():
+        # Wszystkie zapytania widzą google w half_open; po błędzie ollamy każde chciałoby przejść do niego
+        return await asyncio.gather(*(router.generate_content_async("OCR", "SYSTEM") for _ in range(5)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert google.calls == 1
+    assert sum(isinstance(r, str) and "google" in r for r in results) == 1
+    assert sum(isinstance(r, NoProviderAvailable) for r in results) == 4
+    assert router.health['google'].state == CLOSED
+
+def test_all_circuits_open_degrades_immediately():
+    router = make_router(FakeBrain("google", fail=True), failures=1)
+    with pytest.raises(NoProviderAvailable):
+        generate(router)
+    with pytest.raises(NoProviderAvailable):
+        generate(router)
+    assert router.router_stats()['degraded'] == 2
+
+def test_slow_primary_is_hedged_after_p95(monkeypatch):
+    monkeypatch.setattr(ProjectConfig, "LLM_HEDGE_MIN_DELAY", 0.01)
+    google, ollama = FakeBrain("google"), FakeBrain("ollama", latency=0.01)
+    router = make_router(google, ollama)
+    router.health['google'].record_success(0.02)
+    router.health['ollama'].record_success(5.0)
+
+    google.latency = 1.0
+    route = {}
+    assert "ollama" in generate(router, route)
+    assert route['hedged'] and route['attempted'] == ["google", "ollama"] and route['provider'] == "ollama"
+    stats = router.router_stats()
+    assert stats['hedge_wins'] == 1
+    # Przegrany wyścig to nie błąd dostawcy
+    assert stats['providers']['google']['cancelled'] == 1 and stats['providers']['google']['failures'] == 0
+
+def test_routing_prefers_lower_expected_latency():
+    router = make_router(FakeBrain("google"), FakeBrain("ollama"), FakeBrain("openai"))
+    assert router.candidates() == ["google", "ollama", "openai"]
+    router.health['google'].record_success(2.0)
+    router.health['ollama'].record_success(0.3)
+    router.health['openai'].record_success(0.2)
+    router.health['openai'].record_failure()
+    assert router.candidates() == ["ollama", "openai", "google"]
+
+def test_cached_answer_from_any_provider_skips_upstream():
+    google, ollama = FakeBrain("google"), FakeBrain("ollama", cached='{"items": []}')
+    router = make_router(google, ollama)
+    route = {}
+    assert generate(router, route) == '{"items": []}'
+    assert route['cached'] and route['provider'] == "ollama"
+    assert google.calls == ollama.calls == 0
+
+def test_pipeline_degrades_to_local_result_at_deadline(tmp_path):
+    router = make_router(FakeBrain("google", latency=5.0), deadline=0.1, hedge=False)
+    pipeline = AsyncReceiptPipeline(
+        cache=ReceiptCache(str(tmp_path / "cache.json")),
+        brain=router,
+        taxonomy=TaxonomyGuard(str(ProjectConfig.PRODUCT_TAXONOMY_PATH)),
+        staging=StagingTaxonomy(str(tmp_path / "staging.json")),
+    )
+    ocr = "Sklep\nPIZZA HAWAJ 29,99\nMLEKO UHT 3.2 12,99\n"
+
+    result = asyncio.run(pipeline.process_receipt_async(ocr))
+
+    stats = result['stats']
+    assert stats['degraded'] and stats['tier'] == "degraded"
+    assert stats['processing_time'] < 2
+    assert stats['routing']['attempted'] == ["google"] and stats['routing']['provider'] is None
+    assert stats['router']['degraded'] == 1
+    assert [item['nazwa'] for item in result['items']] == ["Mleko UHT 3.2%"]
@@ -0,0 +1,81 @@
+import pytest
+import os
+import sys
+import json
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.taxonomy
+from utils.taxonomy import TaxonomyGuard, TrigramIndex
+
+@pytest.fixture
+def taxonomy_file(tmp_path):
+    path = tmp_path / "taxonomy.json"
+    path.write_text(json.dumps({"mappings": [
+        {"ocr": "MLEKO UHT 3.2", "name": "Mleko UHT 3.2%", "cat": "NABIAŁ", "unit": "szt"},
+        {"ocr": "MLEKO SWIEZE", "name": "Mleko Świeże", "cat": "NABIAŁ", "unit": "szt"},
+        {"ocr": "MASLO EX", "name": "Masło Ekstra", "cat": "NABIAŁ", "unit": "szt"},
+        {"ocr": "REKLAMOWKA", "name": "Reklamówka", "cat": "INNE", "unit": "szt"},
+    ]}), encoding="utf-8")
+    return str(path)
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_index_ranks_best_pattern_first(taxonomy_file, monkeypatch, use_numpy):
+    monkeypatch.setattr(utils.taxonomy, "NUMPY_AVAILABLE", use_numpy)
+    guard = TaxonomyGuard(taxonomy_file, index_min_patterns=0, top_k=2)
+
+    candidates = guard.candidates("MLEKO UHT 3.2 12,99")
+    assert candidates[0] == "MLEKO UHT 3.2"
+    assert len(candidates) == 2
+    assert guard.candidates("#### 99") == []
+
+def test_small_taxonomy_uses_full_scan(taxonomy_file):
+    guard = TaxonomyGuard(taxonomy_file, index_min_patterns=100)
+    assert guard.candidates("cokolwiek") == guard.ocr_patterns
+
+def test_index_interns_patterns():
+    index = TrigramIndex(["MASLO" + " EX"])
+    assert index.patterns[0] is sys.intern("MASLO EX")
+
+def _rewrite(path, mutate):
+    data = json.loads(open(path, encoding="utf-8").read())
+    mutate(data["mappings"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    # mtime bywa zaokrąglany - wymuszamy różny stan pliku
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_incremental_reload_matches_full_build(taxonomy_file, monkeypatch, use_numpy):
+    monkeypatch.setattr(utils.taxonomy, "NUMPY_AVAILABLE", use_numpy)
+    guard = TaxonomyGuard(taxonomy_file, index_min_patterns=0, top_k=10, watch=False)
+    before = guard._snapshot
+
+    def mutate(mappings):
+        mappings[:] = [m for m in mappings if m["ocr"] != "REKLAMOWKA"]
+        mappings[0]["name"] = "Mleko UHT 3,2% 1L"
+        mappings.append({"ocr": "KEFIR NAT", "name": "Kefir Naturalny", "cat": "NABIAŁ", "unit": "szt"})
+    _rewrite(taxonomy_file, mutate)
+
+    assert guard.reload_if_changed()
+    assert guard.reloads["incremental"] == 1
+    fresh = TaxonomyGuard(taxonomy_file, index_min_patterns=0, top_k=10, watch=False)
+    assert guard.ocr_patterns == fresh.ocr_patterns
+    assert guard.ocr_map == fresh.ocr_map
+    for query in ("KEFIR NAT 3,49", "REKLAMOWKA 0,50", "MLEKO UHT 3.2 4,99"):
+        assert guard.candidates(query) == fresh.candidates(query)
+    assert len(guard.index) == 4
+    # Stary snapshot nietknięty - czytelnicy w trakcie przełączenia widzą spójne dane
+    assert "REKLAMOWKA" in before.ocr_map and "REKLAMOWKA" in before.index.candidates("REKLAMOWKA", 10)
+    assert not guard.reload_if_changed()
+
+def test_broken_file_keeps_previous_snapshot(taxonomy_file):
+    guard = TaxonomyGuard(taxonomy_file, watch=False)
+    with open(taxonomy_file, "w", encoding="utf-8") as f:
+        f.write('{"mappings": [')
+
+    assert not guard.reload_if_changed()
+    assert guard.reloads["failed"] == 1
+    assert guard.get_metadata("MASLO EX")["name"] == "Masło Ekstra"
@@ -0,0 +1,257 @@
+import json
+import os
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, Iterator, Tuple
+
+logger = logging.getLogger("CacheStore")
+
+EVICTION_POLICIES = ('lru', 'lfu')
+
+
+class CacheStore(ABC):
+    """
+    Magazyn klucz -> słownik (JSON) używany przez ReceiptCache.
+    Zapisy są buforowane i trafiają na dysk dopiero przy flush().
+    """
+
+    def __init__(self, max_entries: int = 0, eviction: str = 'lru'):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.max_entries = max_entries
+        self.eviction = eviction
+
+    @abstractmethod
+    def get(self, key: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, value: Dict[str, Any]):
+        pass
+
+    def setdefault(self, key: str, value: Dict[str, Any]) -> Dict[str, Any]:
+        existing = self.get(key, touch=False)
+        if existing is not None:
+            return existing
+        self.put(key, value)
+        return value
+
+    def put_many(self, entries: Dict[str, Dict[str, Any]]):
+        for key, value in entries.items():
+            self.put(key, value)
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        pass
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonFileStore(CacheStore):
+    """Stary format: cały słownik w jednym pliku JSON, przepisywany przy flush()."""
+
+    def __init__(self, path: str, max_entries: int = 0, eviction: str = 'lru'):
+        super().__init__(max_entries, eviction)
+        self.path = path
+        self.data: Dict[str, Dict[str, Any]] = {}
+        self.hits: Dict[str, int] = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                logger.error(f"Failed to load {path}: {e}")
+                self.data = {}
+
+    def get(self, key, touch=True):
+        value = self.data.get(key)
+        if value is not None and touch:
+            # Kolejność słownika służy jako kolejka LRU
+            self.data[key] = self.data.pop(key)
+            self.hits[key] = self.hits.get(key, 0) + 1
+        return value
+
+    def put(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        self.dirty = True
+
+    def items(self):
+        return iter(list(self.data.items()))
+
+    def _evict(self):
+        overflow = len(self.data) - self.max_entries
+        if self.max_entries <= 0 or overflow <= 0:
+            return
+        if self.eviction == 'lfu':
+            order = sorted(self.data, key=lambda k: self.hits.get(k, 0))
+        else:
+            order = list(self.data)
+        for key in order[:overflow]:
+            del self.data[key]
+            self.hits.pop(key, None)
+        logger.info(f"Evicted {overflow} entries ({self.eviction})")
+
+    def flush(self):
+        if not self.dirty:
+            return
+        self._evict()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SQLiteStore(CacheStore):
+    """
+    SQLite w trybie WAL: przyrostowe zapisy (UPSERT tylko zmienionych kluczy),
+    bezpieczne przy wielu procesach (bot, watcher, CLI) i limit rozmiaru z eksmisją.
+    """
+
+    def __init__(self, path: str, max_entries: int = 0, eviction: str = 'lru', table: str = 'entries',
+                 ttl: float = 0, max_bytes: int = 0):
+        super().__init__(max_entries, eviction)
+        self.path = path
+        self.table = table
+        self.ttl = ttl # sekundy; 0 = wpisy nie wygasają
+        self.max_bytes = max_bytes # suma rozmiarów wartości (JSON, bajty); 0 = bez limitu
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._touched: Dict[str, Tuple[int, float]] = {}
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "hits INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table}(last_used)")
+
+    def get(self, key, touch=True):
+        with self._lock:
+            value = self._pending.get(key)
+            if value is None:
+                row = self.conn.execute(
+                    f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                expired = row and self.ttl and row[1] < time.time() - self.ttl
+                value = json.loads(row[0]) if row and not expired else None
+            if value is not None and touch:
+                hits, _ = self._touched.get(key, (0, 0.0))
+                self._touched[key] = (hits + 1, time.time())
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+
+    def items(self):
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(f"SELECT key, value FROM {self.table}").fetchall()
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            now = time.time()
+            pending, self._pending = self._pending, {}
+            touched, self._touched = self._touched, {}
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self.conn.executemany(
+                    f"INSERT INTO {self.table} (key, value, hits, last_used, created_at) VALUES (?, ?, 0, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                    "last_used = excluded.last_used, created_at = excluded.created_at",
+                    [(k, json.dumps(v, ensure_ascii=False), now, now) for k, v in pending.items()]
+                )
+                self.conn.executemany(
+                    f"UPDATE {self.table} SET hits = hits + ?, last_used = MAX(last_used, ?) WHERE key = ?",
+                    [(hits, used, k) for k, (hits, used) in touched.items()]
+                )
+                self._evict()
+                self.conn.execute("COMMIT")
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                # Nie gubimy zapisów - wrócą przy następnym flush()
+                self._pending = {**pending, **self._pending}
+                raise
+
+    def _evict(self):
+        if self.ttl:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_bytes > 0:
+            self._evict_bytes()
+        if self.max_entries <= 0:
+            return
+        count = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        order = "hits ASC, last_used ASC" if self.eviction == 'lfu' else "last_used ASC"
+        self.conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY {order} LIMIT ?)", (overflow,)
+        )
+        logger.info(f"Evicted {overflow} entries ({self.eviction})")
+
+    def _evict_bytes(self):
+        # Zostają najcenniejsze wpisy (kolejność odwrotna do eksmisji), dopóki ich suma mieści się w limicie
+        keep = "hits DESC, last_used DESC" if self.eviction == 'lfu' else "last_used DESC"
+        deleted = self.conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM ("
+            f"SELECT key, SUM(LENGTH(CAST(value AS BLOB))) OVER (ORDER BY {keep}, key) AS running "
+            f"FROM {self.table}) WHERE running > ?)", (self.max_bytes,)
+        ).rowcount
+        if deleted > 0:
+            logger.info(f"Evicted {deleted} entries over {self.max_bytes} bytes ({self.eviction})")
+
+    def size_bytes(self) -> int:
+        self.flush()
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM {self.table}").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            stored = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            return stored + sum(1 for k in self._pending if not self._exists(k))
+
+    def _exists(self, key: str) -> bool:
+        return self.conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def create_store(backend: str, path: str, max_entries: int = 0, eviction: str = 'lru') -> CacheStore:
+    if backend == 'sqlite':
+        return SQLiteStore(path, max_entries, eviction)
+    if backend == 'json':
+        return JsonFileStore(path, max_entries, eviction)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,185 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from config import ProjectConfig
+from utils.metrics import METRICS, quantiles
+
+logger = logging.getLogger("Clients")
+
+# Wartości zwracane bez opakowania (konfiguracja klienta, nie wywołania API)
+_PLAIN = (str, bytes, int, float, bool, type(None), dict, list, tuple)
+
+
+class ClientStats:
+    """Liczba wywołań, błędów i okno czasów (ns) jednego klienta."""
+
+    def __init__(self, window: int = None):
+        self._lock = threading.Lock()
+        self.window = window or ProjectConfig.METRICS_WINDOW
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.total_ns = 0
+            self.latencies_ns = deque(maxlen=self.window)
+
+    def record(self, name: str, elapsed_ns: int, failed: bool):
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.total_ns += elapsed_ns
+            self.latencies_ns.append(elapsed_ns)
+        # Klient w nazwie etapu - etykieta `tier` to poziom rozpoznania linii (exact/shop/canonical/fuzzy/ai)
+        METRICS.observe(f"client_call.{name}", elapsed_ns / 1e9)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = quantiles(self.latencies_ns)
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'seconds': round(self.total_ns / 1e9, 4),
+                'p50': latency[0.5],
+                'p95': latency[0.95],
+            }
+
+
+class _Instrumented:
+    """
+    Pośrednik klienta SDK: atrybuty (client.chat.completions) zwraca jako kolejnych pośredników,
+    a wywołanie metody (…create(...), text_detection(...)) mierzy i zlicza w statystykach klienta.
+    """
+    __slots__ = ('_target', '_name', '_stats')
+
+    def __init__(self, target: Any, name: str, stats: ClientStats):
+        self._target = target
+        self._name = name
+        self._stats = stats
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self._target, attr)
+        if isinstance(value, _PLAIN):
+            return value
+        return _Instrumented(value, self._name, self._stats)
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter_ns()
+        failed = True
+        try:
+            result = self._target(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._stats.record(self._name, time.perf_counter_ns() - start, failed)
+
+    def __repr__(self):
+        return f"<{self._name} client: {self._target!r}>"
+
+
+def _vision_factory():
+    from google.cloud import vision
+    # Klient gRPC: jeden kanał (HTTP/2) na proces, bezpieczny wątkowo
+    return vision.ImageAnnotatorClient()
+
+
+def _openai_factory():
+    from openai import OpenAI
+    # Klient trzyma pulę połączeń httpx - tworzony raz zamiast przy każdym paragonie
+    return OpenAI(api_key=ProjectConfig.OPENAI_API_KEY, timeout=ProjectConfig.LLM_TIMEOUT,
+                  max_retries=ProjectConfig.LLM_RETRIES)
+
+
+def _whisper_factory():
+    from openai import OpenAI
+    return OpenAI(api_key=ProjectConfig.OPENAI_API_KEY, timeout=ProjectConfig.WHISPER_TIMEOUT,
+                  max_retries=ProjectConfig.LLM_RETRIES)
+
+
+class ClientRegistry:
+    """
+    Współdzielone klienty zewnętrznych API (Vision, OpenAI, Whisper) dla całego procesu.
+    Klient powstaje leniwie przy pierwszym get() (uwierzytelnienie, TLS, kanał gRPC - raz),
+    potem wszystkie wątki dostają ten sam obiekt. override() podmienia klienta (np. atrapą w testach).
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Callable[[], Any]]] = None):
+        self._lock = threading.Lock()
+        self._factories: Dict[str, Callable[[], Any]] = dict(factories or {})
+        self._clients: Dict[str, Any] = {}
+        self._stats: Dict[str, ClientStats] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        with self._lock:
+            self._factories[name] = factory
+            self._clients.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    if name not in self._factories:
+                        raise KeyError(f"Unknown client: {name}")
+                    client = _Instrumented(self._factories[name](), name, self._stats_for(name))
+                    self._clients[name] = client
+                    logger.debug(f"Created {name} client")
+        return client
+
+    def override(self, name: str, client: Any):
+        """Podmienia klienta (bez zamykania poprzedniego); wywołania dalej trafiają do statystyk."""
+        with self._lock:
+            self._clients[name] = _Instrumented(client, name, self._stats_for(name))
+
+    def _stats_for(self, name: str) -> ClientStats:
+        if name not in self._stats:
+            self._stats[name] = ClientStats()
+        return self._stats[name]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats = dict(self._stats)
+        return {name: s.snapshot() for name, s in stats.items()}
+
+    def reset(self):
+        """Zapomina klienty i statystyki (testy); kolejny get() tworzy klienta od nowa."""
+        with self._lock:
+            self._clients.clear()
+            self._stats.clear()
+
+    def close(self):
+        """Zamyka pule połączeń (OpenAI: close(), Vision: transport.close())."""
+        with self._lock:
+            clients = list(self._clients.items())
+            self._clients.clear()
+        for name, client in clients:
+            target = client._target
+            closer = getattr(target, 'close', None) or getattr(getattr(target, 'transport', None), 'close', None)
+            if callable(closer):
+                try:
+                    closer()
+                except Exception as e:
+                    logger.debug(f"Closing {name} client failed: {e}")
+
+
+CLIENTS = ClientRegistry({
+    "vision": _vision_factory,
+    "openai": _openai_factory,
+    "whisper": _whisper_factory,
+})
+
+
+def vision_client():
+    return CLIENTS.get("vision")
+
+
+def openai_client():
+    return CLIENTS.get("openai")
+
+
+def whisper_client():
+    return CLIENTS.get("whisper")
@@ -0,0 +1,160 @@
+import io
+import time
+import logging
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+from config import ProjectConfig
+from utils.metrics import METRICS
+
+logger = logging.getLogger("ImagePrep")
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Analiza kadrowania na miniaturze (dłuższy bok), próg "tuszu" po autokontraście i margines wokół treści
+_ANALYSIS_SIDE = 512
+_INK_THRESHOLD = 128
+_CROP_MARGIN = 0.02
+_CROP_MIN_GAIN = 0.10 # kadrujemy tylko, gdy odpada co najmniej 10% powierzchni
+_FLAT_LEVELS = 24 # poziomy jasności przy czerni i bieli
+_FLAT_SHARE = 0.9 # udział takich pikseli w obrazie "płaskim" (render, zrzut ekranu)
+
+
+@dataclass(frozen=True)
+class PrepParams:
+    """Parametry przygotowania obrazu do OCR; key() wchodzi do klucza cache wyników OCR."""
+    enabled: bool = True
+    max_side: int = 2048
+    grayscale: bool = True
+    crop: bool = True
+    image_format: str = "auto" # auto, JPEG or PNG
+    quality: int = 85
+
+    @classmethod
+    def from_config(cls, **overrides) -> "PrepParams":
+        image_format = ProjectConfig.IMAGE_PREP_FORMAT.upper()
+        params = cls(
+            enabled=ProjectConfig.IMAGE_PREP_ENABLED,
+            max_side=ProjectConfig.IMAGE_PREP_MAX_SIDE,
+            grayscale=ProjectConfig.IMAGE_PREP_GRAYSCALE,
+            crop=ProjectConfig.IMAGE_PREP_CROP,
+            image_format="auto" if image_format == "AUTO" else image_format,
+            quality=ProjectConfig.IMAGE_PREP_QUALITY,
+        )
+        return replace(params, **overrides)
+
+    def key(self) -> str:
+        if not self.enabled:
+            return "raw"
+        return f"v1:{self.max_side}:{int(self.grayscale)}:{int(self.crop)}:{self.image_format}:{self.quality}"
+
+
+def content_bbox(image: "Image.Image") -> Optional[Tuple[int, int, int, int]]:
+    """
+    Prostokąt z tekstem (ciemne piksele po autokontraście) z marginesem, w pikselach obrazu.
+    None, gdy obraz jest jednolity albo kadrowanie niewiele by dało.
+    """
+    gray = image if image.mode == "L" else image.convert("L")
+    scale = max(gray.size) / _ANALYSIS_SIDE
+    small = gray.reduce(int(scale)) if scale >= 2 else gray
+    ink = ImageOps.autocontrast(small, cutoff=1).point(lambda p: 255 if p < _INK_THRESHOLD else 0)
+    box = ink.getbbox()
+    if box is None:
+        return None
+    sx, sy = gray.width / small.width, gray.height / small.height
+    mx, my = gray.width * _CROP_MARGIN, gray.height * _CROP_MARGIN
+    left = max(0, int(box[0] * sx - mx))
+    top = max(0, int(box[1] * sy - my))
+    right = min(gray.width, int(box[2] * sx + mx))
+    bottom = min(gray.height, int(box[3] * sy + my))
+    if (right - left) * (bottom - top) > (1 - _CROP_MIN_GAIN) * gray.width * gray.height:
+        return None
+    return left, top, right, bottom
+
+
+def preprocess(image: "Image.Image", params: PrepParams) -> "Image.Image":
+    """Orientacja z EXIF, skala szarości, kadr do treści, zmniejszenie dłuższego boku (bez powiększania)."""
+    image = ImageOps.exif_transpose(image)
+    if params.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if params.crop:
+        box = content_bbox(image)
+        if box is not None:
+            image = image.crop(box)
+    if max(image.size) > params.max_side:
+        ratio = params.max_side / max(image.size)
+        image = image.resize((max(1, round(image.width * ratio)), max(1, round(image.height * ratio))),
+                             Image.Resampling.LANCZOS)
+    return image
+
+
+def choose_format(image: "Image.Image", params: PrepParams) -> str:
+    """
+    auto: PNG dla obrazów prawie czarno-białych (zrzuty e-paragonów, strony PDF - krawędzie liter
+    bez artefaktów JPEG i zwykle mniej bajtów), JPEG dla zdjęć z szumem i półtonami.
+    """
+    if params.image_format != "auto":
+        return params.image_format
+    probe = image if image.mode == "L" else image.convert("L")
+    if max(probe.size) > _ANALYSIS_SIDE:
+        probe = probe.reduce(max(1, max(probe.size) // _ANALYSIS_SIDE))
+    histogram = probe.histogram()
+    extremes = sum(histogram[:_FLAT_LEVELS]) + sum(histogram[-_FLAT_LEVELS:])
+    return "PNG" if extremes >= _FLAT_SHARE * probe.width * probe.height else "JPEG"
+
+
+def _save(image: "Image.Image", image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format=image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def encode(image: "Image.Image", params: PrepParams) -> bytes:
+    image_format = choose_format(image, params)
+    encoded = _save(image, image_format, params.quality)
+    if params.image_format == "auto" and image_format == "PNG":
+        # Skan z szumem tła potrafi być w PNG większy niż JPEG - wysyłamy mniejszy
+        jpeg = _save(image, "JPEG", params.quality)
+        if len(jpeg) < len(encoded):
+            return jpeg
+    return encoded
+
+
+def prepare_image(content: bytes, params: Optional[PrepParams] = None) -> bytes:
+    """
+    Bajty zdjęcia/skanu -> bajty do wysłania do OCR. Gdy Pillow nie otworzy pliku (HEIC, uszkodzony)
+    albo wynik nie jest mniejszy od oryginału bez potrzeby skalowania - zwraca oryginał.
+    """
+    params = params or PrepParams.from_config()
+    if not params.enabled or not PIL_AVAILABLE:
+        return content
+    start = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            oversized = max(image.size) > params.max_side
+            prepared = encode(preprocess(image, params), params)
+    except Exception as e:
+        logger.debug(f"Image preprocessing skipped: {e}")
+        return content
+    METRICS.observe("image_prep", time.perf_counter() - start)
+    if len(prepared) >= len(content) and not oversized:
+        return content
+    return prepared
+
+
+def prepare_page(image: "Image.Image", params: Optional[PrepParams] = None) -> bytes:
+    """Wyrenderowana strona PDF -> bajty dla OCR (wyłączone przygotowanie: JPEG jak dotąd)."""
+    params = params or PrepParams.from_config()
+    if not params.enabled:
+        return encode(image, replace(params, image_format="JPEG"))
+    return encode(preprocess(image, params), params)
@@ -0,0 +1,125 @@
+import atexit
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger("BackgroundLoop")
+
+
+class BackgroundLoop:
+    """
+    Jedna długo żyjąca pętla asyncio w wątku demonie. Kod synchroniczny (CLI, watcher,
+    executor bota) zleca korutyny przez submit()/run() zamiast tworzyć pętlę na każde wywołanie.
+    """
+
+    def __init__(self, name: str = "receipt-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if not self.running:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(loop, ready), name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Zleca korutynę do pętli w tle; zwraca concurrent.futures.Future."""
+        future = submit_to_loop(self._ensure_started(), coro)
+        if future is None:
+            raise RuntimeError(f"{self.name}: event loop is not running")
+        return future
+
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """Blokuje do wyniku korutyny. Wywołanie z wątku pętli skończyłoby się zakleszczeniem."""
+        if self.running and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() called from its own loop thread - await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 5.0):
+        """Anuluje niedokończone zadania, zatrzymuje pętlę i czeka na wątek."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+
+        async def cancel_pending():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Pending tasks did not finish before shutdown: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+def submit_to_loop(loop: Optional[asyncio.AbstractEventLoop], coro: Coroutine) -> Optional[Future]:
+    """
+    Zleca korutynę do pętli z innego wątku, o ile ta pętla jeszcze działa. Zatrzymana pętla nigdy
+    nie wykonałaby zlecenia (czekający wisiałby bez końca) - wtedy None, a korutyna jest zamykana.
+    """
+    if loop is None or loop.is_closed() or not loop.is_running():
+        coro.close()
+        return None
+    try:
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+    except RuntimeError:
+        # Pętla zamknięta między sprawdzeniem a zleceniem
+        coro.close()
+        return None
+
+
+_shared: Optional[BackgroundLoop] = None
+_shared_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Wspólna pętla procesu dla wszystkich synchronicznych wywołań potoku."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = BackgroundLoop()
+        return _shared
+
+
+def shutdown_background_loop(timeout: float = 5.0):
+    with _shared_lock:
+        loop = _shared
+    if loop is not None:
+        loop.shutdown(timeout)
+
+
+atexit.register(shutdown_background_loop)
@@ -0,0 +1,160 @@
+import os
+import math
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple, Any, List
+from config import ProjectConfig
+
+logger = logging.getLogger("Metrics")
+
+QUANTILES = (0.5, 0.95, 0.99)
+LABELS = ('stage', 'shop', 'tier')
+
+
+class _NullSpan:
+    """Wyłączone metryki: jeden współdzielony obiekt, bez pomiaru czasu."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('recorder', 'key', 'sink', 'start')
+
+    def __init__(self, recorder: "LatencyRecorder", key: Tuple[str, str, str], sink: Optional[Dict[str, float]]):
+        self.recorder = recorder
+        self.key = key
+        self.sink = sink
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        self.recorder.observe_ns(self.key, elapsed)
+        if self.sink is not None:
+            stage = self.key[0]
+            self.sink[stage] = self.sink.get(stage, 0.0) + elapsed / 1e6
+        return False
+
+
+class LatencyHistogram:
+    """Licznik, suma i okno ostatnich próbek (ns) - kwantyle liczone dopiero przy odczycie."""
+    __slots__ = ('count', 'total_ns', 'samples')
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total_ns = 0
+        self.samples = deque(maxlen=window)
+
+    def add(self, value_ns: int):
+        self.count += 1
+        self.total_ns += value_ns
+        self.samples.append(value_ns)
+
+
+def quantiles(samples_ns) -> Dict[float, float]:
+    """Kwantyle (sekundy) metodą najbliższej rangi."""
+    ordered = sorted(samples_ns)
+    if not ordered:
+        return {q: 0.0 for q in QUANTILES}
+    return {q: ordered[max(0, math.ceil(q * len(ordered)) - 1)] / 1e9 for q in QUANTILES}
+
+
+class LatencyRecorder:
+    """
+    Czasy etapów potoku (perf_counter_ns) w histogramach per (etap, sklep, tier).
+    Eksport: tekst Prometheus (summary z kwantylami) i snapshot JSON.
+    """
+
+    def __init__(self, enabled: bool = None, window: int = None):
+        self.enabled = ProjectConfig.METRICS_ENABLED if enabled is None else enabled
+        self.window = window or ProjectConfig.METRICS_WINDOW
+        self._histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage: str, shop: Optional[str] = None, tier: Optional[str] = None,
+             sink: Optional[Dict[str, float]] = None):
+        """Kontekst mierzący etap; `sink` dostaje czas w ms (rozbicie dla pojedynczego paragonu)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, (stage, shop or "", tier or ""), sink)
+
+    def observe(self, stage: str, seconds: float, shop: Optional[str] = None, tier: Optional[str] = None):
+        if self.enabled:
+            self.observe_ns((stage, shop or "", tier or ""), int(seconds * 1e9))
+
+    def observe_ns(self, key: Tuple[str, str, str], value_ns: int):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.window)
+            histogram.add(value_ns)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def _copy(self) -> List[Tuple[Tuple[str, str, str], int, int, Dict[float, float]]]:
+        with self._lock:
+            items = [(key, h.count, h.total_ns, list(h.samples)) for key, h in self._histograms.items()]
+        # Sortowanie próbek poza blokadą - pomiary z innych wątków nie czekają na eksport
+        return [(key, count, total_ns, quantiles(samples)) for key, count, total_ns, samples in sorted(items)]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                **dict(zip(LABELS, key)),
+                'count': count,
+                'sum_seconds': total_ns / 1e9,
+                **{f"p{int(q * 100)}": value for q, value in values.items()},
+            }
+            for key, count, total_ns, values in self._copy()
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps({'generated_at': time.time(), 'stages': self.snapshot()}, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, name: str = "receipt_stage_seconds") -> str:
+        lines = [
+            f"# HELP {name} Receipt pipeline stage latency.",
+            f"# TYPE {name} summary",
+        ]
+        for key, count, total_ns, values in self._copy():
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(LABELS, key))
+            for q, value in values.items():
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.9f}')
+            lines.append(f"{name}_sum{{{labels}}} {total_ns / 1e9:.9f}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str = None):
+        """Zapisuje metrics.prom (dla node_exporter textfile) i metrics.json."""
+        directory = directory or str(ProjectConfig.METRICS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        for filename, payload in (("metrics.prom", self.to_prometheus()), ("metrics.json", self.to_json())):
+            path = os.path.join(directory, filename)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        logger.info(f"Exported metrics to {directory}")
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Wspólny rejestr procesu (bot, watcher, CLI)
+METRICS = LatencyRecorder()
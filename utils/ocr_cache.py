@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from config import ProjectConfig
+from utils.cache_store import SQLiteStore
+from utils.image_prep import PrepParams
+
+logger = logging.getLogger("OCRCache")
+
+# Zmiana silnika/wywołania OCR unieważnia stare wpisy
+OCR_ENGINE = "vision:text_detection"
+
+
+class PartialText(str):
+    """Tekst OCR, w którym czegoś brakuje (strona PDF z błędem OCR) - zwracany, ale nie zapisywany w cache."""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Trwały cache tekstu OCR adresowany treścią: sha256(bajty pliku) + parametry przygotowania -> tekst.
+    Ponowny batch po błędzie bazy, to samo zdjęcie z bota czy plik z archiwum nie wołają już Vision.
+    Rozmiar ograniczony w bajtach (najdawniej używane wpisy wypadają pierwsze).
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None):
+        self.path = path or str(ProjectConfig.OCR_CACHE_FILE)
+        self.store = SQLiteStore(
+            self.path,
+            max_bytes=ProjectConfig.OCR_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            table='ocr'
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def make_key(content_digest: str, *params: str) -> str:
+        digest = hashlib.sha256()
+        for part in (OCR_ENGINE, content_digest, *params):
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry.get('latency', 0.0)
+        return entry['text']
+
+    def put(self, key: str, text: str, latency: float):
+        if not text or isinstance(text, PartialText):
+            return
+        self.store.put(key, {'text': text, 'latency': latency})
+        try:
+            self.store.flush()
+        except Exception as e:
+            logger.error(f"Failed to persist OCR result: {e}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        text = self.get(key)
+        if text is not None:
+            return text
+        start = time.perf_counter()
+        text = compute()
+        self.put(key, text, time.perf_counter() - start)
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'entries': len(self.store),
+            'bytes': self.store.size_bytes(),
+        }
+
+    def close(self):
+        self.store.close()
+
+
+_cache: Optional[OCRCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """Wspólny cache procesu (leniwie); None, gdy OCR_CACHE_ENABLED=false."""
+    global _cache
+    if not ProjectConfig.OCR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = OCRCache()
+    return _cache
+
+
+def reset_ocr_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = None
+
+
+def image_key(content: bytes) -> str:
+    return OCRCache.make_key(hashlib.sha256(content).hexdigest(), "image", PrepParams.from_config().key())
+
+
+def pdf_key(path: str) -> Optional[str]:
+    """Klucz PDF: treść pliku + przygotowanie stron, DPI i warstwa tekstowa; None, gdy pliku nie da się odczytać."""
+    try:
+        digest = file_sha256(path)
+    except OSError as e:
+        logger.debug(f"Cannot hash {path}: {e}")
+        return None
+    return OCRCache.make_key(digest, "pdf", PrepParams.from_config().key(), ProjectConfig.PDF_OCR_DPI,
+                             ProjectConfig.PDF_TEXT_LAYER)
+
+
+def cached_ocr(key: Optional[str], compute: Callable[[], str]) -> str:
+    """OCR przez cache, gdy jest włączony i klucz znany (bez klucza - zawsze compute())."""
+    cache = get_ocr_cache()
+    if cache is None or key is None:
+        return compute()
+    return cache.get_or_compute(key, compute)
@@ -0,0 +1,235 @@
+import re
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from config import ProjectConfig
+from utils.metrics import METRICS
+from utils.image_prep import PrepParams, prepare_page
+from utils.ocr_cache import PartialText
+
+logger = logging.getLogger("PdfOcr")
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# OCR jednej strony: bajty obrazu -> tekst
+PageOcr = Callable[[bytes], str]
+
+_PRICE_RE = re.compile(r'\d+[.,]\d{2}\b')
+_WORD_CHAR_RE = re.compile(r'\w')
+_CID_RE = re.compile(r'\(cid:\d+\)') # glify fontu bez mapowania na Unicode
+
+
+class PdfOcrStats:
+    """Ile stron poszło z warstwy tekstowej, ile przez OCR i ile czasu OCR to oszczędziło (szacunek)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pages_text_layer = 0
+            self.pages_ocr = 0
+            self.text_layer_seconds = 0.0
+            self.ocr_seconds = 0.0
+
+    def record(self, source: str, seconds: float):
+        with self._lock:
+            if source == "text_layer":
+                self.pages_text_layer += 1
+                self.text_layer_seconds += seconds
+            else:
+                self.pages_ocr += 1
+                self.ocr_seconds += seconds
+        METRICS.observe(f"pdf_page.{source}", seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            # Średni czas strony OCR z obserwacji; zanim jakąś zobaczymy - wartość z konfiguracji
+            per_page = self.ocr_seconds / self.pages_ocr if self.pages_ocr else ProjectConfig.PDF_OCR_PAGE_SECONDS
+            saved = self.pages_text_layer * per_page - self.text_layer_seconds
+            return {
+                'pages_text_layer': self.pages_text_layer,
+                'pages_ocr': self.pages_ocr,
+                'text_layer_seconds': round(self.text_layer_seconds, 4),
+                'ocr_seconds': round(self.ocr_seconds, 4),
+                'estimated_seconds_saved': round(max(saved, 0.0), 3),
+            }
+
+
+PDF_STATS = PdfOcrStats()
+
+
+def page_count(pdf_path: str) -> int:
+    """Liczba stron bez renderowania (pypdf czyta tylko strukturę pliku; fallback: pdfinfo z popplera)."""
+    if PYPDF_AVAILABLE:
+        try:
+            return len(PdfReader(pdf_path).pages)
+        except Exception as e:
+            logger.debug(f"pypdf could not read {pdf_path}: {e}")
+    if not PDF2IMAGE_AVAILABLE:
+        raise RuntimeError("pdf2image is not installed")
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def usable_text(text: Optional[str]) -> bool:
+    """
+    Czy warstwa tekstowa strony nadaje się zamiast OCR: dość znaków słownych,
+    a przy krótkim tekście - przynajmniej jedna cena (pusta strona ze stopką to za mało).
+    Zeskanowane PDF-y i fonty bez mapowania (cid) dają pusty tekst albo same symbole.
+    """
+    text = _CID_RE.sub('', text or '')
+    if not text.strip():
+        return False
+    word_chars = len(_WORD_CHAR_RE.findall(text))
+    if word_chars < ProjectConfig.PDF_TEXT_MIN_CHARS:
+        return False
+    if word_chars / max(len(text.replace(" ", "").replace("\n", "")), 1) < 0.6:
+        return False
+    return len(_PRICE_RE.findall(text)) >= ProjectConfig.PDF_TEXT_MIN_PRICES or \
+        word_chars >= 4 * ProjectConfig.PDF_TEXT_MIN_CHARS
+
+
+def read_text_layer(pdf_path: str) -> Optional[List[Tuple[str, float]]]:
+    """(tekst, czas ekstrakcji) dla każdej strony albo None, gdy pypdf nie otworzy pliku."""
+    if not PYPDF_AVAILABLE:
+        return None
+    try:
+        reader = PdfReader(pdf_path)
+        pages = []
+        for page in reader.pages:
+            start = time.perf_counter()
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                logger.debug(f"Text layer extraction failed on a page of {pdf_path}: {e}")
+                text = ""
+            pages.append((text, time.perf_counter() - start))
+        return pages
+    except Exception as e:
+        logger.debug(f"pypdf could not read {pdf_path}: {e}")
+        return None
+
+
+def render_page(pdf_path: str, page_no: int, dpi: int = None, params: Optional[PrepParams] = None) -> bytes:
+    """Renderuje jedną stronę (numeracja od 1) i koduje ją do bajtów dla OCR (skala szarości, kadr, format)."""
+    if not PDF2IMAGE_AVAILABLE:
+        raise RuntimeError("pdf2image is not installed")
+    images = convert_from_path(pdf_path, dpi=dpi or ProjectConfig.PDF_OCR_DPI, first_page=page_no, last_page=page_no)
+    if not images:
+        return b""
+    image = images[0]
+    try:
+        return prepare_page(image, params)
+    finally:
+        image.close()
+
+
+def iter_pdf_text(pdf_path: str, ocr_page: PageOcr, dpi: int = None, workers: int = None,
+                  pages: Optional[int] = None, text_layer: bool = None) -> Iterator[Tuple[int, str]]:
+    """
+    Strumieniowy tekst PDF: (numer strony, tekst) w kolejności stron.
+    Najpierw warstwa tekstowa (pypdf) - strony z użytecznym tekstem w ogóle nie trafiają do OCR.
+    Pozostałe: każdy wątek renderuje i rozpoznaje swoją stronę (first_page = last_page), więc
+    w pamięci jest najwyżej `workers` rastrów naraz, a OCR kolejnych stron biegnie równolegle.
+    """
+    workers = max(1, workers or ProjectConfig.PDF_OCR_WORKERS)
+    use_text_layer = ProjectConfig.PDF_TEXT_LAYER if text_layer is None else text_layer
+    layer = read_text_layer(pdf_path) if use_text_layer else None
+    if layer is not None:
+        total = len(layer)
+    else:
+        total = page_count(pdf_path) if pages is None else pages
+    if total == 0:
+        return
+
+    def process(page_no: int) -> str:
+        start = time.perf_counter()
+        text = ocr_page(render_page(pdf_path, page_no, dpi))
+        PDF_STATS.record("ocr", time.perf_counter() - start)
+        return text
+
+    with ThreadPoolExecutor(max_workers=min(workers, total), thread_name_prefix="pdf-ocr") as executor:
+        # (strona, future OCR albo None, tekst z warstwy); OCR zlecamy z wyprzedzeniem najwyżej `workers` stron
+        pending = deque()
+        in_flight = 0
+        next_page = 1
+        while next_page <= total or pending:
+            while next_page <= total and in_flight < workers:
+                text, seconds = layer[next_page - 1] if layer is not None else ("", 0.0)
+                if usable_text(text):
+                    PDF_STATS.record("text_layer", seconds)
+                    pending.append((next_page, None, text.strip()))
+                else:
+                    pending.append((next_page, executor.submit(process, next_page), None))
+                    in_flight += 1
+                next_page += 1
+            page_no, future, text = pending.popleft()
+            try:
+                if future is not None:
+                    in_flight -= 1
+                    text = future.result()
+                yield page_no, text
+            except BaseException:
+                for _, other, _ in pending:
+                    if other is not None:
+                        other.cancel()
+                raise
+
+
+def ocr_pdf(pdf_path: str, ocr_page: PageOcr, dpi: int = None, workers: int = None, text_layer: bool = None) -> str:
+    """
+    Pełny tekst PDF w formacie dotychczasowej ścieżki: tekst każdej strony + nowa linia.
+    Strona, której OCR rzucił błąd, nie przerywa dokumentu: wynik jest wtedy PartialText i cache OCR
+    go nie zapisze. Pusta strona (OCR się udał, brak tekstu) to zwykły wynik. Gdy nie udała się żadna
+    strona, błąd wychodzi na zewnątrz.
+    """
+    errors = []
+
+    def guarded(content: bytes) -> str:
+        try:
+            return ocr_page(content)
+        except Exception as e:
+            errors.append(e)
+            return ""
+
+    full_text = ""
+    for page_no, text in iter_pdf_text(pdf_path, guarded, dpi, workers, text_layer=text_layer):
+        logger.debug(f"OCR page {page_no} of {pdf_path}: {len(text)} chars")
+        if text:
+            full_text += text + "\n"
+    if errors:
+        if not full_text:
+            raise errors[0]
+        logger.warning(f"OCR failed on {len(errors)} page(s) of {pdf_path} ({errors[0]}); result will not be cached")
+        return PartialText(full_text)
+    return full_text
+
+
+def vision_page_ocr(client) -> PageOcr:
+    """OCR strony przez Google Vision text_detection (klient gRPC jest bezpieczny wątkowo)."""
+    from google.cloud import vision
+
+    def ocr(content: bytes) -> str:
+        response = client.text_detection(image=vision.Image(content=content))
+        if response.error.message:
+            # Błąd Vision dla strony (limit, uszkodzony obraz) nie może udawać pustej strony
+            raise RuntimeError(f"Vision OCR error: {response.error.message}")
+        if response.text_annotations:
+            return response.text_annotations[0].description
+        return ""
+
+    return ocr
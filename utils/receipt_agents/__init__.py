@@ -1,4 +1,6 @@
-from .base import BaseReceiptAgent
+import re
+from typing import Optional
+from .base import BaseReceiptAgent, ReceiptLine
 from .biedronka import BiedronkaAgent
 from .lidl import LidlAgent
 
@@ -34,19 +36,41 @@ SHOP_AGENTS = {
     # Add other specialized agents here if needed, otherwise fallback to base
 }
 
+# Alias -> sklep oraz jedna skompilowana alternatywa ze wszystkimi aliasami.
+# Dłuższe aliasy są pierwsze, a granice słów chronią krótkie aliasy ("BP", "DINO")
+# przed dopasowaniem wewnątrz innych wyrazów.
+ALIAS_TO_SHOP = {
+    alias: canonical_name
+    for canonical_name, aliases in SHOP_MAPPINGS.items()
+    for alias in aliases
+}
+_SHOP_PATTERN = re.compile(
+    r'(?<!\w)(?:' + '|'.join(re.escape(a) for a in sorted(ALIAS_TO_SHOP, key=len, reverse=True)) + r')(?!\w)'
+)
+HEADER_LINES = 8
+UNKNOWN_SHOP = "Sklep" # wynik detect_shop, gdy żaden alias nie pasuje
+
+def _best_alias(text: str) -> Optional[str]:
+    best = None
+    for match in _SHOP_PATTERN.finditer(text):
+        # Najdłuższy (najbardziej szczegółowy) alias wygrywa, przy remisie - pierwszy w tekście
+        if best is None or len(match.group()) > len(best):
+            best = match.group()
+    return best
+
 def detect_shop(text: str) -> str:
     """
     Wykrywa sklep w tekście OCR używając mapowania.
+    Najpierw przeszukuje nagłówek paragonu, dopiero potem całą treść.
     Zwraca kanoniczną nazwę sklepu (np. 'BIEDRONKA') lub 'Sklep' jeśli nie znaleziono.
     """
-    text_upper = text.upper()
-    
-    for canonical_name, aliases in SHOP_MAPPINGS.items():
-        for alias in aliases:
-            if alias in text_upper:
-                return canonical_name
-                
-    return "Sklep"
+    header = '\n'.join(text.split('\n', HEADER_LINES)[:HEADER_LINES]).upper()
+
+    alias = _best_alias(header) or _best_alias(text.upper())
+    if alias:
+        return ALIAS_TO_SHOP[alias]
+
+    return UNKNOWN_SHOP
 
 def get_agent(shop_name: str) -> BaseReceiptAgent:
     """Fabryka agentów dla sklepów."""
@@ -1,8 +1,54 @@
 from abc import ABC, abstractmethod
 import re
-from typing import List
+from dataclasses import dataclass
+from typing import List, Optional
+
+_NUM = r'\d+(?:[.,]\d+)?'
+_PRICE = r'-?\d+[.,]\d{2}'
+_UNIT = r'(?:KG|SZT\.?|G|L|OP\.?)?'
+
+
+def parse_amount(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    return float(value.replace(',', '.'))
+
+
+@dataclass
+class ReceiptLine:
+    """Pozycja paragonu po parsowaniu gramatyką sklepu."""
+    name: str
+    raw: str
+    qty: float = 1.0
+    unit_price: Optional[float] = None
+    total: Optional[float] = None
+    vat: Optional[str] = None
+
 
 class BaseReceiptAgent(ABC):
+    # Gramatyka linii - skompilowana raz na klasę, agenci sklepów mogą ją nadpisać.
+    # "BANANY LUZ 1,2 kg * 4,00 4,80 A" / "MLEKO UHT 3.2 12,99"
+    ITEM_RE = re.compile(
+        rf'^(?P<name>.*?\S)\s+(?:(?P<qty>{_NUM})\s*{_UNIT}\s*[*xX×]\s*(?P<unit>{_PRICE})\s*=?\s+)?'
+        rf'(?P<total>{_PRICE})\s*(?P<vat>[A-G])?$',
+        re.IGNORECASE
+    )
+    # Linia z samą ilością pod nazwą produktu: "2 x 3,49 6,98 A" / "1 szt. * 3,49 = 3,49"
+    QTY_RE = re.compile(
+        rf'^(?:(?P<ptu>[A-G])\s+)?(?P<qty>{_NUM})\s*{_UNIT}\s*[*xX×]\s*(?P<unit>{_PRICE})(?:\s*=?\s*(?P<total>{_PRICE}))?\s*(?P<vat>[A-G])?$',
+        re.IGNORECASE
+    )
+    DISCOUNT_RE = re.compile(rf'^(?:RABAT|UPUST|OBNI[ZŻ]KA)\b.*?(?P<amount>{_PRICE})\s*(?P<vat>[A-G])?$', re.IGNORECASE)
+    # Linie, które nigdy nie są produktami: podsumowania, VAT, płatność, nagłówek, daty, numery terminala
+    NON_PRODUCT_RE = re.compile(
+        r'^(?:SUMA|PTU|SPRZEDA[ZŻ]|NIP|PARAGON|NIEFISKALN|KARTA|GOT[OÓ]WKA|RESZTA|ROZLICZENIE|P[LŁ]ATNO[SŚ][CĆ]'
+        r'|ZAP[LŁ]ACONO|DO ZAP[LŁ]ATY|NR\b|NUMER|TERMINAL|KASJER|KASA\b|RABAT|UPUST|UL\.|TEL\.)'
+        r'|^\d{2}-\d{3}\b' # kod pocztowy
+        r'|^(?:\d{4}-\d{2}-\d{2}|\d{2}[.-]\d{2}[.-]\d{4})\b' # data
+        r'|^[\d\s#:/.,-]+$', # same cyfry: numer terminala, godzina
+        re.IGNORECASE
+    )
+
     def __init__(self, shop_name: str = "Base"):
         self.shop_name = shop_name
 
@@ -11,6 +57,76 @@ class BaseReceiptAgent(ABC):
         """Czyszczenie specyficzne dla sklepu."""
         pass
 
+    def parse_lines(self, text: str) -> List[ReceiptLine]:
+        """
+        Jednoprzebiegowy parser oczyszczonego OCR na pozycje (nazwa, ilość, cena, suma, VAT).
+        Skleja nazwę z linią ilości pod spodem, a rabaty odejmuje od poprzedniej pozycji.
+        """
+        records: List[ReceiptLine] = []
+        pending: Optional[ReceiptLine] = None # sama nazwa, czeka na linię z ilością
+
+        for raw in text.split('\n'):
+            line = raw.strip()
+            if not line:
+                continue
+
+            match = self.DISCOUNT_RE.match(line)
+            if match:
+                target = pending or (records[-1] if records else None)
+                if target is not None and target.total is not None:
+                    target.total = round(target.total - abs(parse_amount(match.group('amount'))), 2)
+                continue
+
+            match = self.QTY_RE.match(line)
+            if match:
+                qty, unit = parse_amount(match.group('qty')), parse_amount(match.group('unit'))
+                total = parse_amount(match.group('total'))
+                target = pending
+                if target is None and records and records[-1].unit_price is None:
+                    # Lidl: "Mleko 6,98 A" a pod spodem "2 x 3,49"
+                    target = records.pop()
+                if target is not None:
+                    target.qty, target.unit_price = qty, unit
+                    target.total = total if total is not None else (target.total or round(qty * unit, 2))
+                    target.vat = self._vat(match) or target.vat
+                    target.raw = f"{target.raw} {line}"
+                    records.append(target)
+                    pending = None
+                    continue
+
+            if pending is not None:
+                records.append(pending)
+                pending = None
+
+            match = self.ITEM_RE.match(line)
+            if match:
+                total = parse_amount(match.group('total'))
+                qty = parse_amount(match.group('qty'))
+                records.append(ReceiptLine(
+                    name=match.group('name'),
+                    raw=line,
+                    qty=qty if qty is not None else 1.0,
+                    unit_price=parse_amount(match.group('unit')) if qty is not None else None,
+                    total=total,
+                    vat=self._vat(match),
+                ))
+            else:
+                pending = ReceiptLine(name=line, raw=line)
+
+        if pending is not None:
+            records.append(pending)
+        return records
+
+    @staticmethod
+    def _vat(match: re.Match) -> Optional[str]:
+        # Część sklepów drukuje stawkę PTU przed ilością (grupa "ptu"), reszta po cenie
+        groups = match.groupdict()
+        vat = groups.get('vat') or groups.get('ptu')
+        return vat.upper() if vat else None
+
+    def is_non_product(self, line: str) -> bool:
+        return self.NON_PRODUCT_RE.match(line) is not None
+
     def detect_dates(self, text: str) -> List[str]:
         # Common date formats: YYYY-MM-DD, DD-MM-YYYY, DD.MM.YYYY
         patterns = [
@@ -1,7 +1,15 @@
-from .base import BaseReceiptAgent
+from .base import BaseReceiptAgent, _NUM, _PRICE, _UNIT
 import re
 
 class BiedronkaAgent(BaseReceiptAgent):
+    # Biedronka drukuje stawkę PTU przed ilością: "MLEKO UHT 3,2% 1L C 2 x3,19 6,38C"
+    ITEM_RE = re.compile(
+        rf'^(?P<name>.*?\S)\s+(?:(?:(?P<ptu>[A-G])\s+)?(?P<qty>{_NUM})\s*{_UNIT}\s*[*xX×]\s*(?P<unit>{_PRICE})\s*=?\s+)?'
+        rf'(?P<total>{_PRICE})\s*(?P<vat>[A-G])?$',
+        re.IGNORECASE
+    )
+    DISCOUNT_RE = re.compile(rf'^(?:RABAT|UPUST|OBNI[ZŻ]KA|PROMOCJA)\b.*?(?P<amount>{_PRICE})\s*(?P<vat>[A-G])?$', re.IGNORECASE)
+
     def __init__(self):
         super().__init__("Biedronka")
 
@@ -1,6 +1,14 @@
-from .base import BaseReceiptAgent
+import re
+from .base import BaseReceiptAgent, _PRICE
 
 class LidlAgent(BaseReceiptAgent):
+    # Lidl: ilość pod pozycją ("Mleko 6,98 A" / "2 x 3,49"), rabaty jako osobne linie kuponów
+    DISCOUNT_RE = re.compile(rf'^(?:RABAT|UPUST|KUPON|PROMOCJA|OBNI[ZŻ]KA)\b.*?(?P<amount>{_PRICE})\s*(?P<vat>[A-G])?$', re.IGNORECASE)
+    NON_PRODUCT_RE = re.compile(
+        BaseReceiptAgent.NON_PRODUCT_RE.pattern + r'|^(?:KUPON|LIDL PLUS|ZAOSZCZ[EĘ]DZI)',
+        re.IGNORECASE
+    )
+
     def __init__(self):
         super().__init__("Lidl")
 
@@ -1,12 +1,99 @@
 import json
 import os
+import re
+import time
+import random
 import logging
-from typing import Optional, Dict, Any
+import sqlite3
+import unicodedata
+from typing import Optional, Dict, Any, Iterable, List, Set, Tuple
 from dataclasses import dataclass, asdict
+from rapidfuzz import fuzz
 from config import ProjectConfig
+from utils.cache_store import create_store
 
 logger = logging.getLogger("ReceiptCache")
 
+# Klucze pochodne (kanoniczne) odróżniamy od surowych linii OCR separatorem "~",
+# którego normalizator nigdy nie zostawia w treści klucza.
+KEY_SEP = "~"
+# Wyuczone linie nie-produktów: "!BIEDRONKA~NR WYDRUKU #" (cyfry zamaskowane, bo numery się zmieniają)
+NEGATIVE_PREFIX = "!"
+
+# "1,2 KG * 4,00", "2 x 3,49", "3 SZT X 1,99"
+_QTY_RE = re.compile(r'\b\d+(?:[.,]\d+)?\s*(?:KG|G|L|SZT|OP)?\.?\s*[*X]\s*\d+[.,]\d{2}\b')
+# Ceny (zawsze 2 miejsca po przecinku), opcjonalnie z literą stawki VAT: "12,99", "4,80 A", "3,50C"
+_PRICE_RE = re.compile(r'(?<![\d.,])-?\d+[.,]\d{2}(?:\s?[A-G])?(?![\w.,])')
+_DECIMAL_COMMA_RE = re.compile(r'(\d),(\d)')
+_NOISE_RE = re.compile(r'[^A-Z0-9.%/ ]+')
+_SPACES_RE = re.compile(r'\s+')
+_DIGITS_RE = re.compile(r'\d+')
+_AMOUNT_RE = re.compile(r'(\d+[.,]\d{2})')
+_POLISH_FOLD = str.maketrans({'Ł': 'L', 'ł': 'l'})
+
+
+def canonicalize_line(line: str) -> str:
+    """
+    Normalizuje linię paragonu do klucza niezależnego od ceny i ilości.
+    'BANANY LUZ 1,2 kg * 4,00 4,80' -> 'BANANY LUZ'
+    """
+    text = unicodedata.normalize('NFKD', line.translate(_POLISH_FOLD))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).upper()
+    text = _QTY_RE.sub(' ', text)
+    text = _PRICE_RE.sub(' ', text)
+    text = _DECIMAL_COMMA_RE.sub(r'\1.\2', text)
+    text = _NOISE_RE.sub(' ', text)
+    text = _SPACES_RE.sub(' ', text)
+    return text.strip(' .,/-')
+
+
+def line_prices(line: str) -> Set[float]:
+    """Kwoty z linii OCR: 'BANANY 1,2 kg * 4,00 4,80' -> {4.0, 4.8}."""
+    return {round(float(p.replace(',', '.')), 2) for p in _AMOUNT_RE.findall(line)}
+
+
+def item_prices(item: Dict) -> Set[float]:
+    """Kwoty pozycji z odpowiedzi AI (suma i cena jednostkowa)."""
+    prices = set()
+    for field_name in ('suma', 'cena_jedn'):
+        try:
+            prices.add(round(float(item.get(field_name)), 2))
+        except (TypeError, ValueError):
+            pass
+    return prices
+
+
+def align_items(items: List[Dict], lines: List[str], min_similarity: int) -> List[Tuple[str, Dict, float]]:
+    """
+    Zachłanne parowanie pozycji ({'nazwa', 'suma', 'cena_jedn'}) z liniami OCR:
+    zgodna cena + podobna nazwa, każda linia i pozycja najwyżej raz.
+    Zwraca (linia, pozycja, podobieństwo) od najlepiej dopasowanych.
+    """
+    prices_by_line = {line: line_prices(line) for line in lines}
+    pairs = []
+    for item in items:
+        name = item.get('nazwa')
+        if not name:
+            continue
+        prices = item_prices(item)
+        folded_name = canonicalize_line(name)
+        for line in lines:
+            if not prices & prices_by_line[line]:
+                continue
+            similarity = fuzz.WRatio(folded_name, canonicalize_line(line))
+            if similarity >= min_similarity:
+                pairs.append((similarity, line, item))
+
+    aligned, used_lines, used_items = [], set(), set()
+    for similarity, line, item in sorted(pairs, key=lambda p: p[0], reverse=True):
+        if line in used_lines or id(item) in used_items:
+            continue
+        used_lines.add(line)
+        used_items.add(id(item))
+        aligned.append((line, item, similarity))
+    return aligned
+
+
 @dataclass
 class ProductMatch:
     name: str
@@ -16,43 +103,193 @@ class ProductMatch:
     source: str
 
 class ReceiptCache:
-    def __init__(self, cache_file: str = None):
+    """
+    Cache linii paragonów z wyszukiwaniem warstwowym:
+    1. exact     - pełna linia OCR (wraz z ceną)
+    2. shop      - kanoniczna linia w obrębie sklepu ("BIEDRONKA~MLEKO UHT 3.2")
+    3. canonical - kanoniczna linia globalnie ("~MLEKO UHT 3.2")
+
+    Dane trzyma wymienny CacheStore (domyślnie SQLite/WAL, współdzielony przez
+    bota, watchera i CLI). Stary receipt_cache.json jest importowany przy pierwszym starcie.
+    """
+
+    TIERS = ('exact', 'shop', 'canonical')
+
+    def __init__(self, cache_file: str = None, backend: str = None,
+                 max_entries: int = None, eviction: str = None):
         self.cache_file = cache_file or str(ProjectConfig.CACHE_FILE)
-        self.cache: Dict[str, Any] = {}
+        self.backend = backend or ProjectConfig.CACHE_BACKEND
+        self.max_entries = ProjectConfig.CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.eviction = eviction or ProjectConfig.CACHE_EVICTION
+        self.stats: Dict[str, int] = {tier: 0 for tier in self.TIERS}
+        self.stats['miss'] = 0
+        self.negative_hits = 0
+        self.negative_rechecks = 0
+        self._rng = random.Random()
         self._load()
 
     def _load(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-                logger.info(f"Loaded {len(self.cache)} items from cache")
-            except Exception as e:
-                logger.error(f"Failed to load cache: {e}")
-                self.cache = {}
-        else:
-            self.cache = {}
+        try:
+            if self.backend == 'sqlite':
+                db_file = os.path.splitext(self.cache_file)[0] + '.db'
+                self.store = create_store('sqlite', db_file, self.max_entries, self.eviction)
+                if len(self.store) == 0 and os.path.exists(self.cache_file):
+                    self._import_json(self.cache_file)
+            else:
+                self.store = create_store(self.backend, self.cache_file, self.max_entries, self.eviction)
+                legacy = dict(self.store.items())
+                derived = self._migrate(legacy)
+                if derived:
+                    self.store.put_many(derived)
+            logger.info(f"Loaded {len(self.store)} items from cache ({self.backend})")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open cache database, falling back to JSON: {e}")
+            self.backend = 'json'
+            self._load()
+
+    def _import_json(self, path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to import {path}: {e}")
+            return
+        self.store.put_many(legacy)
+        self.store.put_many(self._migrate(legacy))
+        self.store.flush()
+        logger.info(f"Imported {len(legacy)} entries from {path}")
+
+    @classmethod
+    def _migrate(cls, entries: Dict[str, Any]) -> Dict[str, Any]:
+        """Wylicza brakujące klucze kanoniczne dla starych plików (tylko pełne linie OCR)."""
+        derived = {}
+        for key, data in entries.items():
+            if KEY_SEP in key:
+                continue
+            canonical = canonicalize_line(key)
+            canonical_key = cls._canonical_key(canonical)
+            if canonical and canonical_key not in entries and canonical_key not in derived:
+                derived[canonical_key] = data
+        if derived:
+            logger.info(f"Migrated cache: added {len(derived)} canonical keys")
+        return derived
+
+    @staticmethod
+    def _canonical_key(canonical: str, shop: Optional[str] = None) -> str:
+        return f"{shop.upper() if shop else ''}{KEY_SEP}{canonical}"
 
     def lookup(self, line: str, shop: Optional[str] = None) -> Optional[ProductMatch]:
         # Normalize key
         key = line.strip().upper()
-        
+
         # Try exact match
-        if key in self.cache:
-            data = self.cache[key]
+        data = self.store.get(key)
+        if data:
+            self.stats['exact'] += 1
             return ProductMatch(**data)
-            
+
+        canonical = canonicalize_line(line)
+        if canonical:
+            if shop:
+                data = self.store.get(self._canonical_key(canonical, shop))
+                if data:
+                    self.stats['shop'] += 1
+                    return ProductMatch(**data)
+
+            data = self.store.get(self._canonical_key(canonical))
+            if data:
+                self.stats['canonical'] += 1
+                return ProductMatch(**data)
+
+        self.stats['miss'] += 1
         return None
 
     def update(self, line: str, match: ProductMatch, shop: Optional[str] = None):
         key = line.strip().upper()
-        self.cache[key] = asdict(match)
+        data = asdict(match)
+        self.store.put(key, data)
+
+        # Linia okazała się produktem - kasujemy licznik odrzuceń
+        negative_key = self._negative_key(line, shop)
+        if negative_key and self.store.get(negative_key, touch=False):
+            self.store.put(negative_key, {'misses': 0})
+
+        canonical = canonicalize_line(line)
+        if canonical:
+            if shop:
+                self.store.put(self._canonical_key(canonical, shop), data)
+            # Globalny klucz nie nadpisuje wcześniejszego dopasowania z innego sklepu
+            self.store.setdefault(self._canonical_key(canonical), data)
+
+    def bulk_load(self, entries: Iterable[Tuple[str, ProductMatch, Optional[str]]], overwrite: bool = False) -> int:
+        """
+        Hurtowy zapis kluczy kanonicznych (kanoniczna linia, dopasowanie, sklep) jednym put_many.
+        Bez `overwrite` istniejące wpisy (z fuzzy/AI/taksonomii) mają pierwszeństwo.
+        Zwraca liczbę zapisanych kluczy.
+        """
+        batch: Dict[str, Dict[str, Any]] = {}
+        for canonical, match, shop in entries:
+            if not canonical:
+                continue
+            data = asdict(match)
+            candidates = [(self._canonical_key(canonical, shop), overwrite)] if shop else []
+            # Globalny klucz jak w update(): nie nadpisuje dopasowania z innego sklepu
+            candidates.append((self._canonical_key(canonical), False))
+            for key, replace in candidates:
+                if key not in batch and (replace or self.store.get(key, touch=False) is None):
+                    batch[key] = data
+        if batch:
+            self.store.put_many(batch)
+        return len(batch)
+
+    @classmethod
+    def _negative_key(cls, line: str, shop: Optional[str] = None) -> Optional[str]:
+        canonical = _DIGITS_RE.sub('#', canonicalize_line(line))
+        return f"{NEGATIVE_PREFIX}{cls._canonical_key(canonical, shop)}" if canonical else None
+
+    def is_non_product(self, line: str, shop: Optional[str] = None) -> bool:
+        """
+        Linia wielokrotnie odrzucona przez AI (brak produktu) - nie warto jej dopasowywać.
+        Wpis wygasa po NEGATIVE_CACHE_TTL, a część trafień (NEGATIVE_CACHE_RECHECK) i tak idzie
+        do fuzzy/AI - błędnie wyuczony wpis zostanie skasowany, gdy linia okaże się produktem.
+        """
+        key = self._negative_key(line, shop)
+        data = self.store.get(key) if key else None
+        if not data or data['misses'] < ProjectConfig.NEGATIVE_CACHE_MIN_MISSES or self._negative_expired(data):
+            return False
+        if self._rng.random() < ProjectConfig.NEGATIVE_CACHE_RECHECK:
+            self.negative_rechecks += 1
+            return False
+        self.negative_hits += 1
+        return True
+
+    def record_non_product(self, line: str, shop: Optional[str] = None):
+        key = self._negative_key(line, shop)
+        if key:
+            data = self.store.get(key, touch=False)
+            misses = 0 if not data or self._negative_expired(data) else data['misses']
+            self.store.put(key, {'misses': misses + 1, 'updated': time.time()})
+
+    @staticmethod
+    def _negative_expired(data: Dict[str, Any]) -> bool:
+        # Wpisy sprzed wprowadzenia TTL (bez 'updated') traktujemy jak wygasłe
+        ttl = ProjectConfig.NEGATIVE_CACHE_TTL
+        return bool(ttl) and time.time() - data.get('updated', 0) > ttl
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (total - self.stats['miss']) / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self.store)
 
     def save(self):
         try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, indent=2, ensure_ascii=False)
+            self.store.flush()
             logger.info("Cache saved")
         except Exception as e:
             logger.error(f"Failed to save cache: {e}")
+
+    def close(self):
+        self.save()
+        self.store.close()
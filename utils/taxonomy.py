@@ -1,35 +1,341 @@
+import os
+import sys
 import json
+import heapq
+import bisect
+import hashlib
 import logging
-from typing import List, Dict, Optional
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Iterable
+from config import ProjectConfig
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
 logger = logging.getLogger("TaxonomyGuard")
 
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Odwrócony indeks trigramów znakowych: trigram -> array('I') z id wzorców.
+    Zwraca top-K kandydatów, które potem ocenia rapidfuzz (zamiast skanu całej taksonomii).
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns: List[Optional[str]] = [sys.intern(p) for p in patterns]
+        self.ids: Dict[str, int] = {p: pid for pid, p in enumerate(self.patterns)}
+        self.removed = 0 # usunięte wzorce zostają jako None (id się nie przesuwają)
+        self.sizes = array('I')
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for pid, pattern in enumerate(self.patterns):
+            grams = trigrams(pattern)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(pid)
+        self.postings: Dict[str, array] = {sys.intern(g): array('I', ids) for g, ids in postings.items()}
+        self._np_sizes = np.frombuffer(self.sizes, dtype=np.uint32) if NUMPY_AVAILABLE and self.patterns else None
+
+    def with_changes(self, added: Iterable[str], removed: Iterable[str]) -> "TrigramIndex":
+        """
+        Nowy indeks po zmianach (copy-on-write): niezmienione postingi są współdzielone,
+        kopiowane są tylko listy trigramów dotkniętych zmianą. Stary indeks pozostaje nienaruszony.
+        """
+        new = TrigramIndex.__new__(TrigramIndex)
+        new.patterns = list(self.patterns)
+        new.ids = dict(self.ids)
+        new.removed = self.removed
+        new.sizes = array('I', self.sizes)
+        new.postings = dict(self.postings)
+
+        # Usuwane id grupujemy per trigram - każda (często długa) lista postingów filtrowana raz
+        dropped: Dict[str, set] = defaultdict(set)
+        for pattern in removed:
+            pid = new.ids.pop(pattern, None)
+            if pid is None:
+                continue
+            for gram in trigrams(pattern):
+                dropped[gram].add(pid)
+            new.patterns[pid] = None
+            new.removed += 1
+        for gram, pids in dropped.items():
+            ids = new.postings.get(gram)
+            if ids is None:
+                continue
+            if NUMPY_AVAILABLE:
+                current = np.frombuffer(ids, dtype=np.uint32)
+                kept = array('I', current[~np.isin(current, np.fromiter(pids, dtype=np.uint32))].tobytes())
+            else:
+                kept = array('I', (i for i in ids if i not in pids))
+            if kept:
+                new.postings[gram] = kept
+            else:
+                del new.postings[gram]
+
+        for pattern in added:
+            pattern = sys.intern(pattern)
+            if pattern in new.ids:
+                continue
+            pid = len(new.patterns)
+            new.patterns.append(pattern)
+            new.ids[pattern] = pid
+            grams = trigrams(pattern)
+            new.sizes.append(len(grams))
+            for gram in grams:
+                ids = new.postings.get(gram)
+                if ids is not None:
+                    new.postings[gram] = ids + array('I', (pid,))
+                else:
+                    new.postings[sys.intern(gram)] = array('I', (pid,))
+
+        new._np_sizes = np.frombuffer(new.sizes, dtype=np.uint32) if NUMPY_AVAILABLE and new.patterns else None
+        return new
+
+    def candidates(self, query: str, k: int) -> List[str]:
+        hits = [ids for ids in map(self.postings.get, trigrams(query.upper())) if ids is not None]
+        if not hits:
+            return []
+        if self._np_sizes is not None:
+            return self._candidates_numpy(hits, k)
+
+        counts = Counter()
+        for ids in hits:
+            counts.update(ids)
+        if not counts:
+            return []
+        sizes = self.sizes
+        # Odsetek trigramów wzorca obecnych w linii ~ partial_ratio (wzorzec jako fragment linii)
+        best = heapq.nlargest(k, counts.items(), key=lambda item: (item[1] / sizes[item[0]], item[1]))
+        return [self.patterns[pid] for pid, _ in best]
+
+    def _candidates_numpy(self, hits: List[array], k: int) -> List[str]:
+        # Postingi to bufory array('I') - np.frombuffer nie kopiuje danych
+        ids = np.concatenate([np.frombuffer(h, dtype=np.uint32) for h in hits])
+        counts = np.bincount(ids, minlength=len(self.patterns))
+        scores = counts / self._np_sizes + counts * 1e-6
+        if k < len(scores):
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[counts[top] > 0]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self.patterns[pid] for pid in top.tolist()]
+
+    def __len__(self) -> int:
+        return len(self.patterns) - self.removed
+
+
+class TaxonomySnapshot:
+    """Niezmienny stan taksonomii; TaxonomyGuard podmienia go w całości jednym przypisaniem."""
+    __slots__ = ('ocr_map', 'ocr_patterns', 'index')
+
+    def __init__(self, ocr_map: Dict[str, Dict], ocr_patterns: List[str], index: Optional[TrigramIndex]):
+        self.ocr_map = ocr_map
+        self.ocr_patterns = ocr_patterns
+        self.index = index
+
+
+def _by_length_desc(pattern: str) -> int:
+    return -len(pattern)
+
+
 class TaxonomyGuard:
-    def __init__(self, taxonomy_path: str):
+    """
+    Taksonomia produktów z indeksem trigramów. W trybie `watch` wątek w tle śledzi mtime/hash
+    pliku i nakłada różnice przyrostowo; czytelnicy zawsze widzą kompletny snapshot.
+    """
+
+    # Przy takim odsetku usuniętych wzorców indeks jest budowany od zera (kompaktowanie)
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, taxonomy_path: str, index_min_patterns: int = None, top_k: int = None, watch: bool = None):
         self.taxonomy_path = taxonomy_path
-        self.ocr_map: Dict[str, Dict] = {}
-        self.ocr_patterns: List[str] = []
+        self.index_min_patterns = ProjectConfig.TAXONOMY_INDEX_MIN_PATTERNS if index_min_patterns is None else index_min_patterns
+        self.top_k = top_k or ProjectConfig.TAXONOMY_INDEX_TOP_K
+        self._snapshot = TaxonomySnapshot({}, [], None)
+        self._file_state = None # (mtime_ns, size)
+        self._digest = None
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reloads = {'full': 0, 'incremental': 0, 'failed': 0}
         self._load_taxonomy()
+        if ProjectConfig.TAXONOMY_WATCH if watch is None else watch:
+            self.start_watching()
+
+    # Czytelnicy biorą atrybuty z bieżącego snapshotu (jedno odczytanie referencji)
+    @property
+    def ocr_map(self) -> Dict[str, Dict]:
+        return self._snapshot.ocr_map
+
+    @property
+    def ocr_patterns(self) -> List[str]:
+        return self._snapshot.ocr_patterns
+
+    @property
+    def index(self) -> Optional[TrigramIndex]:
+        return self._snapshot.index
+
+    def _read_mappings(self):
+        with open(self.taxonomy_path, 'rb') as f:
+            raw = f.read()
+        mappings = {}
+        for item in json.loads(raw).get('mappings', []):
+            mappings[sys.intern(item['ocr'].upper())] = item
+        return hashlib.sha256(raw).hexdigest(), mappings
+
+    def _stat(self):
+        st = os.stat(self.taxonomy_path)
+        return st.st_mtime_ns, st.st_size
 
     def _load_taxonomy(self):
         try:
-            with open(self.taxonomy_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                mappings = data.get('mappings', [])
-                
-                # Sort by length of OCR pattern descending to match longest execution first
-                mappings.sort(key=lambda x: len(x['ocr']), reverse=True)
-                
-                for item in mappings:
-                    ocr_key = item['ocr'].upper()
-                    self.ocr_map[ocr_key] = item
-                    self.ocr_patterns.append(ocr_key)
-                    
-            logger.info(f"Loaded {len(self.ocr_patterns)} taxonomy patterns")
+            file_state = self._stat()
+            digest, mappings = self._read_mappings()
+            self._snapshot = self._build(mappings)
+            self._file_state, self._digest = file_state, digest
+            logger.info(f"Loaded {len(self.ocr_patterns)} taxonomy patterns ({len(self.index.postings)} trigrams)")
         except Exception as e:
             logger.error(f"Failed to load taxonomy from {self.taxonomy_path}: {e}")
-            self.ocr_map = {}
-            self.ocr_patterns = []
+            self._snapshot = TaxonomySnapshot({}, [], None)
+
+    @staticmethod
+    def _build(mappings: Dict[str, Dict]) -> TaxonomySnapshot:
+        # Sort by length of OCR pattern descending to match longest execution first
+        patterns = sorted(mappings, key=_by_length_desc)
+        return TaxonomySnapshot(dict(mappings), patterns, TrigramIndex(patterns))
+
+    def reload_if_changed(self) -> bool:
+        """Sprawdza mtime/rozmiar, potem SHA-256 pliku; zmiany nakłada przyrostowo. Zwraca True po podmianie."""
+        with self._reload_lock:
+            try:
+                file_state = self._stat()
+                if file_state == self._file_state:
+                    return False
+                digest, mappings = self._read_mappings()
+            except Exception as e:
+                # Np. plik zapisywany właśnie przez edytor - zostaje stary snapshot, ponowimy przy kolejnym sprawdzeniu
+                self.reloads['failed'] += 1
+                logger.warning(f"Taxonomy reload skipped: {e}")
+                return False
+            self._file_state = file_state
+            if digest == self._digest:
+                return False
+            self._snapshot = self._apply_diff(self._snapshot, mappings)
+            self._digest = digest
+            return True
+
+    def _apply_diff(self, old: TaxonomySnapshot, mappings: Dict[str, Dict]) -> TaxonomySnapshot:
+        removed = [key for key in old.ocr_map if key not in mappings]
+        added = [key for key in mappings if key not in old.ocr_map]
+        changed = [key for key in mappings if key in old.ocr_map and mappings[key] != old.ocr_map[key]]
+
+        index = old.index
+        if index is None or (index.removed + len(removed)) > self.COMPACT_RATIO * max(len(mappings), 1):
+            self.reloads['full'] += 1
+            logger.info(f"Taxonomy rebuilt: {len(mappings)} patterns")
+            return self._build(mappings)
+
+        ocr_map = dict(old.ocr_map)
+        for key in removed:
+            del ocr_map[key]
+        for key in added + changed:
+            ocr_map[key] = mappings[key]
+
+        patterns = old.ocr_patterns
+        if removed or added:
+            gone = set(removed)
+            patterns = [p for p in patterns if p not in gone] if gone else list(patterns)
+            for key in added:
+                bisect.insort(patterns, key, key=_by_length_desc)
+            index = index.with_changes(added, removed)
+
+        self.reloads['incremental'] += 1
+        logger.info(f"Taxonomy updated: +{len(added)} -{len(removed)} ~{len(changed)}")
+        return TaxonomySnapshot(ocr_map, patterns, index)
+
+    def start_watching(self, interval: float = None):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        interval = interval or ProjectConfig.TAXONOMY_WATCH_INTERVAL
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=loop, name="taxonomy-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def candidates(self, ocr_text: str) -> List[str]:
+        """Wzorce warte oceny dla linii: cała taksonomia gdy jest mała, inaczej top-K z indeksu."""
+        snapshot = self._snapshot
+        if snapshot.index is None or len(snapshot.ocr_patterns) < self.index_min_patterns:
+            return snapshot.ocr_patterns
+        return snapshot.index.candidates(ocr_text, self.top_k)
 
     def get_metadata(self, ocr_text: str) -> Optional[Dict]:
-        return self.ocr_map.get(ocr_text.upper())
+        return self._snapshot.ocr_map.get(ocr_text.upper())
+
+
+class StagingTaxonomy:
+    """
+    Poczekalnia mapowań wyuczonych z odpowiedzi AI (format jak product_taxonomy.json).
+    Wpisy z licznikiem `seen` czekają na ręczne przeniesienie do głównej taksonomii.
+    """
+
+    def __init__(self, staging_path: str = None):
+        self.staging_path = staging_path or str(ProjectConfig.TAXONOMY_STAGING_PATH)
+        self.mappings: Dict[str, Dict] = {}
+        self.dirty = False
+        try:
+            with open(self.staging_path, 'r', encoding='utf-8') as f:
+                for item in json.load(f).get('mappings', []):
+                    self.mappings[item['ocr'].upper()] = item
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to load staging taxonomy {self.staging_path}: {e}")
+
+    def add(self, ocr: str, name: str, category: str, unit: str, confidence: float,
+            source: str = "ai", seen: int = 1):
+        key = ocr.upper()
+        entry = self.mappings.get(key)
+        if entry and entry['name'] == name:
+            entry['seen'] += seen
+            entry['confidence'] = max(entry['confidence'], round(confidence, 3))
+        else:
+            self.mappings[key] = {
+                'ocr': key, 'name': name, 'cat': category, 'unit': unit,
+                'source': source, 'seen': seen, 'confidence': round(confidence, 3),
+            }
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            ranked = sorted(self.mappings.values(), key=lambda m: m['seen'], reverse=True)
+            os.makedirs(os.path.dirname(self.staging_path) or '.', exist_ok=True)
+            tmp_path = f"{self.staging_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'mappings': ranked}, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.staging_path)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save staging taxonomy: {e}")
@@ -3,6 +3,7 @@ import shutil
 # import ollama
 from dotenv import load_dotenv
 from datetime import datetime
+from utils.clients import openai_client
 
 load_dotenv()
 
@@ -58,8 +59,7 @@ def process_note(file_path):
     """
     
     # Używamy OpenAI (GPT-4o-mini) zamiast Ollamy
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = openai_client()
     
     response = client.chat.completions.create(
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),